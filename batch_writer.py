@@ -0,0 +1,114 @@
+"""
+Фоновая запись пачками: вызывающий поток только ставит элемент в очередь,
+отдельный поток собирает пачки и передаёт их в write_batch.
+Используется логом запросов (log_requests) и телеметрией (telemetry).
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+log = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """
+    Очередь с фоновым потоком-писателем. Поток запускается при первом put();
+    пачка — всё, что накопилось в очереди (не больше batch_size элементов).
+    Ошибки write_batch логируются, элементы пачки считаются записанными.
+    """
+
+    def __init__(
+        self,
+        write_batch: Callable[[list], None],
+        name: str,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        on_stop: Optional[Callable[[], None]] = None
+    ):
+        self.write_batch = write_batch
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Вызывается в потоке-писателе при его завершении (например, закрыть соединение с БД)
+        self.on_stop = on_stop
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._flushed = threading.Condition()
+        self._enqueued = 0
+        self._written = 0
+
+    def put(self, item) -> None:
+        """Ставит элемент в очередь на запись (не блокирует вызывающий поток)."""
+        self._ensure_thread()
+        with self._flushed:
+            self._enqueued += 1
+        self._queue.put(item)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _loop(self) -> None:
+        running = True
+        try:
+            while running:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                batch = []
+                if first is None:
+                    running = False
+                else:
+                    batch.append(first)
+                while running and len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        running = False
+                        break
+                    batch.append(item)
+                if batch:
+                    try:
+                        self.write_batch(batch)
+                    except Exception:
+                        log.exception("Ошибка фоновой записи (%s)", self.name)
+                with self._flushed:
+                    self._written += len(batch)
+                    self._flushed.notify_all()
+        finally:
+            if self.on_stop is not None:
+                self.on_stop()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Ждёт, пока все поставленные в очередь элементы будут записаны. False — не дождались."""
+        if self._thread is None:
+            return True
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            target = self._enqueued
+            while self._written < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._flushed.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Дописывает очередь и останавливает фоновый поток (вызывается при выходе)."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
@@ -5,6 +5,6 @@ $version = (python -c "from version import __version__; print(__version__)").Tri
 $name = "ChatList-$version"
 
 pip install pyinstaller --quiet
-python -m PyInstaller --onefile --windowed --name $name main.py
+python -m PyInstaller --onefile --windowed --hidden-import h2 --name $name main.py
 Write-Host ""
 Write-Host ("Ready: dist\" + $name + ".exe") -ForegroundColor Green
@@ -0,0 +1,179 @@
+"""Автомат-предохранитель (circuit breaker) и статистика здоровья эндпоинтов моделей."""
+
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+# Состояния эндпоинта
+STATE_CLOSED = "closed"        # работает, запросы идут
+STATE_OPEN = "open"            # отключён: запросы сразу завершаются ошибкой
+STATE_HALF_OPEN = "half_open"  # после паузы пропускается один пробный запрос
+
+# Сколько последних запросов учитывать
+WINDOW_SIZE = 20
+
+# Минимум запросов в окне, чтобы судить о доле ошибок
+MIN_CALLS = 4
+
+# Доля ошибок в окне, при которой эндпоинт отключается
+FAILURE_RATE_THRESHOLD = 0.5
+
+# Столько ошибок подряд отключают эндпоинт независимо от доли
+CONSECUTIVE_FAILURES_THRESHOLD = 3
+
+# Пауза перед пробным запросом, секунды
+COOLDOWN = 30.0
+
+
+class EndpointHealth:
+    """Состояние и статистика одного эндпоинта (api_url + name модели)."""
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.outcomes: deque = deque(maxlen=WINDOW_SIZE)   # True — успех, False — ошибка
+        self.latencies: deque = deque(maxlen=WINDOW_SIZE)  # время успешных ответов, секунды
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.last_error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+_endpoints: dict[str, EndpointHealth] = {}
+_lock = threading.Lock()
+
+
+def endpoint_key(model: dict) -> str:
+    """Ключ эндпоинта: URL API и название модели у провайдера."""
+    return f"{model.get('api_url', '')}#{model.get('name', '')}"
+
+
+def _get(model: dict) -> EndpointHealth:
+    key = endpoint_key(model)
+    with _lock:
+        health = _endpoints.get(key)
+        if health is None:
+            health = EndpointHealth()
+            _endpoints[key] = health
+        return health
+
+
+def allow(model: dict) -> Optional[float]:
+    """
+    Можно ли отправить запрос к модели.
+    None — можно; иначе — сколько секунд осталось до пробного запроса.
+    """
+    health = _get(model)
+    with health.lock:
+        if health.state == STATE_CLOSED:
+            return None
+        now = time.monotonic()
+        if health.state == STATE_OPEN:
+            remaining = health.opened_at + COOLDOWN - now
+            if remaining > 0:
+                return remaining
+            health.state = STATE_HALF_OPEN
+            health.probe_in_flight = False
+        # half-open: пропускаем только один пробный запрос
+        if health.probe_in_flight:
+            return COOLDOWN
+        health.probe_in_flight = True
+        return None
+
+
+def allow_peek(model: dict) -> bool:
+    """Пропустил бы allow() запрос сейчас (без захвата пробного запроса)."""
+    health = _get(model)
+    with health.lock:
+        if health.state == STATE_CLOSED:
+            return True
+        if health.state == STATE_OPEN:
+            return time.monotonic() >= health.opened_at + COOLDOWN
+        return not health.probe_in_flight
+
+
+def release(model: dict) -> None:
+    """Освобождает пробный запрос, если он был отменён, не дождавшись ответа."""
+    health = _get(model)
+    with health.lock:
+        health.probe_in_flight = False
+
+
+def record_success(model: dict, latency: Optional[float] = None) -> None:
+    """
+    Учитывает ответ живого эндпоинта. latency — время успешного ответа;
+    None — сервер ответил, но ошибкой клиента (4xx): в статистику времени не входит.
+    """
+    health = _get(model)
+    with health.lock:
+        health.outcomes.append(True)
+        if latency is not None:
+            health.latencies.append(latency)
+        health.consecutive_failures = 0
+        health.probe_in_flight = False
+        health.state = STATE_CLOSED
+
+
+def record_failure(model: dict, error: str) -> None:
+    """Учитывает отказ эндпоинта (таймаут, ошибка соединения, 5xx)."""
+    health = _get(model)
+    with health.lock:
+        health.outcomes.append(False)
+        health.consecutive_failures += 1
+        health.last_error = error
+        health.probe_in_flight = False
+        trip = (
+            health.state == STATE_HALF_OPEN
+            or health.consecutive_failures >= CONSECUTIVE_FAILURES_THRESHOLD
+            or (len(health.outcomes) >= MIN_CALLS and health.failure_rate() >= FAILURE_RATE_THRESHOLD)
+        )
+        if trip:
+            health.state = STATE_OPEN
+            health.opened_at = time.monotonic()
+
+
+def latency_percentile(model: dict, percentile: float) -> Optional[float]:
+    """Перцентиль (0..100) времени успешных ответов эндпоинта или None, если данных нет."""
+    health = _get(model)
+    with health.lock:
+        values = sorted(health.latencies)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(percentile / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def get_health(model: dict) -> dict:
+    """
+    Сводка по эндпоинту для интерфейса:
+    {state, calls, failure_rate, avg_latency, last_error, retry_in}.
+    """
+    health = _get(model)
+    with health.lock:
+        retry_in = None
+        if health.state == STATE_OPEN:
+            retry_in = max(0.0, health.opened_at + COOLDOWN - time.monotonic())
+        latencies = list(health.latencies)
+        return {
+            "state": health.state,
+            "calls": len(health.outcomes),
+            "failure_rate": health.failure_rate(),
+            "avg_latency": sum(latencies) / len(latencies) if latencies else None,
+            "last_error": health.last_error,
+            "retry_in": retry_in,
+        }
+
+
+def reset(model: Optional[dict] = None) -> None:
+    """Сбрасывает статистику эндпоинта (или всех, если model не задана)."""
+    with _lock:
+        if model is None:
+            _endpoints.clear()
+        else:
+            _endpoints.pop(endpoint_key(model), None)
@@ -1,69 +1,260 @@
 """Модуль работы с SQLite. Инкапсулирует весь доступ к базе данных."""
 
 import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 # Путь к файлу БД
 DB_PATH = Path(__file__).parent / "chatlist.db"
 
+# Размер кэша страниц SQLite (отрицательное значение — в КиБ) и окна mmap, байты
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE = 64 * 1024 * 1024
+
+# Сколько секунд ждать, пока другой поток держит блокировку записи
+BUSY_TIMEOUT = 5.0
+
+# Маркеры подсветки совпадений в сниппетах поиска
+HIGHLIGHT_START = "«"
+HIGHLIGHT_END = "»"
+
+# Доступен ли полнотекстовый поиск (SQLite собран с FTS5); определяется при инициализации схемы
+FTS_AVAILABLE = False
+
+# Версия схемы в PRAGMA user_version. Увеличивать при каждом изменении init_db():
+# если версия в файле совпадает, при запуске схема не пересоздаётся и не проверяется
+SCHEMA_VERSION = 2
+
+# Полнотекстовые индексы (external content) и триггеры синхронизации с prompts/results
+_FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+        prompt, tags, content='prompts', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts BEGIN
+        INSERT INTO prompts_fts(rowid, prompt, tags) VALUES (new.id, new.prompt, new.tags);
+    END;
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, prompt, tags) VALUES ('delete', old.id, old.prompt, old.tags);
+    END;
+    CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE OF prompt, tags ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, prompt, tags) VALUES ('delete', old.id, old.prompt, old.tags);
+        INSERT INTO prompts_fts(rowid, prompt, tags) VALUES (new.id, new.prompt, new.tags);
+    END;
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+        response, content='results', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS results_fts_ai AFTER INSERT ON results BEGIN
+        INSERT INTO results_fts(rowid, response) VALUES (new.id, new.response);
+    END;
+    CREATE TRIGGER IF NOT EXISTS results_fts_ad AFTER DELETE ON results BEGIN
+        INSERT INTO results_fts(results_fts, rowid, response) VALUES ('delete', old.id, old.response);
+    END;
+    CREATE TRIGGER IF NOT EXISTS results_fts_au AFTER UPDATE OF response ON results BEGIN
+        INSERT INTO results_fts(results_fts, rowid, response) VALUES ('delete', old.id, old.response);
+        INSERT INTO results_fts(rowid, response) VALUES (new.id, new.response);
+    END;
+"""
+
+# Одно подключение на поток: sqlite3.Connection нельзя использовать из разных потоков
+_local = threading.local()
+
+# Схема проверяется один раз за процесс — при первом подключении из любого потока
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
 
 def get_connection() -> sqlite3.Connection:
-    """Возвращает подключение к БД."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    Возвращает подключение к БД текущего потока (открывает при первом обращении).
+    Подключение не нужно закрывать после запроса; для записи — with conn: (commit/rollback).
+    Первое подключение в процессе инициализирует схему (см. init_db).
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _open_connection()
+        _local.conn = conn
+        if not _schema_ready:
+            _ensure_schema(conn)
     return conn
 
 
-def init_db() -> None:
-    """Инициализация БД: создание таблиц при первом запуске."""
+def close_connection() -> None:
+    """Закрывает подключение текущего потока (при выходе из приложения или потока)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        _local.conn = None
+        conn.close()
+
+
+def get_interrupter() -> Callable[[], None]:
+    """
+    Возвращает функцию, прерывающую выполняющийся запрос подключения текущего потока.
+    Её можно вызывать из другого потока; прерванный запрос завершается
+    sqlite3.OperationalError("interrupted").
+    """
     conn = get_connection()
-    try:
-        conn.executescript("""
-            CREATE TABLE IF NOT EXISTS prompts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                prompt TEXT NOT NULL,
-                tags TEXT DEFAULT ''
-            );
-            CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts(created_at);
-            CREATE INDEX IF NOT EXISTS idx_prompts_tags ON prompts(tags);
-
-            CREATE TABLE IF NOT EXISTS models (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                api_url TEXT NOT NULL,
-                api_id TEXT NOT NULL,
-                is_active INTEGER DEFAULT 1,
-                model_type TEXT DEFAULT 'openai'
-            );
-            CREATE INDEX IF NOT EXISTS idx_models_is_active ON models(is_active);
-
-            CREATE TABLE IF NOT EXISTS results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                prompt_id INTEGER NOT NULL,
-                model_id INTEGER,
-                model_name TEXT NOT NULL,
-                response TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (prompt_id) REFERENCES prompts(id) ON DELETE CASCADE,
-                FOREIGN KEY (model_id) REFERENCES models(id) ON DELETE SET NULL
-            );
-            CREATE INDEX IF NOT EXISTS idx_results_prompt_id ON results(prompt_id);
-            CREATE INDEX IF NOT EXISTS idx_results_model_id ON results(model_id);
-            CREATE INDEX IF NOT EXISTS idx_results_created_at ON results(created_at);
-
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            );
-        """)
-        conn.commit()
-
-        # Добавить модель OpenRouter по умолчанию, если таблица пуста
-        cur = conn.execute("SELECT COUNT(*) FROM models")
-        if cur.fetchone()[0] == 0:
+
+    def interrupt() -> None:
+        try:
+            conn.interrupt()
+        except sqlite3.ProgrammingError:
+            pass  # подключение уже закрыто — прерывать нечего
+
+    return interrupt
+
+
+def init_db() -> None:
+    """
+    Инициализация БД: создание таблиц при первом запуске.
+    Вызывать не обязательно — схема готовится при первом подключении; явный вызов
+    позволяет сделать это заранее, в фоновом потоке.
+    """
+    get_connection()
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    global _schema_ready, FTS_AVAILABLE
+    with _schema_lock:
+        if _schema_ready:
+            return
+        if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            FTS_AVAILABLE = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('prompts_fts', 'results_fts')"
+            ).fetchone()[0] == 2
+        else:
+            _create_schema(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        _schema_ready = True
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    """Создаёт недостающие таблицы, индексы и столбцы, модель по умолчанию."""
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS prompts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            prompt TEXT NOT NULL,
+            tags TEXT DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts(created_at);
+        CREATE INDEX IF NOT EXISTS idx_prompts_tags ON prompts(tags);
+
+        CREATE TABLE IF NOT EXISTS models (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            api_url TEXT NOT NULL,
+            api_id TEXT NOT NULL,
+            is_active INTEGER DEFAULT 1,
+            model_type TEXT DEFAULT 'openai',
+            rate_limit_rps REAL DEFAULT 0,
+            rate_limit_burst INTEGER DEFAULT 1,
+            equivalence_group TEXT DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_models_is_active ON models(is_active);
+
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prompt_id INTEGER NOT NULL,
+            model_id INTEGER,
+            model_name TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (prompt_id) REFERENCES prompts(id) ON DELETE CASCADE,
+            FOREIGN KEY (model_id) REFERENCES models(id) ON DELETE SET NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_results_prompt_id ON results(prompt_id);
+        CREATE INDEX IF NOT EXISTS idx_results_model_id ON results(model_id);
+        CREATE INDEX IF NOT EXISTS idx_results_created_at ON results(created_at);
+
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            model_name TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_response_cache_created_at ON response_cache(created_at);
+
+        CREATE TABLE IF NOT EXISTS hedge_stats (
+            equivalence_group TEXT PRIMARY KEY,
+            hedges INTEGER DEFAULT 0,
+            primary_wins INTEGER DEFAULT 0,
+            alternate_wins INTEGER DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            model_id INTEGER,
+            model_name TEXT NOT NULL,
+            api_url TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            ended_at REAL NOT NULL,
+            attempt INTEGER DEFAULT 1,
+            streamed INTEGER DEFAULT 0,
+            status_code INTEGER,
+            error TEXT,
+            connect_ms REAL,
+            tls_ms REAL,
+            ttfb_ms REAL,
+            ttft_ms REAL,
+            total_ms REAL,
+            request_bytes INTEGER,
+            response_bytes INTEGER,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            total_tokens INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_requests_model_started ON requests(model_name, started_at);
+        CREATE INDEX IF NOT EXISTS idx_requests_started_at ON requests(started_at);
+
+        CREATE TABLE IF NOT EXISTS request_stats (
+            model_name TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            calls INTEGER DEFAULT 0,
+            errors INTEGER DEFAULT 0,
+            cancelled INTEGER DEFAULT 0,
+            latency_ms_sum REAL DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            generation_ms_sum REAL DEFAULT 0,
+            PRIMARY KEY (model_name, hour)
+        );
+        CREATE INDEX IF NOT EXISTS idx_request_stats_hour ON request_stats(hour);
+
+        CREATE TABLE IF NOT EXISTS request_latency_hist (
+            model_name TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (model_name, hour, metric, bucket)
+        );
+        CREATE INDEX IF NOT EXISTS idx_request_latency_hist_hour ON request_latency_hist(hour);
+    """)
+    _migrate(conn)
+    _init_fts(conn)
+
+    # Добавить модель OpenRouter по умолчанию, если таблица пуста
+    cur = conn.execute("SELECT COUNT(*) FROM models")
+    if cur.fetchone()[0] == 0:
+        with conn:
             conn.execute(
                 """INSERT INTO models (name, api_url, api_id, is_active, model_type)
                    VALUES (?, ?, ?, ?, ?)""",
@@ -75,9 +266,63 @@ def init_db() -> None:
                     "openrouter",
                 )
             )
-            conn.commit()
-    finally:
-        conn.close()
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Добавляет столбцы, которых нет в БД, созданных старыми версиями."""
+    model_columns = {row["name"] for row in conn.execute("PRAGMA table_info(models)")}
+    with conn:
+        for column, ddl in (
+            ("rate_limit_rps", "REAL DEFAULT 0"),
+            ("rate_limit_burst", "INTEGER DEFAULT 1"),
+            ("equivalence_group", "TEXT DEFAULT ''"),
+        ):
+            if column not in model_columns:
+                conn.execute(f"ALTER TABLE models ADD COLUMN {column} {ddl}")
+        stats_columns = {row["name"] for row in conn.execute("PRAGMA table_info(request_stats)")}
+        if "cancelled" not in stats_columns:
+            conn.execute("ALTER TABLE request_stats ADD COLUMN cancelled INTEGER DEFAULT 0")
+            # Старые агрегаты считали отмены ошибками — пересчитываются при запуске (ensure_aggregates)
+            conn.execute("DELETE FROM request_stats")
+            conn.execute("DELETE FROM request_latency_hist")
+
+
+def _init_fts(conn: sqlite3.Connection) -> None:
+    """
+    Создаёт полнотекстовые индексы. В существующей БД индексы строятся
+    по уже сохранённым промтам и ответам (однократно, при первом запуске).
+    """
+    global FTS_AVAILABLE
+    existing = {
+        row["name"] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('prompts_fts', 'results_fts')"
+        )
+    }
+    try:
+        conn.executescript(_FTS_SCHEMA)
+    except sqlite3.OperationalError:
+        # SQLite собран без FTS5 — поиск работает через LIKE
+        FTS_AVAILABLE = False
+        return
+    with conn:
+        if "prompts_fts" not in existing:
+            conn.execute("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+        if "results_fts" not in existing:
+            conn.execute("INSERT INTO results_fts(results_fts) VALUES ('rebuild')")
+    FTS_AVAILABLE = True
+
+
+def fts_query(text: str) -> str:
+    """
+    Превращает строку поиска в запрос FTS5: каждое слово — фраза в кавычках
+    (спецсимволы синтаксиса не мешают), последнее слово ищется по префиксу.
+    """
+    words = text.split()
+    if not words:
+        return ""
+    terms = ['"' + w.replace('"', '""') + '"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
 
 
 # --- prompts ---
@@ -85,15 +330,12 @@ def init_db() -> None:
 def create_prompt(prompt: str, tags: str = "") -> int:
     """Создаёт промт. Возвращает id."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute(
             "INSERT INTO prompts (prompt, tags) VALUES (?, ?)",
             (prompt, tags)
         )
-        conn.commit()
         return cur.lastrowid
-    finally:
-        conn.close()
 
 
 def get_prompts(
@@ -101,131 +343,320 @@ def get_prompts(
     order_by: str = "created_at",
     order_desc: bool = True
 ) -> list[dict]:
-    """Возвращает список промтов. Опционально: поиск и сортировка."""
+    """
+    Возвращает список промтов. Опционально: поиск (по тексту, тегам и сохранённым ответам)
+    и сортировка.
+    """
     conn = get_connection()
-    try:
-        order_col = "created_at" if order_by == "created_at" else "prompt"
-        direction = "DESC" if order_desc else "ASC"
-        if search:
-            cur = conn.execute(
-                f"SELECT * FROM prompts WHERE prompt LIKE ? OR tags LIKE ? ORDER BY {order_col} {direction}",
-                (f"%{search}%", f"%{search}%")
-            )
-        else:
-            cur = conn.execute(
-                f"SELECT * FROM prompts ORDER BY {order_col} {direction}"
-            )
+    order_col = "created_at" if order_by == "created_at" else "prompt"
+    direction = "DESC" if order_desc else "ASC"
+    if search and FTS_AVAILABLE:
+        query = fts_query(search)
+        cur = conn.execute(
+            f"""SELECT * FROM prompts WHERE id IN (
+                    SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?
+                    UNION
+                    SELECT r.prompt_id FROM results_fts JOIN results r ON r.id = results_fts.rowid
+                    WHERE results_fts MATCH ?
+                ) ORDER BY {order_col} {direction}""",
+            (query, query)
+        )
+    elif search:
+        pattern = f"%{search}%"
+        cur = conn.execute(
+            f"""SELECT * FROM prompts p WHERE prompt LIKE ? OR tags LIKE ?
+                   OR EXISTS (SELECT 1 FROM results r WHERE r.prompt_id = p.id AND r.response LIKE ?)
+                ORDER BY {order_col} {direction}""",
+            (pattern, pattern, pattern)
+        )
+    else:
+        cur = conn.execute(
+            f"SELECT * FROM prompts ORDER BY {order_col} {direction}"
+        )
+    return [dict(row) for row in cur.fetchall()]
+
+
+# Длина превью промта в списке истории, символов
+PREVIEW_LENGTH = 80
+
+
+def get_prompt_previews(
+    limit: int = 200,
+    after: Optional[tuple] = None,
+    preview_length: int = PREVIEW_LENGTH
+) -> list[dict]:
+    """
+    Страница истории промтов от новых к старым: {id, created_at, tags, preview, truncated}.
+    after — (created_at, id) последней строки предыдущей страницы (keyset-пагинация:
+    следующая страница читается по индексу created_at без OFFSET). Полный текст не читается.
+    """
+    conn = get_connection()
+    columns = "id, created_at, tags, substr(prompt, 1, ?) AS preview, length(prompt) > ? AS truncated"
+    if after is None:
+        cur = conn.execute(
+            f"SELECT {columns} FROM prompts ORDER BY created_at DESC, id DESC LIMIT ?",
+            (preview_length, preview_length, limit)
+        )
+    else:
+        cur = conn.execute(
+            f"""SELECT {columns} FROM prompts WHERE (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC LIMIT ?""",
+            (preview_length, preview_length, after[0], after[1], limit)
+        )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def search_prompts(
+    search: str,
+    limit: int = 200,
+    offset: int = 0,
+    preview_length: int = PREVIEW_LENGTH
+) -> list[dict]:
+    """
+    Полнотекстовый поиск промтов по тексту, тегам и сохранённым ответам.
+    Возвращает страницу превью по убыванию релевантности: {id, created_at, tags, preview,
+    truncated, snippet, matched_in}, где snippet — фрагмент с подсвеченными совпадениями
+    (HIGHLIGHT_START/HIGHLIGHT_END), matched_in — где найдено совпадение: "prompt"
+    (если совпал сам промт) или "response". Без FTS5 — поиск через LIKE, порядок по дате,
+    snippet пустой.
+    """
+    if not search.strip():
+        return []
+    conn = get_connection()
+    columns = "p.id, p.created_at, p.tags, substr(p.prompt, 1, ?) AS preview, length(p.prompt) > ? AS truncated"
+    if not FTS_AVAILABLE:
+        pattern = f"%{search}%"
+        cur = conn.execute(
+            f"""SELECT {columns}, '' AS snippet, 'prompt' AS matched_in FROM prompts p
+                WHERE p.prompt LIKE ? OR p.tags LIKE ?
+                   OR EXISTS (SELECT 1 FROM results r WHERE r.prompt_id = p.id AND r.response LIKE ?)
+                ORDER BY p.created_at DESC, p.id DESC LIMIT ? OFFSET ?""",
+            (preview_length, preview_length, pattern, pattern, pattern, limit, offset)
+        )
         return [dict(row) for row in cur.fetchall()]
-    finally:
-        conn.close()
+    query = fts_query(search)
+    # bm25 разных таблиц несравнимы: оценка нормируется по лучшему совпадению
+    # своей таблицы (1 — лучшее). Для промта берётся совпадение в его тексте,
+    # если оно есть, иначе лучшее совпадение в ответах
+    cur = conn.execute(
+        f"""WITH hits AS (
+               SELECT rowid AS prompt_id, bm25(prompts_fts) AS rank,
+                      snippet(prompts_fts, -1, ?, ?, '…', 12) AS snippet, 'prompt' AS matched_in
+               FROM prompts_fts WHERE prompts_fts MATCH ?
+               UNION ALL
+               SELECT r.prompt_id, bm25(results_fts),
+                      snippet(results_fts, 0, ?, ?, '…', 12), 'response'
+               FROM results_fts JOIN results r ON r.id = results_fts.rowid
+               WHERE results_fts MATCH ?
+           ),
+           scored AS (
+               SELECT prompt_id, snippet, matched_in,
+                      CASE WHEN MIN(rank) OVER w < 0 THEN rank / MIN(rank) OVER w ELSE 1.0 END AS score
+               FROM hits WINDOW w AS (PARTITION BY matched_in)
+           ),
+           ranked AS (
+               SELECT *, ROW_NUMBER() OVER (
+                          PARTITION BY prompt_id ORDER BY matched_in = 'response', score DESC
+                      ) AS n
+               FROM scored
+           ),
+           best AS (SELECT prompt_id, score, snippet, matched_in FROM ranked WHERE n = 1)
+           SELECT {columns}, best.snippet, best.matched_in
+           FROM best JOIN prompts p ON p.id = best.prompt_id
+           ORDER BY best.score DESC, p.created_at DESC, p.id DESC
+           LIMIT ? OFFSET ?""",
+        (HIGHLIGHT_START, HIGHLIGHT_END, query, HIGHLIGHT_START, HIGHLIGHT_END, query,
+         preview_length, preview_length, limit, offset)
+    )
+    return [dict(row) for row in cur.fetchall()]
 
 
 def get_prompt_by_id(prompt_id: int) -> Optional[dict]:
     """Возвращает промт по id."""
     conn = get_connection()
-    try:
-        cur = conn.execute("SELECT * FROM prompts WHERE id = ?", (prompt_id,))
-        row = cur.fetchone()
-        return dict(row) if row else None
-    finally:
-        conn.close()
+    cur = conn.execute("SELECT * FROM prompts WHERE id = ?", (prompt_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
 
 
 def update_prompt(prompt_id: int, prompt: str, tags: str = "") -> int:
     """Обновляет промт. Возвращает количество изменённых строк."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute(
             "UPDATE prompts SET prompt = ?, tags = ? WHERE id = ?",
             (prompt, tags, prompt_id)
         )
-        conn.commit()
         return cur.rowcount
-    finally:
-        conn.close()
 
 
 def delete_prompt(prompt_id: int) -> int:
     """Удаляет промт. Возвращает количество удалённых строк."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute("DELETE FROM prompts WHERE id = ?", (prompt_id,))
-        conn.commit()
         return cur.rowcount
-    finally:
-        conn.close()
 
 
 # --- models ---
 
-def create_model(name: str, api_url: str, api_id: str, is_active: int = 1, model_type: str = "openai") -> int:
-    """Создаёт модель. Возвращает id."""
+# Обработчики изменения таблицы models (вызываются после commit в потоке, записавшем изменения)
+_models_listeners: list[Callable[[], None]] = []
+
+
+def subscribe_models(callback: Callable[[], None]) -> None:
+    """Подписывает на изменения моделей через create_model/update_model/delete_model/set_models_active."""
+    _models_listeners.append(callback)
+
+
+def unsubscribe_models(callback: Callable[[], None]) -> None:
+    if callback in _models_listeners:
+        _models_listeners.remove(callback)
+
+
+def _notify_models_changed() -> None:
+    for callback in list(_models_listeners):
+        callback()
+
+
+def create_model(
+    name: str,
+    api_url: str,
+    api_id: str,
+    is_active: int = 1,
+    model_type: str = "openai",
+    rate_limit_rps: float = 0.0,
+    rate_limit_burst: int = 1,
+    equivalence_group: str = ""
+) -> int:
+    """
+    Создаёт модель. Возвращает id.
+    rate_limit_rps — лимит запросов в секунду (0 — без лимита),
+    rate_limit_burst — сколько запросов можно отправить подряд,
+    equivalence_group — имя группы одинаковых моделей на разных маршрутах (для хеджирования).
+    """
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute(
-            "INSERT INTO models (name, api_url, api_id, is_active, model_type) VALUES (?, ?, ?, ?, ?)",
-            (name, api_url, api_id, is_active, model_type)
+            """INSERT INTO models (name, api_url, api_id, is_active, model_type,
+                                   rate_limit_rps, rate_limit_burst, equivalence_group)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (name, api_url, api_id, is_active, model_type, rate_limit_rps, rate_limit_burst, equivalence_group)
         )
-        conn.commit()
-        return cur.lastrowid
-    finally:
-        conn.close()
+    _notify_models_changed()
+    return cur.lastrowid
 
 
 def get_models() -> list[dict]:
     """Возвращает все модели."""
     conn = get_connection()
-    try:
-        cur = conn.execute("SELECT * FROM models ORDER BY name")
-        return [dict(row) for row in cur.fetchall()]
-    finally:
-        conn.close()
+    cur = conn.execute("SELECT * FROM models ORDER BY name")
+    return [dict(row) for row in cur.fetchall()]
 
 
 def get_active_models() -> list[dict]:
     """Возвращает только активные модели (is_active=1)."""
     conn = get_connection()
-    try:
-        cur = conn.execute("SELECT * FROM models WHERE is_active = 1 ORDER BY name")
-        return [dict(row) for row in cur.fetchall()]
-    finally:
-        conn.close()
+    cur = conn.execute("SELECT * FROM models WHERE is_active = 1 ORDER BY name")
+    return [dict(row) for row in cur.fetchall()]
 
 
 def get_model_by_id(model_id: int) -> Optional[dict]:
     """Возвращает модель по id."""
     conn = get_connection()
-    try:
-        cur = conn.execute("SELECT * FROM models WHERE id = ?", (model_id,))
-        row = cur.fetchone()
-        return dict(row) if row else None
-    finally:
-        conn.close()
-
-
-def update_model(model_id: int, name: str, api_url: str, api_id: str, is_active: int, model_type: str = "openai") -> int:
+    cur = conn.execute("SELECT * FROM models WHERE id = ?", (model_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def update_model(
+    model_id: int,
+    name: str,
+    api_url: str,
+    api_id: str,
+    is_active: int,
+    model_type: str = "openai",
+    rate_limit_rps: float = 0.0,
+    rate_limit_burst: int = 1,
+    equivalence_group: str = ""
+) -> int:
     """Обновляет модель. Возвращает количество изменённых строк."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute(
-            "UPDATE models SET name = ?, api_url = ?, api_id = ?, is_active = ?, model_type = ? WHERE id = ?",
-            (name, api_url, api_id, is_active, model_type, model_id)
+            """UPDATE models SET name = ?, api_url = ?, api_id = ?, is_active = ?, model_type = ?,
+                   rate_limit_rps = ?, rate_limit_burst = ?, equivalence_group = ?
+               WHERE id = ?""",
+            (name, api_url, api_id, is_active, model_type, rate_limit_rps, rate_limit_burst,
+             equivalence_group, model_id)
         )
-        conn.commit()
-        return cur.rowcount
-    finally:
-        conn.close()
+    _notify_models_changed()
+    return cur.rowcount
+
+
+def set_models_active(changes: dict[int, bool]) -> int:
+    """
+    Включает/выключает несколько моделей одной транзакцией.
+    changes: {model_id: is_active}. Возвращает количество изменённых строк.
+    """
+    if not changes:
+        return 0
+    conn = get_connection()
+    with conn:
+        cur = conn.executemany(
+            "UPDATE models SET is_active = ? WHERE id = ?",
+            [(1 if is_active else 0, model_id) for model_id, is_active in changes.items()]
+        )
+    _notify_models_changed()
+    return cur.rowcount
 
 
 def delete_model(model_id: int) -> int:
     """Удаляет модель. Возвращает количество удалённых строк."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute("DELETE FROM models WHERE id = ?", (model_id,))
-        conn.commit()
-        return cur.rowcount
-    finally:
-        conn.close()
+    _notify_models_changed()
+    return cur.rowcount
+
+
+def get_equivalent_models(equivalence_group: str, exclude_id: Optional[int] = None) -> list[dict]:
+    """Возвращает модели из группы эквивалентов (кроме exclude_id)."""
+    if not equivalence_group:
+        return []
+    conn = get_connection()
+    cur = conn.execute(
+        "SELECT * FROM models WHERE equivalence_group = ? AND id != ? ORDER BY is_active DESC, name",
+        (equivalence_group, exclude_id if exclude_id is not None else -1)
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+# --- hedge_stats ---
+
+def record_hedge(equivalence_group: str, primary_won: Optional[bool]) -> None:
+    """
+    Учитывает хеджированный запрос в группе.
+    primary_won: True — первым ответил основной маршрут, False — запасной, None — оба с ошибкой.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            """INSERT INTO hedge_stats (equivalence_group, hedges, primary_wins, alternate_wins)
+               VALUES (?, 1, ?, ?)
+               ON CONFLICT(equivalence_group) DO UPDATE SET
+                   hedges = hedges + 1,
+                   primary_wins = primary_wins + excluded.primary_wins,
+                   alternate_wins = alternate_wins + excluded.alternate_wins""",
+            (equivalence_group, 1 if primary_won is True else 0, 1 if primary_won is False else 0)
+        )
+
+
+def get_hedge_stats() -> list[dict]:
+    """Возвращает статистику хеджирования по группам."""
+    conn = get_connection()
+    cur = conn.execute("SELECT * FROM hedge_stats ORDER BY equivalence_group")
+    return [dict(row) for row in cur.fetchall()]
 
 
 # --- results ---
@@ -233,42 +664,265 @@ def delete_model(model_id: int) -> int:
 def create_result(prompt_id: int, model_id: Optional[int], model_name: str, response: str) -> int:
     """Сохраняет результат. Возвращает id."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute(
             "INSERT INTO results (prompt_id, model_id, model_name, response) VALUES (?, ?, ?, ?)",
             (prompt_id, model_id, model_name, response)
         )
-        conn.commit()
         return cur.lastrowid
-    finally:
-        conn.close()
+
+
+def create_results(prompt_id: int, rows: list[tuple]) -> int:
+    """
+    Сохраняет несколько результатов одной транзакцией (всё или ничего).
+    rows: [(model_id, model_name, response), ...]. Возвращает количество сохранённых.
+    """
+    if not rows:
+        return 0
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO results (prompt_id, model_id, model_name, response) VALUES (?, ?, ?, ?)",
+            [(prompt_id, model_id, model_name, response) for model_id, model_name, response in rows]
+        )
+    return len(rows)
 
 
 def get_results(prompt_id: Optional[int] = None) -> list[dict]:
     """Возвращает сохранённые результаты. Опционально: фильтр по prompt_id."""
     conn = get_connection()
-    try:
-        if prompt_id is not None:
-            cur = conn.execute(
-                "SELECT * FROM results WHERE prompt_id = ? ORDER BY created_at DESC",
-                (prompt_id,)
-            )
-        else:
-            cur = conn.execute("SELECT * FROM results ORDER BY created_at DESC")
-        return [dict(row) for row in cur.fetchall()]
-    finally:
-        conn.close()
+    if prompt_id is not None:
+        cur = conn.execute(
+            "SELECT * FROM results WHERE prompt_id = ? ORDER BY created_at DESC",
+            (prompt_id,)
+        )
+    else:
+        cur = conn.execute("SELECT * FROM results ORDER BY created_at DESC")
+    return [dict(row) for row in cur.fetchall()]
 
 
 def delete_result(result_id: int) -> int:
     """Удаляет результат. Возвращает количество удалённых строк."""
     conn = get_connection()
-    try:
+    with conn:
         cur = conn.execute("DELETE FROM results WHERE id = ?", (result_id,))
-        conn.commit()
         return cur.rowcount
-    finally:
-        conn.close()
+
+
+# --- response_cache ---
+
+def get_cached_response(key: str, min_created_at: float) -> Optional[tuple[float, str]]:
+    """
+    Возвращает (created_at, ответ) из кэша, если запись создана не раньше
+    min_created_at (Unix-время), иначе None.
+    """
+    conn = get_connection()
+    cur = conn.execute(
+        "SELECT created_at, response FROM response_cache WHERE key = ? AND created_at >= ?",
+        (key, min_created_at)
+    )
+    row = cur.fetchone()
+    return (row["created_at"], row["response"]) if row else None
+
+
+def put_cached_response(key: str, model_name: str, response: str, created_at: float, max_entries: int) -> None:
+    """
+    Сохраняет ответ в кэш. Оставляет не более max_entries самых свежих записей.
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, model_name, response, created_at) VALUES (?, ?, ?, ?)",
+            (key, model_name, response, created_at)
+        )
+        conn.execute(
+            """DELETE FROM response_cache WHERE key NOT IN (
+                   SELECT key FROM response_cache ORDER BY created_at DESC LIMIT ?
+               )""",
+            (max_entries,)
+        )
+
+
+def delete_expired_responses(min_created_at: float) -> int:
+    """Удаляет из кэша ответы старше min_created_at. Возвращает количество удалённых строк."""
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("DELETE FROM response_cache WHERE created_at < ?", (min_created_at,))
+        return cur.rowcount
+
+
+def clear_response_cache() -> None:
+    """Очищает кэш ответов."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM response_cache")
+
+
+# --- requests (телеметрия) ---
+
+# Столбцы таблицы requests, которые заполняет telemetry (в порядке вставки)
+REQUEST_METRIC_COLUMNS = (
+    "model_id", "model_name", "api_url", "started_at", "ended_at", "attempt", "streamed",
+    "status_code", "error", "connect_ms", "tls_ms", "ttfb_ms", "ttft_ms", "total_ms",
+    "request_bytes", "response_bytes", "prompt_tokens", "completion_tokens", "total_tokens",
+)
+
+# Метрики, по которым можно считать перцентили
+REQUEST_TIMING_COLUMNS = ("connect_ms", "tls_ms", "ttfb_ms", "ttft_ms", "total_ms")
+
+
+def _upsert_request_aggregates(conn: sqlite3.Connection, hourly: list[tuple], histogram: list[tuple]) -> None:
+    if hourly:
+        conn.executemany(
+            """INSERT INTO request_stats
+                   (model_name, hour, calls, errors, cancelled, latency_ms_sum, completion_tokens, generation_ms_sum)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(model_name, hour) DO UPDATE SET
+                   calls = calls + excluded.calls,
+                   errors = errors + excluded.errors,
+                   cancelled = cancelled + excluded.cancelled,
+                   latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+                   completion_tokens = completion_tokens + excluded.completion_tokens,
+                   generation_ms_sum = generation_ms_sum + excluded.generation_ms_sum""",
+            hourly
+        )
+    if histogram:
+        conn.executemany(
+            """INSERT INTO request_latency_hist (model_name, hour, metric, bucket, count)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(model_name, hour, metric, bucket) DO UPDATE SET
+                   count = count + excluded.count""",
+            histogram
+        )
+
+
+def insert_request_metrics(
+    rows: list[dict],
+    hourly: Optional[list[tuple]] = None,
+    histogram: Optional[list[tuple]] = None
+) -> int:
+    """
+    Записывает пачку строк телеметрии одной транзакцией. Отсутствующие поля — NULL.
+    hourly, histogram — приращения агрегатов (см. add_request_aggregates), пишутся в той же транзакции.
+    """
+    if not rows:
+        return 0
+    conn = get_connection()
+    columns = ", ".join(REQUEST_METRIC_COLUMNS)
+    placeholders = ", ".join("?" for _ in REQUEST_METRIC_COLUMNS)
+    with conn:
+        conn.executemany(
+            f"INSERT INTO requests ({columns}) VALUES ({placeholders})",
+            [tuple(row.get(column) for column in REQUEST_METRIC_COLUMNS) for row in rows]
+        )
+        _upsert_request_aggregates(conn, hourly or [], histogram or [])
+    return len(rows)
+
+
+def add_request_aggregates(hourly: list[tuple], histogram: list[tuple]) -> None:
+    """
+    Прибавляет приращения к почасовым агрегатам телеметрии.
+    hourly: [(model_name, hour, calls, errors, cancelled, latency_ms_sum, completion_tokens,
+    generation_ms_sum), ...];
+    histogram: [(model_name, hour, metric, bucket, count), ...]; hour — Unix-время // 3600.
+    """
+    conn = get_connection()
+    with conn:
+        _upsert_request_aggregates(conn, hourly, histogram)
+
+
+def clear_request_aggregates() -> None:
+    """Удаляет почасовые агрегаты (перед пересчётом)."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM request_stats")
+        conn.execute("DELETE FROM request_latency_hist")
+
+
+def request_aggregates_missing() -> bool:
+    """Есть телеметрия, но нет агрегатов (БД из версии без агрегатов)."""
+    conn = get_connection()
+    has_requests = conn.execute("SELECT 1 FROM requests LIMIT 1").fetchone() is not None
+    has_stats = conn.execute("SELECT 1 FROM request_stats LIMIT 1").fetchone() is not None
+    return has_requests and not has_stats
+
+
+def iter_request_metrics(batch_size: int = 5000):
+    """Перебирает всю телеметрию пачками dict (по возрастанию id)."""
+    conn = get_connection()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT * FROM requests WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield [dict(row) for row in rows]
+
+
+def get_request_stats(since_hour: int = 0) -> list[dict]:
+    """
+    Суммы почасовых агрегатов по моделям начиная с часа since_hour:
+    [{model_name, calls, errors, cancelled, latency_ms_sum, completion_tokens, generation_ms_sum}, ...].
+    """
+    conn = get_connection()
+    cur = conn.execute(
+        """SELECT model_name, SUM(calls) AS calls, SUM(errors) AS errors, SUM(cancelled) AS cancelled,
+                  SUM(latency_ms_sum) AS latency_ms_sum, SUM(completion_tokens) AS completion_tokens,
+                  SUM(generation_ms_sum) AS generation_ms_sum
+           FROM request_stats WHERE hour >= ? GROUP BY model_name ORDER BY model_name""",
+        (since_hour,)
+    )
+    return [dict(row) for row in cur.fetchall()]
+
+
+def get_latency_histogram(metric: str, since_hour: int = 0) -> list[tuple]:
+    """Гистограмма метрики по моделям с часа since_hour: [(model_name, bucket, count), ...] по возрастанию bucket."""
+    conn = get_connection()
+    cur = conn.execute(
+        """SELECT model_name, bucket, SUM(count) FROM request_latency_hist
+           WHERE metric = ? AND hour >= ? GROUP BY model_name, bucket ORDER BY model_name, bucket""",
+        (metric, since_hour)
+    )
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def get_request_metric_values(
+    metric: str = "total_ms",
+    since: Optional[float] = None,
+    successful_only: bool = True
+) -> list[tuple]:
+    """
+    Значения метрики по моделям: [(model_name, value), ...], отсортированы по модели и значению.
+    since — Unix-время начала периода; successful_only — только попытки без ошибки.
+    """
+    if metric not in REQUEST_TIMING_COLUMNS:
+        raise ValueError(f"Неизвестная метрика: {metric}")
+    conn = get_connection()
+    conditions = [f"{metric} IS NOT NULL", "started_at >= ?"]
+    if successful_only:
+        conditions.append("error IS NULL")
+    cur = conn.execute(
+        f"""SELECT model_name, {metric} FROM requests WHERE {" AND ".join(conditions)}
+            ORDER BY model_name, {metric}""",
+        (since if since is not None else 0.0,)
+    )
+    return [tuple(row) for row in cur.fetchall()]
+
+
+def delete_request_metrics(before: float) -> int:
+    """
+    Удаляет телеметрию и почасовые агрегаты старше before (Unix-время).
+    Возвращает количество удалённых строк телеметрии.
+    """
+    conn = get_connection()
+    before_hour = int(before // 3600)
+    with conn:
+        cur = conn.execute("DELETE FROM requests WHERE started_at < ?", (before,))
+        conn.execute("DELETE FROM request_stats WHERE hour < ?", (before_hour,))
+        conn.execute("DELETE FROM request_latency_hist WHERE hour < ?", (before_hour,))
+        return cur.rowcount
 
 
 # --- settings ---
@@ -276,26 +930,32 @@ def delete_result(result_id: int) -> int:
 def get_setting(key: str) -> Optional[str]:
     """Возвращает значение настройки по ключу."""
     conn = get_connection()
-    try:
-        cur = conn.execute("SELECT value FROM settings WHERE key = ?", (key,))
-        row = cur.fetchone()
-        return row["value"] if row else None
-    finally:
-        conn.close()
+    cur = conn.execute("SELECT value FROM settings WHERE key = ?", (key,))
+    row = cur.fetchone()
+    return row["value"] if row else None
+
+
+def get_all_settings() -> dict[str, str]:
+    """Возвращает все настройки одним запросом: {key: value}."""
+    conn = get_connection()
+    return {row["key"]: row["value"] for row in conn.execute("SELECT key, value FROM settings")}
 
 
 def set_setting(key: str, value: str) -> None:
     """Записывает настройку (ключ-значение)."""
     conn = get_connection()
-    try:
+    with conn:
         conn.execute(
             "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
             (key, value)
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 
-# Инициализация при импорте
-init_db()
+def set_settings(values: dict[str, str]) -> None:
+    """Записывает несколько настроек одной транзакцией."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            list(values.items())
+        )
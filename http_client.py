@@ -0,0 +1,271 @@
+"""
+Общие HTTP-клиенты с пулом keep-alive соединений (по одному на хост).
+Соединения пула можно оборвать из другого потока (Connection.abort) — так
+отменяется запрос, которому сервер ещё не прислал заголовки ответа.
+"""
+
+import importlib.util
+import logging
+import socket
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+
+def _lazy_import(name: str):
+    """
+    Импорт модуля с отложенным выполнением: код модуля выполняется при первом
+    обращении к его атрибуту. httpx с зависимостями — больше половины времени
+    импорта приложения, а нужен он только при первом запросе.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+httpx = _lazy_import("httpx")
+
+# LazyLoader до Python 3.12 не потокобезопасен: первое обращение к httpx из
+# нескольких потоков сразу даёт AttributeError. Поэтому модуль загружается
+# под блокировкой (preload), до того как к нему обращаются остальные потоки
+_import_lock = threading.Lock()
+_imported = False
+
+# HTTP/2 включается, только если установлен пакет h2 (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Максимум соединений в пуле одного хоста
+DEFAULT_POOL_SIZE = 10
+
+# Через сколько секунд простоя закрывать keep-alive соединение
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+
+_pool_size = DEFAULT_POOL_SIZE
+_keepalive_expiry = DEFAULT_KEEPALIVE_EXPIRY
+
+
+class _ClientSlot:
+    """Клиент хоста и число запросов, которые им сейчас пользуются."""
+
+    __slots__ = ("client", "active", "retired")
+
+    def __init__(self, client: "httpx.Client"):
+        self.client = client
+        self.active = 0
+        # Заменён после configure(): закрывается, когда завершится последний запрос
+        self.retired = False
+
+
+_clients: dict[str, _ClientSlot] = {}
+_lock = threading.Lock()
+
+
+def configure(pool_size: int = DEFAULT_POOL_SIZE, keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY) -> None:
+    """
+    Задаёт размер пула и время жизни простаивающих соединений.
+    Новые запросы получают клиенты с новыми настройками; старые клиенты
+    закрываются, когда завершатся выполняющиеся на них запросы.
+    """
+    global _pool_size, _keepalive_expiry
+    with _lock:
+        _pool_size = max(1, pool_size)
+        _keepalive_expiry = max(0.0, keepalive_expiry)
+        idle = []
+        for slot in _clients.values():
+            slot.retired = True
+            if slot.active == 0:
+                idle.append(slot.client)
+        _clients.clear()
+    _close(idle)
+
+
+# Кто следит за соединениями текущего потока (см. watch_connections)
+_local = threading.local()
+
+
+class Connection:
+    """
+    Соединение httpcore, которое можно оборвать из другого потока.
+    Оборачивает сетевой поток httpcore: чтение и запись сообщают о нём
+    наблюдателю текущего потока (watch_connections).
+    """
+
+    __slots__ = ("_stream",)
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        _claim(self)
+        return self._stream.read(max_bytes, timeout)
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        _claim(self)
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname: Optional[str] = None, timeout: Optional[float] = None):
+        return Connection(self._stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info: str):
+        return self._stream.get_extra_info(info)
+
+    def abort(self) -> None:
+        """
+        Обрывает соединение: shutdown будит поток, заблокированный в чтении
+        (close() из другого потока этого не делает). Соединение HTTP/2 общее
+        для нескольких запросов и не обрывается.
+        """
+        ssl_object = self._stream.get_extra_info("ssl_object")
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+            return
+        sock = self._stream.get_extra_info("socket")
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _Backend:
+    """Сетевой backend httpcore, выдающий соединения Connection."""
+
+    __slots__ = ("_backend",)
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def connect_tcp(self, *args, **kwargs) -> Connection:
+        return Connection(self._backend.connect_tcp(*args, **kwargs))
+
+    def connect_unix_socket(self, *args, **kwargs) -> Connection:
+        return Connection(self._backend.connect_unix_socket(*args, **kwargs))
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+def _claim(connection: Connection) -> None:
+    watcher = getattr(_local, "watcher", None)
+    if watcher is not None:
+        watcher(connection)
+
+
+@contextmanager
+def watch_connections(callback: Callable[[Connection], None]) -> Iterator[None]:
+    """
+    Внутри блока callback(connection) вызывается при каждом чтении и записи
+    текущего потока — так запрос узнаёт своё соединение ещё до ответа сервера.
+    """
+    previous = getattr(_local, "watcher", None)
+    _local.watcher = callback
+    try:
+        yield
+    finally:
+        _local.watcher = previous
+
+
+def _make_transport() -> "httpx.HTTPTransport":
+    transport = httpx.HTTPTransport(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=_pool_size,
+            max_keepalive_connections=_pool_size,
+            keepalive_expiry=_keepalive_expiry,
+        ),
+    )
+    # httpx не даёт передать network_backend в пул httpcore — подменяем у созданного пула
+    pool = getattr(transport, "_pool", None)
+    if pool is not None and hasattr(pool, "_network_backend"):
+        pool._network_backend = _Backend(pool._network_backend)
+    return transport
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def _get_slot(url: str) -> _ClientSlot:
+    # вызывается под _lock
+    key = _host_key(url)
+    slot = _clients.get(key)
+    if slot is None:
+        slot = _ClientSlot(httpx.Client(transport=_make_transport()))
+        _clients[key] = slot
+        log.info("HTTP-клиент для %s (пул %d, HTTP/2: %s)", key, _pool_size, HTTP2_AVAILABLE)
+    return slot
+
+
+def get_client(url: str) -> "httpx.Client":
+    """
+    Возвращает общий клиент для хоста из url (создаёт при первом обращении).
+    Клиент может быть закрыт при смене настроек; для запроса используйте use_client().
+    """
+    preload()
+    with _lock:
+        return _get_slot(url).client
+
+
+@contextmanager
+def use_client(url: str) -> Iterator["httpx.Client"]:
+    """
+    Общий клиент для хоста из url на время запроса: пока блок не завершён,
+    configure() не закроет этот клиент.
+    """
+    preload()
+    with _lock:
+        slot = _get_slot(url)
+        slot.active += 1
+    try:
+        yield slot.client
+    finally:
+        with _lock:
+            slot.active -= 1
+            close = slot.retired and slot.active == 0
+        if close:
+            _close([slot.client])
+
+
+def preload() -> None:
+    """
+    Выполняет отложенный импорт httpx (при запуске — в фоновом потоке).
+    Вызывается перед любым обращением к httpx; повторные вызовы ничего не стоят.
+    """
+    global _imported
+    if _imported:
+        return
+    with _import_lock:
+        if not _imported:
+            httpx.Client
+            _imported = True
+
+
+def close_all() -> None:
+    """Закрывает все клиенты и их соединения (вызывается при выходе)."""
+    with _lock:
+        clients = [slot.client for slot in _clients.values()]
+        _clients.clear()
+    _close(clients)
+
+
+def _close(clients: list["httpx.Client"]) -> None:
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            log.exception("Ошибка при закрытии HTTP-клиента")
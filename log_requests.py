@@ -1,22 +1,106 @@
-"""Логирование запросов к API."""
+"""
+Логирование запросов к API.
 
-from datetime import datetime
+log_request() только ставит запись в очередь; в файл пишет фоновый поток
+пачками. Лог ротируется по размеру и раз в сутки, старые файлы сжимаются в .gz.
+"""
+
+import atexit
+import gzip
+import logging
+import shutil
+from datetime import date, datetime
 from pathlib import Path
 
+from batch_writer import BatchWriter
+
+log = logging.getLogger(__name__)
+
 LOG_DIR = Path(__file__).parent / "logs"
 LOG_FILE = LOG_DIR / "requests.log"
 
+# Как часто сбрасывать накопленные записи на диск, секунды
+FLUSH_INTERVAL = 1.0
+
+# Сколько записей писать за один проход
+BATCH_SIZE = 200
+
+# Размер лога, после которого он ротируется, байты
+MAX_BYTES = 5 * 1024 * 1024
+
+# Сколько сжатых архивов хранить
+BACKUP_COUNT = 10
+
+# Сколько символов промта и ответа попадает в лог
+PREVIEW_LENGTH = 200
+
+def _preview(text: str) -> str:
+    return f"{text[:PREVIEW_LENGTH]}{'...' if len(text) > PREVIEW_LENGTH else ''}"
+
 
 def log_request(model_name: str, prompt: str, response: str, error: str = None):
-    """Записывает запрос в лог."""
-    LOG_DIR.mkdir(exist_ok=True)
-    timestamp = datetime.now().isoformat()
+    """Ставит запись о запросе в очередь на запись в лог (не блокирует вызывающий поток)."""
+    record = (
+        datetime.now().isoformat(),
+        model_name,
+        _preview(prompt) if prompt else "",
+        _preview(response) if response and not error else "",
+        error,
+    )
+    _writer.put(record)
+
+
+def _format(record: tuple) -> str:
+    timestamp, model_name, prompt, response, error = record
     status = "OK" if error is None else f"ERROR: {error}"
     entry = f"[{timestamp}] {model_name} | {status}\n"
     if prompt:
-        entry += f"  Prompt: {prompt[:200]}{'...' if len(prompt) > 200 else ''}\n"
-    if response and not error:
-        entry += f"  Response: {response[:200]}{'...' if len(response) > 200 else ''}\n"
-    entry += "\n"
+        entry += f"  Prompt: {prompt}\n"
+    if response:
+        entry += f"  Response: {response}\n"
+    return entry + "\n"
+
+
+def _write_batch(batch: list[tuple]) -> None:
+    LOG_DIR.mkdir(exist_ok=True)
+    _rotate_if_needed()
     with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(entry)
+        f.write("".join(_format(record) for record in batch))
+
+
+def _rotate_if_needed() -> None:
+    """Ротация: файл больше MAX_BYTES или последняя запись в него сделана не сегодня."""
+    try:
+        stat = LOG_FILE.stat()
+    except FileNotFoundError:
+        return
+    if stat.st_size == 0:
+        return
+    started = date.fromtimestamp(stat.st_mtime)
+    if stat.st_size < MAX_BYTES and started == date.today():
+        return
+    archive = LOG_DIR / f"requests-{datetime.now():%Y%m%d-%H%M%S-%f}.log.gz"
+    rotated = LOG_FILE.with_suffix(".log.1")
+    LOG_FILE.replace(rotated)
+    with open(rotated, "rb") as src, gzip.open(archive, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    rotated.unlink()
+    archives = sorted(LOG_DIR.glob("requests-*.log.gz"))
+    for old in archives[:-BACKUP_COUNT]:
+        old.unlink()
+
+
+_writer = BatchWriter(_write_batch, "request-log-writer", BATCH_SIZE, FLUSH_INTERVAL)
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Ждёт, пока все поставленные в очередь записи окажутся в файле. False — не дождались."""
+    return _writer.flush(timeout)
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Дописывает очередь и останавливает фоновый поток (вызывается при выходе)."""
+    _writer.shutdown(timeout)
+
+
+atexit.register(shutdown)
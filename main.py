@@ -2,7 +2,9 @@
 
 import sys
 import logging
+import time
 from pathlib import Path
+from typing import Optional
 
 # Настройка логирования в терминал
 logging.basicConfig(
@@ -22,10 +24,11 @@ from PyQt5.QtWidgets import (
     QHBoxLayout,
     QTextEdit,
     QTextBrowser,
-    QListWidget,
-    QListWidgetItem,
+    QListView,
     QTableWidget,
     QTableWidgetItem,
+    QTableView,
+    QStyledItemDelegate,
     QPushButton,
     QLabel,
     QMessageBox,
@@ -45,32 +48,97 @@ from PyQt5.QtWidgets import (
     QMenu,
     QAction,
     QSpinBox,
+    QDoubleSpinBox,
+)
+from PyQt5.QtCore import (
+    Qt,
+    QThread,
+    QTimer,
+    QAbstractListModel,
+    QAbstractTableModel,
+    QModelIndex,
+    QSize,
+    pyqtSignal,
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont, QPalette, QColor
 
+import circuit_breaker
 import db
+import http_client
 import models as models_module
 import network
 import temp_results
 import prompt_improver
+import providers
+import rate_limiter
+import response_cache
+import settings_store
+import telemetry
 from version import __version__
 
 
+# Подписи статусов строк временной таблицы
+RESULT_STATUS_LABELS = {
+    temp_results.STATUS_PENDING: "Ожидание",
+    temp_results.STATUS_RUNNING: "Выполняется",
+    temp_results.STATUS_DONE: "Готово",
+    temp_results.STATUS_ERROR: "Ошибка",
+    temp_results.STATUS_CANCELLED: "Отменено",
+}
+
+
 class SendWorker(QThread):
     """Поток для отправки запросов без блокировки UI."""
     finished = pyqtSignal(list)  # list of {model, response, error}
-
-    def __init__(self, models: list, prompt: str):
+    model_started = pyqtSignal(int)  # индекс модели
+    delta = pyqtSignal(int, str)  # индекс модели, фрагмент ответа (потоковый режим)
+    model_finished = pyqtSignal(int, dict)  # индекс модели, {model, response, error}
+
+    def __init__(
+        self,
+        models: list,
+        prompt: str,
+        max_concurrency: int = network.DEFAULT_MAX_CONCURRENCY,
+        stream: bool = False,
+        use_cache: bool = True,
+        hedging: bool = False
+    ):
         super().__init__()
         self.models = models
         self.prompt = prompt
+        self.max_concurrency = max_concurrency
+        self.stream = stream
+        self.use_cache = use_cache
+        self.hedging = hedging
+        self.cancel_token = network.CancelToken()
+        self.model_tokens = [self.cancel_token.child() for _ in models]
+
+    def cancel(self):
+        """Отменяет все запросы пакета (открытые соединения закрываются сразу)."""
+        self.cancel_token.cancel()
+
+    def cancel_model(self, index: int):
+        """Отменяет запрос к одной модели."""
+        if 0 <= index < len(self.model_tokens):
+            self.model_tokens[index].cancel()
 
     def run(self):
         log.info("Отправка запроса в %d моделей...", len(self.models))
         for m in self.models:
             log.info("  → %s", m["name"])
-        results = network.send_prompt_to_models(self.models, self.prompt)
+        results = network.send_prompt_to_models(
+            self.models,
+            self.prompt,
+            max_concurrency=self.max_concurrency,
+            on_delta=self.delta.emit if self.stream else None,
+            on_start=self.model_started.emit,
+            on_result=self.model_finished.emit,
+            use_cache=self.use_cache,
+            hedging=self.hedging,
+            hedge_percentile=get_hedge_percentile(),
+            cancel=self.cancel_token,
+            model_cancels=self.model_tokens,
+        )
         ok = sum(1 for r in results if r["error"] is None)
         log.info("Получено ответов: %d/%d", ok, len(results))
         for r in results:
@@ -81,30 +149,368 @@ class SendWorker(QThread):
         self.finished.emit(results)
 
 
-class ImproveWorker(QThread):
-    """Поток для улучшения промта."""
-    finished = pyqtSignal(object, object)  # result, error
+# Пауза после ввода в поле поиска перед запуском поиска, мс
+SEARCH_DEBOUNCE_MS = 250
+
+# Сколько промтов загружать в список истории за одну страницу
+PROMPTS_PAGE_SIZE = 200
+
 
-    def __init__(self, original: str, model: dict):
+class PromptPageWorker(QThread):
+    """
+    Поток загрузки страницы истории промтов (или результатов поиска).
+    generation — номер запроса, по нему модель отбрасывает устаревшие страницы.
+    """
+    page_loaded = pyqtSignal(int, list)  # generation, превью промтов
+    page_failed = pyqtSignal(int, str)  # generation, текст ошибки
+
+    def __init__(self, generation: int, search: str, after: Optional[tuple] = None, offset: int = 0):
+        super().__init__()
+        self.generation = generation
+        self.search = search
+        self.after = after
+        self.offset = offset
+        self._cancelled = False
+        self._interrupt = None
+
+    def cancel(self):
+        """Прерывает загрузку: выполняющийся SQL-запрос останавливается, страница не отправляется."""
+        self._cancelled = True
+        if self._interrupt is not None:
+            self._interrupt()
+
+    def run(self):
+        try:
+            self._interrupt = db.get_interrupter()
+            if self._cancelled:
+                return
+            if self.search:
+                rows = db.search_prompts(self.search, PROMPTS_PAGE_SIZE, self.offset)
+            else:
+                rows = db.get_prompt_previews(PROMPTS_PAGE_SIZE, self.after)
+            if not self._cancelled:
+                self.page_loaded.emit(self.generation, rows)
+        except Exception as e:
+            if not self._cancelled:
+                log.error("Ошибка загрузки истории промтов: %s", e)
+                self.page_failed.emit(self.generation, str(e))
+        finally:
+            db.close_connection()
+
+
+class PromptListModel(QAbstractListModel):
+    """
+    История промтов для QListView. Страницы подгружаются в фоне по мере прокрутки
+    (canFetchMore/fetchMore); в памяти — только id и короткие превью,
+    полный текст читается из БД при выборе промта.
+    """
+    PromptIdRole = Qt.UserRole
+    load_failed = pyqtSignal(str)  # текст ошибки загрузки страницы
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: list[dict] = []
+        self._search = ""
+        self._generation = 0
+        self._loading = False
+        self._exhausted = False
+        self._workers: list[PromptPageWorker] = []
+
+    def set_search(self, search: str) -> None:
+        """Сбрасывает список и начинает загрузку заново (с первой страницы)."""
+        self._generation += 1
+        for worker in self._workers:
+            worker.cancel()
+        self.beginResetModel()
+        self._search = search
+        self._rows = []
+        self._loading = False
+        self._exhausted = False
+        self.endResetModel()
+        self._request_page()
+
+    def reload(self) -> None:
+        self.set_search(self._search)
+
+    def _request_page(self) -> None:
+        if self._loading or self._exhausted:
+            return
+        self._loading = True
+        after = None
+        if self._rows:
+            last = self._rows[-1]
+            after = (last["created_at"], last["id"])
+        worker = PromptPageWorker(self._generation, self._search, after, len(self._rows))
+        worker.page_loaded.connect(self._on_page_loaded)
+        worker.page_failed.connect(self._on_page_failed)
+        worker.finished.connect(lambda w=worker: self._workers.remove(w))
+        self._workers.append(worker)
+        worker.start()
+
+    def _on_page_loaded(self, generation: int, rows: list) -> None:
+        if generation != self._generation:
+            return  # пока шла загрузка, запрос изменился
+        self._loading = False
+        self._exhausted = len(rows) < PROMPTS_PAGE_SIZE
+        if rows:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+
+    def _on_page_failed(self, generation: int, error: str) -> None:
+        if generation != self._generation:
+            return
+        # Дальше не подгружаем (запрос упадёт снова); новый поиск или reload() начнут заново
+        self._loading = False
+        self._exhausted = True
+        self.load_failed.emit(error)
+
+    def cancel_all(self) -> None:
+        """Прерывает загрузку (при закрытии окна)."""
+        self._generation += 1
+        for worker in self._workers:
+            worker.cancel()
+            worker.wait(2000)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._loading and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            self._request_page()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        p = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            text = " ".join(p["preview"].split())
+            if p["truncated"]:
+                text += "..."
+            snippet = " ".join(p.get("snippet", "").split())
+            if snippet and p.get("matched_in") == "response":
+                text += f"\n  в ответе: {snippet}"
+            return text
+        if role == Qt.ToolTipRole:
+            return " ".join(p.get("snippet", "").split()) or None
+        if role == self.PromptIdRole:
+            return p["id"]
+        return None
+
+
+# Сколько строк ответа показывать в таблице результатов (полностью — «Открыть»)
+RESPONSE_PREVIEW_LINES = 4
+
+# Сколько символов ответа передавать в таблицу для превью
+RESPONSE_PREVIEW_CHARS = 2000
+
+
+class ResultsTableModel(QAbstractTableModel):
+    """
+    Таблица результатов поверх temp_results: чекбокс, модель, статус, превью ответа.
+    Виджеты на строки не создаются; модель подписана на изменения временной таблицы
+    и обновляет только изменившиеся строки.
+    """
+    COL_SELECTED, COL_MODEL, COL_STATUS, COL_RESPONSE = range(4)
+    HEADERS = ["", "Модель", "Статус", "Ответ"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._results = temp_results.get_result_set()
+        self._results.subscribe(self._on_results_changed)
+
+    def detach(self) -> None:
+        """Отписывается от временной таблицы (при закрытии окна)."""
+        self._results.unsubscribe(self._on_results_changed)
+
+    def _on_results_changed(self, event: str, row: int) -> None:
+        if event == temp_results.EVENT_RESET:
+            self.beginResetModel()
+            self.endResetModel()
+        elif event == temp_results.EVENT_TEXT:
+            index = self.index(row, self.COL_RESPONSE)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+        else:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._results)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        r = self._results.get(index.row())
+        if index.column() == self.COL_SELECTED and r is not None and r.is_finished:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        r = self._results.get(index.row()) if index.isValid() else None
+        if r is None:
+            return None
+        column = index.column()
+        if column == self.COL_SELECTED:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if r.selected else Qt.Unchecked
+            return None
+        if role == Qt.TextAlignmentRole and column == self.COL_RESPONSE:
+            return int(Qt.AlignTop | Qt.AlignLeft)
+        if role != Qt.DisplayRole:
+            return None
+        if column == self.COL_MODEL:
+            return r.model_name
+        if column == self.COL_STATUS:
+            status = RESULT_STATUS_LABELS.get(r.status, r.status)
+            if r.attempts > 1:
+                status += f" (попыток: {r.attempts})"
+            if r.winner != r.model_name:
+                status += f" через {r.winner}"
+            if r.cached:
+                status += " (из кэша)"
+            return status
+        if column == self.COL_RESPONSE:
+            return r.response[:RESPONSE_PREVIEW_CHARS]
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.column() != self.COL_SELECTED or role != Qt.CheckStateRole:
+            return False
+        temp_results.set_selected(index.row(), value == Qt.Checked)
+        return True
+
+
+class ElidedTextDelegate(QStyledItemDelegate):
+    """
+    Рисует первые max_lines строк текста, обрезая каждую по ширине ячейки.
+    Высота строки не зависит от длины ответа, поэтому таблицу не нужно измерять целиком.
+    """
+
+    def __init__(self, max_lines: int = RESPONSE_PREVIEW_LINES, parent=None):
+        super().__init__(parent)
+        self.max_lines = max_lines
+
+    def paint(self, painter, option, index):
+        self.initStyleOption(option, index)
+        width = max(0, option.rect.width() - 8)
+        lines = option.text.splitlines()
+        shown = [option.fontMetrics.elidedText(line, Qt.ElideRight, width) for line in lines[:self.max_lines]]
+        if len(lines) > self.max_lines and shown:
+            shown[-1] = option.fontMetrics.elidedText(shown[-1] + " …", Qt.ElideRight, width)
+        option.text = "\n".join(shown)
+        option.features &= ~option.WrapText
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(style.CE_ItemViewItem, option, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), option.fontMetrics.lineSpacing() * self.max_lines + 8)
+
+
+class SaveWorker(QThread):
+    """Поток сохранения выбранных ответов в БД (одной транзакцией)."""
+    finished = pyqtSignal(int, object)  # количество сохранённых, ошибка (str или None)
+
+    def __init__(self, prompt_id: int, rows: list):
+        super().__init__()
+        self.prompt_id = prompt_id
+        self.rows = rows
+
+    def run(self):
+        try:
+            count = db.create_results(self.prompt_id, self.rows)
+            self.finished.emit(count, None)
+        except Exception as e:
+            log.exception("Ошибка сохранения результатов")
+            self.finished.emit(0, str(e))
+        finally:
+            db.close_connection()
+
+
+class StartupWorker(QThread):
+    """
+    Подготовка при запуске в фоне, пока окно уже показано: схема БД, настройки,
+    .env, HTTP-клиент (отложенный импорт httpx), очистка кэша и телеметрии, список моделей.
+    """
+    loaded = pyqtSignal(list)  # активные модели
+
+    def run(self):
+        active_models = []
+        try:
+            db.init_db()
+            settings_store.load()
+            models_module.load_env()
+            configure_http_client()
+            http_client.preload()
+            configure_response_cache()
+            # Обслуживание телеметрии — только здесь, в фоне: на больших БД это долго
+            telemetry.prune()
+            telemetry.ensure_aggregates()
+            active_models = models_module.get_active_models()
+        except Exception:
+            log.exception("Ошибка подготовки при запуске")
+        finally:
+            db.close_connection()
+        self.loaded.emit(active_models)
+
+
+class ImproveWorker(QThread):
+    """
+    Поток улучшения промта одной или несколькими моделями параллельно.
+    Разделы ответа приходят сигналом section по мере готовности.
+    """
+    section = pyqtSignal(dict)  # событие VariantMerger.add
+    model_done = pyqtSignal(str, object)  # имя модели, ошибка (str или None)
+    finished = pyqtSignal(object, object)  # result, {имя модели: ошибка}
+
+    def __init__(self, original: str, models: list, max_concurrency: int = network.DEFAULT_MAX_CONCURRENCY):
         super().__init__()
         self.original = original
-        self.model = model
+        self.models = models
+        self.max_concurrency = max_concurrency
+        self.cancel_token = network.CancelToken()
+
+    def cancel(self):
+        self.cancel_token.cancel()
 
     def run(self):
-        result, error = prompt_improver.improve_prompt(
-            self.original, self.model
+        result, errors = prompt_improver.improve_prompt_ensemble(
+            self.original, self.models,
+            on_section=self.section.emit,
+            on_model_done=self.model_done.emit,
+            max_workers=self.max_concurrency,
+            cancel=self.cancel_token,
         )
-        self.finished.emit(result, error)
+        self.finished.emit(result, errors)
 
 
 class PromptImproverDialog(QDialog):
-    """Диалог улучшения промта с AI-ассистентом."""
+    """
+    Диалог улучшения промта с AI-ассистентом. В режиме «все активные модели»
+    промт улучшают несколько моделей сразу; разделы появляются по мере ответа,
+    одинаковые варианты объединяются, у каждого указаны модели-источники.
+    """
+
+    ADAPTED_TITLES = {"code": "Код", "analysis": "Анализ", "creative": "Креатив"}
 
     def __init__(self, original_prompt: str, prompt_edit_ref, parent=None):
         super().__init__(parent)
         self.original_prompt = original_prompt
         self.prompt_edit_ref = prompt_edit_ref
         self.result = None
+        self.worker = None
+        self._section_labels: dict[tuple, QLabel] = {}
         self.setWindowTitle("Улучшить промт")
         self.setMinimumSize(650, 550)
         self.resize(800, 600)
@@ -116,13 +522,15 @@ class PromptImproverDialog(QDialog):
         model_row = QHBoxLayout()
         model_row.addWidget(QLabel("Модель:"))
         self.model_combo = QComboBox()
-        models = models_module.get_active_models()
-        saved_id = db.get_setting("improver_model_id")
-        for i, m in enumerate(models):
-            self.model_combo.addItem(m["name"], m)
-            if saved_id and str(m["id"]) == saved_id:
-                self.model_combo.setCurrentIndex(i)
         model_row.addWidget(self.model_combo, 1)
+        self.ensemble_check = QCheckBox()
+        self.ensemble_check.setToolTip("Отправить запрос всем активным моделям параллельно и объединить варианты")
+        self.ensemble_check.setChecked(settings_store.get_bool("improver_ensemble", False))
+        self.ensemble_check.toggled.connect(self.model_combo.setDisabled)
+        model_row.addWidget(self.ensemble_check)
+        self.fill_models(settings_store.get_int("improver_model_id"))
+        self.model_combo.setDisabled(self.ensemble_check.isChecked())
+        models_module.subscribe(self.on_models_changed)
         self.btn_start = QPushButton("Запустить")
         self.btn_start.clicked.connect(self.start_improvement)
         model_row.addWidget(self.btn_start)
@@ -135,51 +543,22 @@ class PromptImproverDialog(QDialog):
         self.original_edit.setMaximumHeight(80)
         layout.addWidget(self.original_edit)
 
+        # Вкладки: у каждого вида разделов — своя прокручиваемая колонка блоков
         self.tabs = QTabWidget()
-        self.tab_improved = QWidget()
-        tab_improved_layout = QVBoxLayout(self.tab_improved)
-        tab_improved_layout.addWidget(QLabel("Улучшенный промт:"))
-        self.improved_edit = QTextEdit()
-        self.improved_edit.setReadOnly(True)
-        tab_improved_layout.addWidget(self.improved_edit)
-        self.btn_use_improved = QPushButton("Подставить в поле ввода")
-        self.btn_use_improved.clicked.connect(lambda: self.use_text(self.improved_edit.toPlainText()))
-        tab_improved_layout.addWidget(self.btn_use_improved)
-        self.tabs.addTab(self.tab_improved, "Улучшенный")
-
-        self.tab_variants = QWidget()
-        tab_variants_layout = QVBoxLayout(self.tab_variants)
-        tab_variants_layout.addWidget(QLabel("Альтернативные варианты:"))
-        self.variants_widget = QWidget()
-        self.variants_layout = QVBoxLayout(self.variants_widget)
-        scroll = QScrollArea()
-        scroll.setWidget(self.variants_widget)
-        scroll.setWidgetResizable(True)
-        tab_variants_layout.addWidget(scroll)
-        self.tabs.addTab(self.tab_variants, "Варианты")
-
-        self.tab_adapted = QWidget()
-        tab_adapted_layout = QVBoxLayout(self.tab_adapted)
-        tab_adapted_layout.addWidget(QLabel("Адаптация под разные задачи:"))
-        self.adapted_edits = {}
-        for key, label in [("code", "Код"), ("analysis", "Анализ"), ("creative", "Креатив")]:
-            tab_adapted_layout.addWidget(QLabel(f"{label}:"))
-            edit = QTextEdit()
-            edit.setReadOnly(True)
-            edit.setMaximumHeight(100)
-            self.adapted_edits[key] = edit
-            tab_adapted_layout.addWidget(edit)
-            btn = QPushButton(f"Подставить ({label})")
-            btn.clicked.connect(lambda checked, e=edit: self.use_text(e.toPlainText()))
-            tab_adapted_layout.addWidget(btn)
-        self.tabs.addTab(self.tab_adapted, "Адаптация")
-
+        self.section_layouts: dict[tuple, QVBoxLayout] = {}
+        self.tabs.addTab(self._sections_tab("Улучшенный промт:", [("improved", "")]), "Улучшенный")
+        self.tabs.addTab(self._sections_tab("Альтернативные варианты:", [("variant", "")]), "Варианты")
+        self.tabs.addTab(self._sections_tab(
+            "Адаптация под разные задачи:", [("adapted", key) for key in self.ADAPTED_TITLES]
+        ), "Адаптация")
         layout.addWidget(self.tabs)
 
         self.progress = QProgressBar()
         self.progress.setRange(0, 0)
+        self.progress.setVisible(False)
         layout.addWidget(self.progress)
-
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
         self.error_label = QLabel()
         self.error_label.setStyleSheet("color: red;")
         self.error_label.setWordWrap(True)
@@ -189,42 +568,124 @@ class PromptImproverDialog(QDialog):
         btns.rejected.connect(self.reject)
         layout.addWidget(btns)
 
+    def _sections_tab(self, caption: str, sections: list[tuple]) -> QWidget:
+        tab = QWidget()
+        tab_layout = QVBoxLayout(tab)
+        tab_layout.addWidget(QLabel(caption))
+        content = QWidget()
+        content_layout = QVBoxLayout(content)
+        for section in sections:
+            if section[0] == "adapted":
+                content_layout.addWidget(QLabel(f"<b>{self.ADAPTED_TITLES[section[1]]}</b>"))
+            section_layout = QVBoxLayout()
+            content_layout.addLayout(section_layout)
+            self.section_layouts[section] = section_layout
+        content_layout.addStretch()
+        scroll = QScrollArea()
+        scroll.setWidget(content)
+        scroll.setWidgetResizable(True)
+        tab_layout.addWidget(scroll)
+        return tab
+
+    def fill_models(self, selected_id: Optional[int]):
+        self.model_combo.clear()
+        models = models_module.get_active_models()
+        for i, m in enumerate(models):
+            self.model_combo.addItem(m["name"], m)
+            if m["id"] == selected_id:
+                self.model_combo.setCurrentIndex(i)
+        self.ensemble_check.setText(f"Все активные ({len(models)})")
+
+    def on_models_changed(self):
+        current = self.model_combo.currentData()
+        self.fill_models(current["id"] if current else None)
+
+    def done(self, result):
+        models_module.unsubscribe(self.on_models_changed)
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+        super().done(result)
+
+    def clear_sections(self):
+        for section_layout in self.section_layouts.values():
+            while section_layout.count():
+                widget = section_layout.takeAt(0).widget()
+                if widget is not None:
+                    widget.deleteLater()
+        self._section_labels.clear()
+
     def start_improvement(self):
-        model = self.model_combo.currentData()
-        if not model:
+        ensemble = self.ensemble_check.isChecked()
+        settings_store.set_value("improver_ensemble", ensemble)
+        if ensemble:
+            models = models_module.get_active_models()
+        else:
+            model = self.model_combo.currentData()
+            models = [model] if model else []
+            if model:
+                settings_store.set_value("improver_model_id", model["id"])
+        if not models:
             self.error_label.setText("Нет активных моделей.")
             return
-        db.set_setting("improver_model_id", str(model["id"]))
         self.btn_start.setEnabled(False)
         self.progress.setVisible(True)
         self.error_label.clear()
-        self.worker = ImproveWorker(self.original_prompt, model)
+        self.clear_sections()
+        self._models_total = len(models)
+        self._models_done = 0
+        self._errors = []
+        self.status_label.setText(f"Ответили 0 из {len(models)}")
+        self.worker = ImproveWorker(self.original_prompt, models, get_max_concurrency())
+        self.worker.section.connect(self.on_section)
+        self.worker.model_done.connect(self.on_model_done)
         self.worker.finished.connect(self.on_finished)
         self.worker.start()
 
-    def on_finished(self, result: dict, error: str):
+    def _section_title(self, event: dict) -> str:
+        if event["kind"] == "improved":
+            title = "Улучшенный" if event["index"] == 0 else f"Улучшенный {event['index'] + 1}"
+        elif event["kind"] == "variant":
+            title = f"Вариант {event['index'] + 1}"
+        else:
+            title = self.ADAPTED_TITLES[event["key"]] + (f" {event['index'] + 1}" if event["index"] else "")
+        return f"{title} — {', '.join(event['sources'])}"
+
+    def on_section(self, event: dict):
+        """Новый раздел — новый блок; совпавший с уже показанным — дополняет список источников."""
+        section = (event["kind"], event["key"])
+        block_key = section + (event["index"],)
+        if not event["new"]:
+            label = self._section_labels.get(block_key)
+            if label is not None:
+                label.setText(self._section_title(event))
+            return
+        w = QWidget()
+        l = QVBoxLayout(w)
+        l.setContentsMargins(0, 0, 0, 0)
+        label = QLabel(self._section_title(event))
+        l.addWidget(label)
+        e = QTextEdit()
+        e.setReadOnly(True)
+        e.setPlainText(event["text"])
+        e.setMaximumHeight(100)
+        l.addWidget(e)
+        btn = QPushButton("Подставить")
+        btn.clicked.connect(lambda checked, t=event["text"]: self.use_text(t))
+        l.addWidget(btn)
+        self.section_layouts[section].addWidget(w)
+        self._section_labels[block_key] = label
+
+    def on_model_done(self, model_name: str, error):
+        self._models_done += 1
+        self.status_label.setText(f"Ответили {self._models_done} из {self._models_total}")
+        if error and error != network.CANCELLED_ERROR:
+            self._errors.append(f"{model_name}: {error}")
+            self.error_label.setText("\n".join(self._errors))
+
+    def on_finished(self, result: dict, errors: dict):
         self.progress.setVisible(False)
         self.btn_start.setEnabled(True)
-        if error:
-            self.error_label.setText(error)
-            return
         self.result = result
-        self.improved_edit.setPlainText(result.get("improved", ""))
-        for i, v in enumerate(result.get("variants", [])):
-            w = QWidget()
-            l = QVBoxLayout(w)
-            l.addWidget(QLabel(f"Вариант {i + 1}:"))
-            e = QTextEdit()
-            e.setReadOnly(True)
-            e.setPlainText(v)
-            e.setMaximumHeight(80)
-            l.addWidget(e)
-            btn = QPushButton("Подставить")
-            btn.clicked.connect(lambda checked, t=v: self.use_text(t))
-            l.addWidget(btn)
-            self.variants_layout.addWidget(w)
-        for key, edit in self.adapted_edits.items():
-            edit.setPlainText(result.get("adapted", {}).get(key, ""))
 
     def use_text(self, text: str):
         if self.prompt_edit_ref and text:
@@ -253,6 +714,10 @@ class MarkdownViewerDialog(QDialog):
         layout.addWidget(self.browser)
 
 
+# Через сколько мс после последнего переключения флажка «Активна» записывать изменения
+MODELS_ACTIVE_DEBOUNCE_MS = 500
+
+
 class ModelsDialog(QDialog):
     """Диалог управления моделями."""
 
@@ -260,18 +725,29 @@ class ModelsDialog(QDialog):
         super().__init__(parent)
         self.setWindowTitle("Настройка моделей")
         self.setMinimumSize(500, 400)
+        self._pending_active: dict[int, bool] = {}
+        self._active_timer = QTimer(self)
+        self._active_timer.setSingleShot(True)
+        self._active_timer.setInterval(MODELS_ACTIVE_DEBOUNCE_MS)
+        self._active_timer.timeout.connect(self.flush_active_changes)
         self.setup_ui()
         self.load_models()
+        models_module.subscribe(self.load_models)
 
     def setup_ui(self):
         layout = QVBoxLayout(self)
 
         self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(["Активна", "Название", "API URL", "API ID", "Тип"])
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(
+            ["Активна", "Название", "API URL", "API ID", "Тип", "Группа", "Состояние"]
+        )
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         layout.addWidget(self.table)
+        self.hedge_label = QLabel()
+        self.hedge_label.setWordWrap(True)
+        layout.addWidget(self.hedge_label)
 
         btn_layout = QHBoxLayout()
         btn_add = QPushButton("Добавить")
@@ -284,33 +760,65 @@ class ModelsDialog(QDialog):
         btn_layout.addWidget(btn_edit)
         btn_layout.addWidget(btn_delete)
         btn_layout.addStretch()
+        btn_stats = QPushButton("Статистика...")
+        btn_stats.clicked.connect(lambda: DashboardDialog(self).exec_())
+        btn_layout.addWidget(btn_stats)
         layout.addLayout(btn_layout)
 
     def load_models(self):
-        models = db.get_models()
+        models = models_module.get_all_models()
         self.table.setRowCount(len(models))
         for i, m in enumerate(models):
             cb = QCheckBox()
-            cb.setChecked(bool(m["is_active"]))
+            cb.setChecked(self._pending_active.get(m["id"], bool(m["is_active"])))
             cb.stateChanged.connect(lambda s, mid=m["id"]: self.toggle_active(mid, s))
             self.table.setCellWidget(i, 0, cb)
             self.table.setItem(i, 1, QTableWidgetItem(m["name"]))
             self.table.setItem(i, 2, QTableWidgetItem(m["api_url"]))
             self.table.setItem(i, 3, QTableWidgetItem(m["api_id"]))
             self.table.setItem(i, 4, QTableWidgetItem(m.get("model_type", "openai")))
+            self.table.setItem(i, 5, QTableWidgetItem(m.get("equivalence_group") or ""))
+            self.table.setItem(i, 6, self.health_item(m))
         self._models_data = models
+        self.hedge_label.setText(format_hedge_stats(db.get_hedge_stats()))
+
+    def health_item(self, model: dict) -> QTableWidgetItem:
+        """Ячейка с состоянием эндпоинта модели по данным circuit_breaker."""
+        health = circuit_breaker.get_health(model)
+        if health["calls"] == 0:
+            item = QTableWidgetItem("—")
+        elif health["state"] == circuit_breaker.STATE_OPEN:
+            item = QTableWidgetItem(f"Отключена (проверка через {health['retry_in']:.0f} с)")
+            item.setForeground(QColor(200, 0, 0))
+        elif health["state"] == circuit_breaker.STATE_HALF_OPEN:
+            item = QTableWidgetItem("Проверка")
+        else:
+            text = f"OK, ошибок {health['failure_rate']:.0%}"
+            if health["avg_latency"] is not None:
+                text += f", ~{health['avg_latency']:.1f} с"
+            item = QTableWidgetItem(text)
+        if health["last_error"]:
+            item.setToolTip(f"Последняя ошибка: {health['last_error']}")
+        return item
 
     def toggle_active(self, model_id: int, state):
-        for m in self._models_data:
-            if m["id"] == model_id:
-                db.update_model(
-                    m["id"], m["name"], m["api_url"], m["api_id"],
-                    1 if state == Qt.Checked else 0,
-                    m.get("model_type", "openai")
-                )
-                break
+        """Копит переключения флажков; в БД они пишутся одним запросом (flush_active_changes)."""
+        self._pending_active[model_id] = state == Qt.Checked
+        self._active_timer.start()
+
+    def flush_active_changes(self):
+        self._active_timer.stop()
+        changes, self._pending_active = self._pending_active, {}
+        if changes:
+            models_module.set_models_active(changes)
+
+    def done(self, result):
+        self.flush_active_changes()
+        models_module.unsubscribe(self.load_models)
+        super().done(result)
 
     def add_model(self):
+        self.flush_active_changes()
         d = ModelEditDialog(self)
         if d.exec_() == QDialog.Accepted:
             db.create_model(
@@ -318,11 +826,15 @@ class ModelsDialog(QDialog):
                 d.api_url.text(),
                 d.api_id.text(),
                 1 if d.is_active.isChecked() else 0,
-                d.model_type.currentText().lower()
+                d.model_type.currentText().lower(),
+                d.rate_limit_rps.value(),
+                d.rate_limit_burst.value(),
+                d.equivalence_group.text().strip()
             )
-            self.load_models()
+            rate_limiter.reset()
 
     def edit_model(self):
+        self.flush_active_changes()
         row = self.table.currentRow()
         if row < 0:
             QMessageBox.warning(self, "Внимание", "Выберите модель для редактирования")
@@ -336,11 +848,15 @@ class ModelsDialog(QDialog):
                 d.api_url.text(),
                 d.api_id.text(),
                 1 if d.is_active.isChecked() else 0,
-                d.model_type.currentText().lower()
+                d.model_type.currentText().lower(),
+                d.rate_limit_rps.value(),
+                d.rate_limit_burst.value(),
+                d.equivalence_group.text().strip()
             )
-            self.load_models()
+            rate_limiter.reset()
 
     def delete_model(self):
+        self.flush_active_changes()
         row = self.table.currentRow()
         if row < 0:
             QMessageBox.warning(self, "Внимание", "Выберите модель для удаления")
@@ -353,7 +869,123 @@ class ModelsDialog(QDialog):
             QMessageBox.No
         ) == QMessageBox.Yes:
             db.delete_model(m["id"])
-            self.load_models()
+
+
+# Периоды панели статистики: подпись -> длительность в секундах (None — всё время)
+DASHBOARD_WINDOWS = [
+    ("24 часа", 86400),
+    ("7 дней", 7 * 86400),
+    ("30 дней", 30 * 86400),
+    ("Всё время", None),
+]
+
+
+def _format_ms(value: Optional[float]) -> str:
+    if value is None:
+        return "—"
+    return f"{value:.0f} мс" if value < 1000 else f"{value / 1000:.2f} с"
+
+
+class DashboardWorker(QThread):
+    """Поток загрузки сводки для панели статистики: дописывает очередь телеметрии и читает агрегаты."""
+    loaded = pyqtSignal(int, list)  # generation, строки telemetry.dashboard_stats
+
+    def __init__(self, generation: int, since: Optional[float]):
+        super().__init__()
+        self.generation = generation
+        self.since = since
+
+    def run(self):
+        try:
+            telemetry.flush(1.0)
+            stats = telemetry.dashboard_stats(self.since)
+        except Exception as e:
+            log.error("Ошибка загрузки статистики запросов: %s", e)
+            stats = []
+        finally:
+            db.close_connection()
+        self.loaded.emit(self.generation, stats)
+
+
+class DashboardDialog(QDialog):
+    """Статистика запросов по моделям: задержки, время до первого токена, ошибки, скорость."""
+
+    COLUMNS = ["Модель", "Попыток", "Ошибки", "Отменено", "p50", "p95", "p99", "TTFT p50", "TTFT p95", "Токен/с"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика запросов")
+        self.setMinimumSize(800, 400)
+        self._generation = 0
+        self._workers: list[DashboardWorker] = []
+        self.setup_ui()
+        self.load_stats()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        top.addWidget(QLabel("Период:"))
+        self.window_combo = QComboBox()
+        for title, seconds in DASHBOARD_WINDOWS:
+            self.window_combo.addItem(title, seconds)
+        self.window_combo.currentIndexChanged.connect(self.load_stats)
+        top.addWidget(self.window_combo)
+        top.addStretch()
+        btn_refresh = QPushButton("Обновить")
+        btn_refresh.clicked.connect(self.load_stats)
+        top.addWidget(btn_refresh)
+        layout.addLayout(top)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        layout.addWidget(self.table)
+        note = QLabel(
+            "Попытки — HTTP-запросы с повторами и отменёнными; доля ошибок считается без отменённых "
+            "(«Стоп», проигравший маршрут хеджирования). Задержки — по успешным попыткам, "
+            "с точностью около 10%; период округляется до часа."
+        )
+        note.setWordWrap(True)
+        layout.addWidget(note)
+
+    def load_stats(self):
+        """Запрашивает сводку за выбранный период в фоне (GUI не ждёт записи телеметрии)."""
+        self._generation += 1
+        seconds = self.window_combo.currentData()
+        since = time.time() - seconds if seconds else None
+        worker = DashboardWorker(self._generation, since)
+        worker.loaded.connect(self.on_stats_loaded)
+        worker.finished.connect(lambda w=worker: self._workers.remove(w))
+        self._workers.append(worker)
+        worker.start()
+
+    def done(self, result):
+        self._generation += 1
+        for worker in self._workers:
+            worker.wait(2000)
+        super().done(result)
+
+    def on_stats_loaded(self, generation: int, stats: list):
+        if generation != self._generation:
+            return  # пока шла загрузка, период изменился
+        self.table.setRowCount(len(stats))
+        for i, s in enumerate(stats):
+            error_rate = "—" if s["error_rate"] is None else f"{s['error_rate']:.1%} ({s['errors']})"
+            speed = "—" if s["tokens_per_sec"] is None else f"{s['tokens_per_sec']:.1f}"
+            values = [
+                s["model_name"], str(s["calls"]), error_rate, str(s["cancelled"]),
+                _format_ms(s["p50"]), _format_ms(s["p95"]), _format_ms(s["p99"]),
+                _format_ms(s["ttft_p50"]), _format_ms(s["ttft_p95"]), speed,
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(i, col, item)
 
 
 class ModelEditDialog(QDialog):
@@ -375,13 +1007,24 @@ class ModelEditDialog(QDialog):
         self.is_active = QCheckBox("Активна")
         self.is_active.setChecked(True)
         self.model_type = QComboBox()
-        self.model_type.addItems(["openai", "openrouter", "deepseek", "groq"])
+        self.model_type.addItems(providers.format_names())
+        self.rate_limit_rps = QDoubleSpinBox()
+        self.rate_limit_rps.setRange(0, 1000)
+        self.rate_limit_rps.setDecimals(2)
+        self.rate_limit_rps.setSpecialValueText("без лимита")
+        self.rate_limit_burst = QSpinBox()
+        self.rate_limit_burst.setRange(1, 1000)
+        self.equivalence_group = QLineEdit()
+        self.equivalence_group.setPlaceholderText("gpt-4o-mini (одинаковая у разных маршрутов)")
 
         layout.addRow("Название:", self.name)
         layout.addRow("API URL:", self.api_url)
         layout.addRow("API ID (переменная .env):", self.api_id)
         layout.addRow(self.is_active)
         layout.addRow("Тип API:", self.model_type)
+        layout.addRow("Лимит (запросов/с):", self.rate_limit_rps)
+        layout.addRow("Запросов подряд:", self.rate_limit_burst)
+        layout.addRow("Группа эквивалентов:", self.equivalence_group)
 
         if model:
             self.name.setText(model["name"])
@@ -391,6 +1034,9 @@ class ModelEditDialog(QDialog):
             idx = self.model_type.findText(model.get("model_type", "openai"), Qt.MatchFixedString)
             if idx >= 0:
                 self.model_type.setCurrentIndex(idx)
+            self.rate_limit_rps.setValue(model.get("rate_limit_rps") or 0.0)
+            self.rate_limit_burst.setValue(model.get("rate_limit_burst") or 1)
+            self.equivalence_group.setText(model.get("equivalence_group") or "")
 
         btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         btns.accepted.connect(self.accept)
@@ -399,7 +1045,7 @@ class ModelEditDialog(QDialog):
 
 
 class SettingsDialog(QDialog):
-    """Диалог настроек: тема и размер шрифта."""
+    """Диалог настроек: тема, размер шрифта, параметры отправки запросов."""
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -417,28 +1063,79 @@ class SettingsDialog(QDialog):
         self.font_spin.setRange(8, 24)
         self.font_spin.setSuffix(" pt")
         layout.addRow("Размер шрифта:", self.font_spin)
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 32)
+        self.concurrency_spin.setToolTip("1 — последовательная отправка")
+        layout.addRow("Параллельных запросов:", self.concurrency_spin)
+        self.stream_check = QCheckBox("Показывать ответы по мере генерации")
+        layout.addRow(self.stream_check)
+        hedge_row = QHBoxLayout()
+        self.hedge_check = QCheckBox("Дублировать долгие запросы на эквивалентный маршрут")
+        hedge_row.addWidget(self.hedge_check)
+        self.hedge_percentile_spin = QSpinBox()
+        self.hedge_percentile_spin.setRange(50, 99)
+        self.hedge_percentile_spin.setPrefix("после p")
+        self.hedge_percentile_spin.setToolTip("Перцентиль времени ответа основного маршрута")
+        hedge_row.addWidget(self.hedge_percentile_spin)
+        layout.addRow(hedge_row)
+        self.cache_check = QCheckBox("Кэшировать ответы")
+        layout.addRow(self.cache_check)
+        cache_row = QHBoxLayout()
+        self.cache_ttl_spin = QSpinBox()
+        self.cache_ttl_spin.setRange(1, 24 * 365)
+        self.cache_ttl_spin.setSuffix(" ч")
+        cache_row.addWidget(self.cache_ttl_spin)
+        btn_clear_cache = QPushButton("Очистить кэш")
+        btn_clear_cache.clicked.connect(self.clear_cache)
+        cache_row.addWidget(btn_clear_cache)
+        layout.addRow("Срок хранения кэша:", cache_row)
+        self.pool_spin = QSpinBox()
+        self.pool_spin.setRange(1, 100)
+        layout.addRow("Соединений на хост:", self.pool_spin)
+        self.keepalive_spin = QSpinBox()
+        self.keepalive_spin.setRange(0, 3600)
+        self.keepalive_spin.setSuffix(" с")
+        layout.addRow("Простой соединения:", self.keepalive_spin)
         btns = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         btns.accepted.connect(self.save_and_apply)
         btns.rejected.connect(self.reject)
         layout.addRow(btns)
 
     def load_settings(self):
-        theme = db.get_setting("theme") or "light"
+        theme, font_size = get_theme()
         self.theme_combo.setCurrentIndex(1 if theme == "dark" else 0)
-        try:
-            fs = int(db.get_setting("font_size") or "10")
-            self.font_spin.setValue(fs)
-        except ValueError:
-            self.font_spin.setValue(10)
+        self.font_spin.setValue(font_size)
+        self.concurrency_spin.setValue(get_max_concurrency())
+        self.stream_check.setChecked(get_stream_enabled())
+        self.hedge_check.setChecked(settings_store.get_bool("hedging_enabled", False))
+        self.hedge_percentile_spin.setValue(int(get_hedge_percentile()))
+        self.cache_check.setChecked(settings_store.get_bool("response_cache_enabled", False))
+        self.cache_ttl_spin.setValue(settings_store.get_int("response_cache_ttl_hours", 24))
+        self.pool_spin.setValue(settings_store.get_int("http_pool_size", http_client.DEFAULT_POOL_SIZE))
+        self.keepalive_spin.setValue(
+            settings_store.get_int("http_keepalive_expiry", int(http_client.DEFAULT_KEEPALIVE_EXPIRY))
+        )
 
     def save_and_apply(self):
-        theme = "dark" if self.theme_combo.currentIndex() == 1 else "light"
-        font_size = self.font_spin.value()
-        db.set_setting("theme", theme)
-        db.set_setting("font_size", str(font_size))
-        apply_app_theme(QApplication.instance(), theme, font_size)
+        # Тема, кэш и пул соединений применяются подписчиком MainWindow.on_settings_changed
+        settings_store.update({
+            "theme": "dark" if self.theme_combo.currentIndex() == 1 else "light",
+            "font_size": self.font_spin.value(),
+            "max_concurrency": self.concurrency_spin.value(),
+            "stream_responses": self.stream_check.isChecked(),
+            "hedging_enabled": self.hedge_check.isChecked(),
+            "hedge_percentile": self.hedge_percentile_spin.value(),
+            "response_cache_enabled": self.cache_check.isChecked(),
+            "response_cache_ttl_hours": self.cache_ttl_spin.value(),
+            "http_pool_size": self.pool_spin.value(),
+            "http_keepalive_expiry": self.keepalive_spin.value(),
+        })
         self.accept()
 
+    def clear_cache(self):
+        response_cache.clear()
+        log.info("Кэш ответов очищен")
+
 
 class AboutDialog(QDialog):
     """Диалог «О программе»."""
@@ -464,6 +1161,55 @@ class AboutDialog(QDialog):
         layout.addWidget(btns)
 
 
+def get_max_concurrency() -> int:
+    """Возвращает лимит одновременных запросов из настроек."""
+    return max(1, settings_store.get_int("max_concurrency", network.DEFAULT_MAX_CONCURRENCY))
+
+
+def get_stream_enabled() -> bool:
+    """Включён ли потоковый вывод ответов (по умолчанию — да)."""
+    return settings_store.get_bool("stream_responses", True)
+
+
+def get_hedge_percentile() -> float:
+    """Перцентиль задержки, после которой запрос дублируется на запасной маршрут."""
+    return settings_store.get_float("hedge_percentile", network.DEFAULT_HEDGE_PERCENTILE)
+
+
+def format_hedge_stats(stats: list[dict]) -> str:
+    """Строка со статистикой хеджирования по группам эквивалентов."""
+    if not stats:
+        return ""
+    parts = [
+        f"{s['equivalence_group']}: дублей {s['hedges']}, "
+        f"основной быстрее {s['primary_wins']}, запасной быстрее {s['alternate_wins']}"
+        for s in stats
+    ]
+    return "Хеджирование — " + "; ".join(parts)
+
+
+def configure_http_client():
+    """Применяет настройки пула HTTP-соединений."""
+    http_client.configure(
+        settings_store.get_int("http_pool_size", http_client.DEFAULT_POOL_SIZE),
+        settings_store.get_float("http_keepalive_expiry", http_client.DEFAULT_KEEPALIVE_EXPIRY)
+    )
+
+
+def configure_response_cache():
+    """Применяет настройки кэша ответов и удаляет его устаревшие записи."""
+    response_cache.configure(
+        settings_store.get_bool("response_cache_enabled", False),
+        settings_store.get_int("response_cache_ttl_hours", 24) * 3600.0
+    )
+    response_cache.prune()
+
+
+def get_theme() -> tuple[str, int]:
+    """(тема, размер шрифта) из настроек."""
+    return settings_store.get_str("theme", "light"), settings_store.get_int("font_size", 10)
+
+
 def apply_app_theme(app, theme: str, font_size: int = 10):
     """Применяет тему и размер шрифта ко всему приложению."""
     font = QFont()
@@ -495,10 +1241,29 @@ class MainWindow(QMainWindow):
         self.setWindowTitle(f"ChatList {__version__}")
         self.setMinimumSize(800, 600)
         self.resize(1000, 700)
+        self._stopped_workers = []
+        self._search_timer = QTimer(self)
+        self._search_timer.setSingleShot(True)
+        self._search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self._search_timer.timeout.connect(self.load_prompts)
+        self.startup_worker = None
+        settings_store.subscribe(self.on_settings_changed)
         self.setup_menu()
         self.setup_ui()
         self.load_prompts()
-        self.restore_geometry()
+
+    def start_background_init(self):
+        """Запускает подготовку при запуске (StartupWorker); вызывать после show()."""
+        self.statusBar().showMessage("Загрузка...")
+        self.startup_worker = StartupWorker()
+        self.startup_worker.loaded.connect(self.on_startup_loaded)
+        self.startup_worker.start()
+
+    def on_startup_loaded(self, active_models: list):
+        apply_app_theme(QApplication.instance(), *get_theme())
+        self.restore_geometry(settings_store.get("window_geometry"))
+        self.statusBar().showMessage(f"Активных моделей: {len(active_models)}", 5000)
+        log.info("Подготовка при запуске завершена")
 
     def setup_menu(self):
         menubar = self.menuBar()
@@ -506,6 +1271,9 @@ class MainWindow(QMainWindow):
         act_settings = QAction("Настройки...", self)
         act_settings.triggered.connect(self.open_settings)
         service.addAction(act_settings)
+        act_stats = QAction("Статистика запросов...", self)
+        act_stats.triggered.connect(self.open_dashboard)
+        service.addAction(act_stats)
         help_menu = menubar.addMenu("Справка")
         act_about = QAction("О программе", self)
         act_about.triggered.connect(self.open_about)
@@ -532,11 +1300,17 @@ class MainWindow(QMainWindow):
         right.addWidget(QLabel("Сохранённые промты:"))
         self.prompt_search = QLineEdit()
         self.prompt_search.setPlaceholderText("Поиск...")
-        self.prompt_search.textChanged.connect(self.load_prompts)
+        self.prompt_search.textChanged.connect(lambda: self._search_timer.start())
         right.addWidget(self.prompt_search)
-        self.prompts_list = QListWidget()
+        self.prompts_model = PromptListModel(self)
+        self.prompts_model.load_failed.connect(
+            lambda error: self.statusBar().showMessage(f"Ошибка загрузки истории: {error}", 10000)
+        )
+        self.prompts_list = QListView()
+        self.prompts_list.setModel(self.prompts_model)
+        self.prompts_list.setUniformItemSizes(False)
         self.prompts_list.setMaximumWidth(250)
-        self.prompts_list.itemClicked.connect(self.on_prompt_selected)
+        self.prompts_list.clicked.connect(self.on_prompt_selected)
         right.addWidget(self.prompts_list)
         prompts_crud = QHBoxLayout()
         self.btn_prompt_add = QPushButton("Добавить")
@@ -567,12 +1341,19 @@ class MainWindow(QMainWindow):
         self.btn_open = QPushButton("Открыть")
         self.btn_open.clicked.connect(self.on_open)
         self.btn_open.setEnabled(False)
+        self.btn_stop = QPushButton("Стоп")
+        self.btn_stop.clicked.connect(self.on_stop)
+        self.btn_stop.setEnabled(False)
+        self.bypass_cache = QCheckBox("Без кэша")
+        self.bypass_cache.setToolTip("Запросить свежие ответы, не используя кэш")
 
         self.progress = QProgressBar()
         self.progress.setVisible(False)
         self.progress.setRange(0, 0)  # indeterminate
 
         btn_row.addWidget(self.btn_send)
+        btn_row.addWidget(self.btn_stop)
+        btn_row.addWidget(self.bypass_cache)
         btn_row.addWidget(self.btn_save)
         btn_row.addWidget(self.btn_open)
         btn_row.addWidget(self.btn_models)
@@ -583,31 +1364,44 @@ class MainWindow(QMainWindow):
 
         # Таблица результатов
         layout.addWidget(QLabel("Результаты:"))
-        self.results_table = QTableWidget()
-        self.results_table.setColumnCount(3)
-        self.results_table.setHorizontalHeaderLabels(["", "Модель", "Ответ"])
-        self.results_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.results_model = ResultsTableModel(self)
+        self.results_table = QTableView()
+        self.results_table.setModel(self.results_model)
+        self.results_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.results_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.results_table.setWordWrap(False)
+        self.results_table.setItemDelegateForColumn(ResultsTableModel.COL_RESPONSE, ElidedTextDelegate(parent=self))
+        self.results_table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
         self.results_table.setColumnWidth(0, 40)
-        self.results_table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
-        self.results_table.verticalHeader().setMinimumSectionSize(60)
-        self.results_table.cellChanged.connect(self.on_cell_changed)
+        self.results_table.setColumnWidth(2, 100)
+        # Одинаковая высота строк по размеру превью: ничего не измеряется заранее,
+        # при необходимости строку можно растянуть вручную
+        preview_height = self.fontMetrics().lineSpacing() * RESPONSE_PREVIEW_LINES + 8
+        self.results_table.verticalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.results_table.verticalHeader().setDefaultSectionSize(max(60, preview_height))
+        self.results_table.doubleClicked.connect(self.on_open)
+        self.results_table.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.results_table.customContextMenuRequested.connect(self.show_results_menu)
         layout.addWidget(self.results_table)
 
     def load_prompts(self):
-        self.prompts_list.clear()
-        search = self.prompt_search.text().strip() if hasattr(self, "prompt_search") else None
-        prompts = db.get_prompts(search=search or None)
-        for p in prompts:
-            item = QListWidgetItem(p["prompt"][:80] + ("..." if len(p["prompt"]) > 80 else ""))
-            item.setData(Qt.UserRole, p)
-            self.prompts_list.addItem(item)
-
-    def on_prompt_selected(self, item: QListWidgetItem):
-        data = item.data(Qt.UserRole)
+        """Перезагружает историю промтов (с учётом строки поиска) в фоне."""
+        self._search_timer.stop()
+        search = self.prompt_search.text().strip() if hasattr(self, "prompt_search") else ""
+        self.prompts_model.set_search(search)
+
+    def _selected_prompt_id(self) -> Optional[int]:
+        index = self.prompts_list.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(PromptListModel.PromptIdRole)
+
+    def on_prompt_selected(self, index: QModelIndex):
+        prompt_id = index.data(PromptListModel.PromptIdRole)
+        data = db.get_prompt_by_id(prompt_id) if prompt_id is not None else None
         if data:
             self.prompt_edit.setText(data["prompt"])
             temp_results.clear()
-            self.refresh_results_table()
             self.btn_open.setEnabled(False)
 
     def on_prompt_add(self):
@@ -620,11 +1414,11 @@ class MainWindow(QMainWindow):
         log.info("Промт добавлен")
 
     def on_prompt_edit(self):
-        item = self.prompts_list.currentItem()
-        if not item:
+        prompt_id = self._selected_prompt_id()
+        if prompt_id is None:
             QMessageBox.warning(self, "Внимание", "Выберите промт для редактирования")
             return
-        data = item.data(Qt.UserRole)
+        data = db.get_prompt_by_id(prompt_id)
         if not data:
             return
         prompt = self.prompt_edit.toPlainText().strip()
@@ -636,13 +1430,10 @@ class MainWindow(QMainWindow):
         log.info("Промт обновлён")
 
     def on_prompt_delete(self):
-        item = self.prompts_list.currentItem()
-        if not item:
+        prompt_id = self._selected_prompt_id()
+        if prompt_id is None:
             QMessageBox.warning(self, "Внимание", "Выберите промт для удаления")
             return
-        data = item.data(Qt.UserRole)
-        if not data:
-            return
         if QMessageBox.question(
             self, "Подтверждение",
             "Удалить выбранный промт?",
@@ -650,7 +1441,7 @@ class MainWindow(QMainWindow):
             QMessageBox.No
         ) != QMessageBox.Yes:
             return
-        db.delete_prompt(data["id"])
+        db.delete_prompt(prompt_id)
         self.prompt_edit.clear()
         self.load_prompts()
         log.info("Промт удалён")
@@ -677,67 +1468,131 @@ class MainWindow(QMainWindow):
         temp_results.clear()
         temp_results.set_prompt_id(prompt_id)
 
+        temp_results.init_pending(active)
+
         self.btn_send.setEnabled(False)
+        self.btn_stop.setEnabled(True)
+        self.btn_save.setEnabled(False)
         self.progress.setVisible(True)
-        self.worker = SendWorker(active, prompt)
+        self.worker = SendWorker(
+            active, prompt, get_max_concurrency(), get_stream_enabled(),
+            use_cache=not self.bypass_cache.isChecked(),
+            hedging=settings_store.get_bool("hedging_enabled", False)
+        )
+        self.worker.model_started.connect(self.on_model_started)
+        self.worker.delta.connect(self.on_send_delta)
+        self.worker.model_finished.connect(self.on_model_finished)
         self.worker.finished.connect(self.on_send_finished)
         self.worker.start()
 
+    def _is_cancelled_row(self, index: int) -> bool:
+        r = temp_results.get_row(index)
+        return r is not None and r.status == temp_results.STATUS_CANCELLED
+
+    def on_model_started(self, index: int):
+        if self._is_cancelled_row(index):
+            return
+        temp_results.set_status(index, temp_results.STATUS_RUNNING)
+
+    def on_send_delta(self, index: int, text: str):
+        """Дописывает фрагмент потокового ответа в строку модели."""
+        if self._is_cancelled_row(index):
+            return
+        temp_results.append_response(index, text)
+
+    def on_model_finished(self, index: int, item: dict):
+        """Ответ одной модели готов — сразу показываем его в таблице."""
+        if self._is_cancelled_row(index):
+            return  # строку уже отменили из меню, поздний ответ не нужен
+        temp_results.set_network_result(index, item)
+        self.btn_export.setEnabled(True)
+        self.btn_open.setEnabled(True)
+
     def on_send_finished(self, results: list):
         self.btn_send.setEnabled(True)
+        self.btn_stop.setEnabled(False)
         self.progress.setVisible(False)
-        temp_results.fill_from_network_results(results)
-        self.refresh_results_table()
         self.btn_save.setEnabled(True)
         self.btn_export.setEnabled(True)
         self.btn_open.setEnabled(True)
         self.load_prompts()
 
-    def refresh_results_table(self):
-        rows = temp_results.get_all()
-        self.results_table.setRowCount(len(rows))
-        self.results_table.blockSignals(True)
-        for i, r in enumerate(rows):
-            cb = QCheckBox()
-            cb.setChecked(r["selected"])
-            cb.stateChanged.connect(lambda s, idx=i: self.on_checkbox_changed(idx, s))
-            self.results_table.setCellWidget(i, 0, cb)
-            self.results_table.setItem(i, 1, QTableWidgetItem(r["model_name"]))
-            response_item = QTableWidgetItem(r["response"])
-            response_item.setTextAlignment(Qt.AlignTop | Qt.AlignLeft)
-            self.results_table.setItem(i, 2, response_item)
-        self.results_table.resizeRowsToContents()
-        self.results_table.blockSignals(False)
-
-    def on_checkbox_changed(self, index: int, state):
-        temp_results.set_selected(index, state == Qt.Checked)
-
-    def on_cell_changed(self, row, col):
-        pass  # для синхронизации при ручном редактировании — при необходимости
+    def on_stop(self):
+        """
+        Отменяет текущую отправку. Полученные ответы остаются в таблице,
+        незавершённые строки помечаются «Отменено» (с уже полученной частью ответа).
+        Поток отправки доживает в фоне, его сигналы больше не обрабатываются.
+        """
+        worker = getattr(self, "worker", None)
+        if worker is None or not worker.isRunning():
+            return
+        log.info("Отправка отменена пользователем")
+        worker.cancel()
+        for signal in (worker.model_started, worker.delta, worker.model_finished, worker.finished):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass  # сигнал не был подключён
+        self._stopped_workers.append(worker)
+        worker.finished.connect(lambda _results, w=worker: self._stopped_workers.remove(w))
+        for i, r in enumerate(temp_results.get_all()):
+            if r.status in (temp_results.STATUS_PENDING, temp_results.STATUS_RUNNING):
+                temp_results.set_cancelled(i)
+        self.worker = None
+        self.on_send_finished([])
+
+    def show_results_menu(self, pos):
+        """Контекстное меню строки результатов: отмена запроса к одной модели."""
+        row = self.results_table.rowAt(pos.y())
+        r = temp_results.get_row(row)
+        worker = getattr(self, "worker", None)
+        if r is None or worker is None or not worker.isRunning():
+            return
+        if r.status not in (temp_results.STATUS_PENDING, temp_results.STATUS_RUNNING):
+            return
+        menu = QMenu(self)
+        act_cancel = menu.addAction(f"Остановить «{r.model_name}»")
+        if menu.exec_(self.results_table.viewport().mapToGlobal(pos)) == act_cancel:
+            worker.cancel_model(row)
+            temp_results.set_cancelled(row)
 
     def on_open(self):
-        row = self.results_table.currentRow()
+        row = self.results_table.currentIndex().row()
         if row < 0:
             QMessageBox.warning(self, "Внимание", "Выберите строку с ответом")
             return
-        rows = temp_results.get_all()
-        if row >= len(rows):
+        r = temp_results.get_row(row)
+        if r is None:
             return
-        r = rows[row]
-        MarkdownViewerDialog(r["model_name"], r["response"], self).exec_()
+        MarkdownViewerDialog(r.model_name, r.response, self).exec_()
 
     def on_save(self):
-        count = temp_results.save_selected_to_db()
-        log.info("Сохранено результатов: %d", count)
-        self.refresh_results_table()
+        prompt_id, rows = temp_results.get_rows_to_save()
+        if prompt_id is None:
+            return
         self.btn_save.setEnabled(False)
-        self.btn_export.setEnabled(False)
-        self.btn_open.setEnabled(False)
+        self.save_worker = SaveWorker(prompt_id, rows)
+        self.save_worker.finished.connect(self.on_save_finished)
+        self.save_worker.start()
+
+    def on_save_finished(self, count: int, error):
+        saved_prompt_id = self.save_worker.prompt_id
+        self.save_worker = None
+        if error:
+            # Транзакция откатилась — ничего не сохранено, таблица остаётся
+            self.btn_save.setEnabled(True)
+            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить результаты:\n{error}")
+            return
+        log.info("Сохранено результатов: %d", count)
+        # Пока шло сохранение, могла начаться новая отправка — её строки не трогаем
+        if temp_results.get_result_set().prompt_id == saved_prompt_id:
+            temp_results.clear()
+            self.btn_export.setEnabled(False)
+            self.btn_open.setEnabled(False)
         QMessageBox.information(self, "Сохранено", f"Сохранено записей: {count}")
 
     def on_export(self):
-        rows = temp_results.get_all()
-        selected = [r for r in rows if r["selected"]]
+        selected = temp_results.get_selected()
         if not selected:
             QMessageBox.warning(self, "Внимание", "Выберите строки для экспорта (чекбоксы)")
             return
@@ -752,13 +1607,13 @@ class MainWindow(QMainWindow):
 
         if path.endswith(".json"):
             import json
-            data = [{"model": r["model_name"], "response": r["response"]} for r in selected]
+            data = [{"model": r.model_name, "response": r.response} for r in selected]
             with open(path, "w", encoding="utf-8") as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         else:
             lines = []
             for r in selected:
-                lines.append(f"## {r['model_name']}\n\n{r['response']}\n\n")
+                lines.append(f"## {r.model_name}\n\n{r.response}\n\n")
             with open(path, "w", encoding="utf-8") as f:
                 f.write("\n".join(lines))
 
@@ -771,6 +1626,9 @@ class MainWindow(QMainWindow):
     def open_settings(self):
         SettingsDialog(self).exec_()
 
+    def open_dashboard(self):
+        DashboardDialog(self).exec_()
+
     def open_about(self):
         AboutDialog(self).exec_()
 
@@ -788,17 +1646,40 @@ class MainWindow(QMainWindow):
             return
         PromptImproverDialog(prompt, self.prompt_edit, self).exec_()
 
-    def restore_geometry(self):
-        geom = db.get_setting("window_geometry")
+    def restore_geometry(self, geom: Optional[str]):
         if geom:
             self.restoreGeometry(bytes.fromhex(geom))
 
     def save_geometry(self):
-        db.set_setting("window_geometry", self.saveGeometry().toHex().data().decode())
+        settings_store.set_value("window_geometry", self.saveGeometry().toHex().data().decode())
+
+    def on_settings_changed(self, keys: set):
+        """Применяет изменённые настройки сразу, без перечитывания из БД."""
+        if keys & {"theme", "font_size"}:
+            apply_app_theme(QApplication.instance(), *get_theme())
+        if keys & {"response_cache_enabled", "response_cache_ttl_hours"}:
+            configure_response_cache()
+        if keys & {"http_pool_size", "http_keepalive_expiry"}:
+            configure_http_client()
 
     def closeEvent(self, event):
         log.info("Закрытие приложения")
+        if self.startup_worker is not None:
+            self.startup_worker.wait()
+        settings_store.unsubscribe(self.on_settings_changed)
         self.save_geometry()
+        settings_store.flush()
+        self.prompts_model.cancel_all()
+        self.results_model.detach()
+        save_worker = getattr(self, "save_worker", None)
+        if save_worker is not None:
+            save_worker.wait()  # сохранение не прерываем — дожидаемся конца транзакции
+        for worker in [getattr(self, "worker", None)] + self._stopped_workers:
+            if worker is not None and worker.isRunning():
+                worker.cancel()
+                worker.wait(2000)
+        http_client.close_all()
+        db.close_connection()
         event.accept()
 
 
@@ -806,15 +1687,10 @@ def main():
     log.info("Запуск ChatList %s...", __version__)
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
-    theme = db.get_setting("theme") or "light"
-    try:
-        font_size = int(db.get_setting("font_size") or "10")
-    except ValueError:
-        font_size = 10
-    apply_app_theme(app, theme, font_size)
     window = MainWindow()
     window.show()
     log.info("Окно открыто")
+    window.start_background_init()
     sys.exit(app.exec_())
 
 
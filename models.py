@@ -1,56 +1,147 @@
-"""Логика работы с моделями нейросетей."""
+"""
+Логика работы с моделями нейросетей.
+
+Реестр моделей: таблица models читается один раз в неизменяемый снимок
+(модели — read-only отображения), который заменяется только после записи через
+db.create_model/update_model/delete_model/set_models_active. Подписчики
+(открытые диалоги) узнают об изменениях через subscribe().
+"""
 
 import os
-from typing import Optional
+import threading
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
 
 from dotenv import load_dotenv
 
 import db
 
-# Загрузка переменных из .env
-load_dotenv()
+_env_loaded = False
+
+
+def load_env() -> None:
+    """Загружает переменные из .env (один раз; при запуске — в фоне, иначе при первом запросе ключа)."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+
+class _Snapshot:
+    """Неизменяемый снимок таблицы models с готовыми выборками."""
+
+    __slots__ = ("all", "active", "by_id", "by_group")
+
+    def __init__(self, rows: list[dict]):
+        self.all = tuple(MappingProxyType(row) for row in rows)
+        self.active = tuple(m for m in self.all if m["is_active"])
+        self.by_id = {m["id"]: m for m in self.all}
+        by_group: dict[str, list] = {}
+        for m in self.all:
+            if m.get("equivalence_group"):
+                by_group.setdefault(m["equivalence_group"], []).append(m)
+        # как в db.get_equivalent_models: сначала активные, затем по имени
+        self.by_group = {
+            group: tuple(sorted(items, key=lambda m: not m["is_active"]))
+            for group, items in by_group.items()
+        }
+
+
+_snapshot: Optional[_Snapshot] = None
+_version = 0
+_lock = threading.Lock()
+_subscribers: list[Callable[[], None]] = []
+
+
+def _get_snapshot() -> _Snapshot:
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    return _reload()
+
+
+def _reload() -> _Snapshot:
+    global _snapshot
+    version = _version
+    snapshot = _Snapshot(db.get_models())
+    with _lock:
+        # пока читали, модели могли измениться — такой снимок не запоминаем
+        if version == _version:
+            _snapshot = snapshot
+    return snapshot
+
+
+def _on_models_changed() -> None:
+    global _snapshot, _version
+    with _lock:
+        _snapshot = None
+        _version += 1
+    for callback in list(_subscribers):
+        callback()
+
 
+db.subscribe_models(_on_models_changed)
 
-def get_active_models() -> list[dict]:
-    """Возвращает список активных моделей из БД."""
-    return db.get_active_models()
+
+def subscribe(callback: Callable[[], None]) -> None:
+    """
+    Подписывает на изменения моделей. callback() вызывается после записи
+    в потоке, изменившем модели (диалоги пишут из GUI-потока).
+    """
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback: Callable[[], None]) -> None:
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def get_active_models() -> list[Mapping]:
+    """Возвращает список активных моделей (из снимка реестра)."""
+    return list(_get_snapshot().active)
+
+
+def get_all_models() -> list[Mapping]:
+    """Возвращает все модели, по имени (из снимка реестра)."""
+    return list(_get_snapshot().all)
+
+
+def get_model(model_id: int) -> Optional[Mapping]:
+    """Возвращает модель по id или None."""
+    return _get_snapshot().by_id.get(model_id)
+
+
+def get_equivalent_models(model: Mapping) -> list[Mapping]:
+    """
+    Возвращает другие маршруты к той же модели (та же equivalence_group),
+    сначала активные. Пустой список, если группа не задана.
+    """
+    group = _get_snapshot().by_group.get(model.get("equivalence_group") or "", ())
+    return [m for m in group if m["id"] != model.get("id")]
 
 
-def get_all_models() -> list[dict]:
-    """Возвращает все модели из БД."""
-    return db.get_models()
+def set_models_active(changes: dict[int, bool]) -> int:
+    """Включает/выключает несколько моделей одной записью в БД: {model_id: is_active}."""
+    return db.set_models_active(changes)
 
 
 def get_api_key(api_id: str) -> Optional[str]:
     """Возвращает API-ключ по имени переменной из .env."""
+    load_env()
     return os.getenv(api_id)
 
 
-def build_request_body(model_type: str, prompt: str, model_name: str = "") -> dict:
+def build_request_body(model_type: str, prompt: str, model_name: str = "", stream: bool = False) -> dict:
     """
-    Формирует тело запроса для разных типов API.
-    model_type: openai, deepseek, groq
+    Формирует тело запроса с одним сообщением пользователя в формате model_type
+    (см. providers; для отправки network использует готовые шаблоны providers.get_template).
+    stream=True — потоковый ответ (SSE), фрагменты приходят по мере генерации.
     """
-    model_type = (model_type or "openai").lower()
-
-    # Базовый формат OpenAI-совместимый (используют OpenAI, DeepSeek, Groq и др.)
-    body = {
-        "model": model_name or "gpt-4o-mini",
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": 4096,
-    }
-
-    if model_type == "groq":
-        body["model"] = model_name or "llama-3.1-8b-instant"
-    elif model_type == "deepseek":
-        body["model"] = model_name or "deepseek-chat"
-    elif model_type == "openrouter":
-        # OpenRouter: model = "openai/gpt-4o-mini", "anthropic/claude-3-sonnet" и т.д.
-        body["model"] = model_name or "openai/gpt-4o-mini"
-
-    return body
+    import providers
+    provider_format = providers.get_format(model_type)
+    return provider_format.build_body(
+        provider_format.defaults(model_name), [{"role": "user", "content": prompt}], stream
+    )
 
 
 def get_auth_header(api_id: str) -> tuple[str, str]:
@@ -1,11 +1,22 @@
 """Модуль отправки HTTP-запросов к API нейросетей."""
 
+import json
 import logging
+import threading
 import time
-import httpx
-from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
 
-from models import get_api_key, build_request_body, get_auth_header
+import circuit_breaker
+import db
+import http_client
+from http_client import httpx
+import rate_limiter
+import response_cache
+import retry
+import telemetry
+import providers
+from models import get_equivalent_models
 
 try:
     from log_requests import log_request
@@ -15,184 +26,843 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+# Максимум одновременных запросов при параллельной отправке (по умолчанию)
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Перцентиль времени ответа основного маршрута, после которого запускается запасной
+DEFAULT_HEDGE_PERCENTILE = 95.0
+
+# Задержка хеджирования, пока по маршруту нет статистики, секунды
+DEFAULT_HEDGE_DELAY = 10.0
+
+# Задержка хеджирования не меньше этого значения, секунды
+MIN_HEDGE_DELAY = 1.0
+
+CANCELLED_ERROR = telemetry.CANCELLED_ERROR
+
+# Сколько после отмены ждать завершения попытки, чтобы забрать уже полученную часть ответа, секунды
+CANCEL_GRACE = 0.2
+
 
 class NetworkError(Exception):
     """Ошибка при отправке запроса."""
     pass
 
 
-def send_prompt_to_model(
-    model: dict,
-    prompt: str,
-    timeout: float = 60.0
-) -> tuple[str, Optional[str]]:
+class CancelToken:
     """
-    Отправляет промт в одну модель.
-    model: dict с полями name, api_url, api_id, model_type
-    Возвращает (response_text, error_message).
-    error_message = None при успехе.
+    Токен кооперативной отмены запросов.
+    cancel() прерывает паузы (лимиты, повторы), сразу обрывает соединения
+    выполняющихся попыток (даже если сервер ещё не прислал заголовки) и
+    закрывает открытые ответы; ожидающие попытки возвращают управление
+    немедленно (см. _run_cancellable).
+    Отмена родителя отменяет все дочерние токены (child()).
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._responses: set = set()
+        self._connections: set = set()
+        self._callbacks: list[Callable[[], None]] = []
+        self._children: list["CancelToken"] = []
+
+    def child(self) -> "CancelToken":
+        """Создаёт дочерний токен (например, для одной модели из пакета)."""
+        token = CancelToken()
+        with self._lock:
+            self._children.append(token)
+        if self.is_cancelled():
+            token.cancel()
+        return token
+
+    def cancel(self) -> None:
+        self._event.set()
+        with self._lock:
+            connections = list(self._connections)
+            responses = list(self._responses)
+            callbacks = list(self._callbacks)
+            children = list(self._children)
+        for connection in connections:
+            connection.abort()
+        for response in responses:
+            try:
+                response.close()
+            except Exception:
+                pass
+        for callback in callbacks:
+            callback()
+        for token in children:
+            token.cancel()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """Ждёт timeout секунд или отмены. True — токен отменён."""
+        return self._event.wait(timeout)
+
+    def register(self, response: "httpx.Response") -> None:
+        """Регистрирует открытый ответ, чтобы закрыть его при отмене."""
+        with self._lock:
+            self._responses.add(response)
+        if self.is_cancelled():
+            response.close()
+
+    def unregister(self, response: "httpx.Response") -> None:
+        with self._lock:
+            self._responses.discard(response)
+
+    def register_connection(self, connection: http_client.Connection) -> None:
+        """Регистрирует соединение выполняющейся попытки, чтобы оборвать его при отмене."""
+        with self._lock:
+            self._connections.add(connection)
+        if self.is_cancelled():
+            connection.abort()
+
+    def unregister_connections(self, connections: set) -> None:
+        with self._lock:
+            self._connections.difference_update(connections)
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """callback() вызывается при отмене (сразу, если токен уже отменён)."""
+        with self._lock:
+            self._callbacks.append(callback)
+        if self.is_cancelled():
+            callback()
+
+    def remove_callback(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def _run_cancellable(cancel: Optional[CancelToken], attempt: Callable[..., "_Attempt"], *args) -> "_Attempt":
+    """
+    Выполняет попытку attempt(*args) так, чтобы отмена возвращала управление сразу.
+    Попытка идёт в отдельном потоке, вызывающий ждёт её завершения или отмены;
+    соединения попытки регистрируются в cancel и обрываются при отмене, поэтому
+    поток попытки тоже завершается, не дожидаясь сервера.
+    """
+    if cancel is None:
+        return attempt(*args)
+    result: list[_Attempt] = []
+    finished = threading.Event()
+
+    def run() -> None:
+        connections = set()
+
+        def claim(connection: http_client.Connection) -> None:
+            if connection not in connections:
+                connections.add(connection)
+                cancel.register_connection(connection)
+
+        try:
+            with http_client.watch_connections(claim):
+                result.append(attempt(*args))
+        except Exception as e:
+            result.append(_Attempt(error=str(e)))
+        finally:
+            cancel.unregister_connections(connections)
+            finished.set()
+
+    thread = threading.Thread(target=run, name="attempt", daemon=True)
+    cancel.add_callback(finished.set)
+    try:
+        thread.start()
+        finished.wait()
+    finally:
+        cancel.remove_callback(finished.set)
+    if not result:
+        # Отменено: оборванная попытка завершается за миллисекунды — забираем
+        # уже полученную часть ответа, но не ждём сервер дольше CANCEL_GRACE
+        thread.join(CANCEL_GRACE)
+    if not result:
+        return _Attempt(error=CANCELLED_ERROR)
+    return result[0]
+
+
+def _http_error(status_code: int, text: str) -> str:
+    """Текст ошибки для HTTP-статуса, отличного от 200."""
+    if status_code == 401:
+        return "Неверный API-ключ (401)"
+    if status_code == 429:
+        return "Превышен лимит запросов (429)"
+    if status_code >= 500:
+        return f"Ошибка сервера ({status_code})"
+    return f"Ошибка HTTP {status_code}: {text[:200]}"
+
+
+class _Trace:
+    """
+    Метрики одной HTTP-попытки для телеметрии. Экземпляр передаётся в httpx
+    как extensions["trace"] и получает события httpcore (подключение, TLS,
+    заголовки ответа); остальное заполняют _post_once/_stream_once.
     """
-    api_key = get_api_key(model["api_id"])
-    if not api_key:
-        log_request(model.get("name", ""), prompt, "", "API-ключ не найден")
-        return "", "API-ключ не найден. Добавьте переменную в .env"
 
-    body = build_request_body(
-        model.get("model_type", "openai"),
-        prompt,
-        model.get("name", "")
+    __slots__ = (
+        "started", "started_wall", "marks", "first_token",
+        "status_code", "request_bytes", "response_bytes", "usage",
     )
 
-    header_name, header_value = get_auth_header(model["api_id"])
-    headers = {
-        "Content-Type": "application/json",
-        header_name: header_value,
-    }
+    def __init__(self, request_bytes: int = 0):
+        self.started = time.monotonic()
+        self.started_wall = time.time()
+        self.marks: dict[str, float] = {}
+        self.first_token: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.request_bytes = request_bytes
+        self.response_bytes: Optional[int] = None
+        self.usage: dict = {}
+
+    def __call__(self, event_name: str, info: dict) -> None:
+        # "connection.connect_tcp.complete", "http11.receive_response_headers.complete", ...
+        self.marks.setdefault(event_name.split(".", 1)[-1], time.monotonic())
+
+    def on_token(self) -> None:
+        if self.first_token is None:
+            self.first_token = time.monotonic()
+
+    def _span_ms(self, start: Optional[float], end: Optional[float]) -> Optional[float]:
+        if start is None or end is None:
+            return None
+        return (end - start) * 1000.0
+
+    def to_row(self, model: dict, attempt_no: int, streamed: bool, error: Optional[str]) -> dict:
+        ended = time.monotonic()
+        marks = self.marks
+        return {
+            "model_id": model.get("id"),
+            "model_name": model.get("name", ""),
+            "api_url": model.get("api_url", ""),
+            "started_at": self.started_wall,
+            "ended_at": self.started_wall + (ended - self.started),
+            "attempt": attempt_no,
+            "streamed": 1 if streamed else 0,
+            "status_code": self.status_code,
+            "error": error,
+            # httpcore не выделяет DNS: connect_ms включает разрешение имени
+            "connect_ms": self._span_ms(marks.get("connect_tcp.started"), marks.get("connect_tcp.complete")),
+            "tls_ms": self._span_ms(marks.get("start_tls.started"), marks.get("start_tls.complete")),
+            "ttfb_ms": self._span_ms(self.started, marks.get("receive_response_headers.complete")),
+            "ttft_ms": self._span_ms(self.started, self.first_token),
+            "total_ms": self._span_ms(self.started, ended),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "prompt_tokens": self.usage.get("prompt_tokens"),
+            "completion_tokens": self.usage.get("completion_tokens"),
+            "total_tokens": self.usage.get("total_tokens") or self._total_tokens(),
+        }
+
+    def _total_tokens(self) -> Optional[int]:
+        # Не все провайдеры присылают total_tokens (Anthropic — только input/output)
+        prompt_tokens = self.usage.get("prompt_tokens")
+        completion_tokens = self.usage.get("completion_tokens")
+        if prompt_tokens is None or completion_tokens is None:
+            return None
+        return prompt_tokens + completion_tokens
+
+
+def _iter_sse_deltas(
+    response: "httpx.Response",
+    trace: Optional[_Trace] = None,
+    provider_format: Optional[providers.ProviderFormat] = None
+):
+    """
+    Разбирает поток SSE; события разбирает provider_format (по умолчанию OpenAI-совместимый:
+    фрагменты из choices[0].delta.content до "data: [DONE]").
+    Если провайдер присылает usage (обычно в последних событиях), он сохраняется в trace.
+    """
+    if provider_format is None:
+        provider_format = providers.get_format(None)
+    for line in response.iter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            continue
+        delta, usage = provider_format.parse_stream_event(data)
+        if trace is not None and usage:
+            trace.usage = {**trace.usage, **usage}
+        if delta:
+            yield delta
+
+
+class _Attempt:
+    """Итог одной попытки запроса."""
+
+    __slots__ = ("content", "error", "log_error", "retryable", "retry_after", "endpoint_down")
+
+    def __init__(
+        self,
+        content: str = "",
+        error: Optional[str] = None,
+        log_error: Optional[str] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None,
+        endpoint_down: bool = False
+    ):
+        self.content = content
+        self.error = error
+        self.log_error = log_error if log_error is not None else error
+        self.retryable = retryable
+        self.retry_after = retry_after
+        # Отказ самого эндпоинта (таймаут, нет соединения, 5xx) — учитывается circuit_breaker
+        self.endpoint_down = endpoint_down
+
 
+def _status_attempt(model: dict, response: "httpx.Response", text: str = "") -> Optional[_Attempt]:
+    """Проверяет HTTP-статус ответа (text — тело ответа для сообщения об ошибке). None — статус 200."""
+    rate_limiter.on_response(model, response.status_code, response.headers)
+    if response.status_code == 200:
+        return None
+    retry_after = None
+    if response.status_code == 429:
+        retry_after = rate_limiter.parse_retry_after(response.headers)
+    log_error = str(response.status_code) if response.status_code in (401, 429) else f"HTTP {response.status_code}"
+    return _Attempt(
+        error=_http_error(response.status_code, text),
+        log_error=log_error,
+        retryable=retry.is_retryable_status(response.status_code),
+        retry_after=retry_after,
+        endpoint_down=response.status_code >= 500,
+    )
+
+
+def _post_once(
+    model: dict,
+    payload: bytes,
+    headers: dict,
+    timeout: float,
+    cancel: Optional[CancelToken] = None,
+    trace: Optional[_Trace] = None,
+    provider_format: Optional[providers.ProviderFormat] = None
+) -> _Attempt:
+    """
+    Одна попытка обычного (не потокового) запроса; payload — тело запроса (JSON).
+    Тело ответа читается по частям, чтобы отмена могла оборвать загрузку.
+    provider_format разбирает ответ (по умолчанию — OpenAI-совместимый формат).
+    """
+    trace = trace if trace is not None else _Trace(len(payload))
     try:
-        with httpx.Client(timeout=timeout) as client:
-            response = client.post(
-                model["api_url"],
-                json=body,
-                headers=headers,
-            )
+        with http_client.use_client(model["api_url"]) as client, client.stream(
+            "POST", model["api_url"], content=payload, headers=headers, timeout=timeout,
+            extensions={"trace": trace}
+        ) as response:
+            trace.status_code = response.status_code
+            if cancel is not None:
+                cancel.register(response)
+            try:
+                chunks = []
+                for chunk in response.iter_bytes():
+                    if cancel is not None and cancel.is_cancelled():
+                        return _Attempt(error=CANCELLED_ERROR)
+                    chunks.append(chunk)
+                raw = b"".join(chunks)
+                trace.response_bytes = response.num_bytes_downloaded
+            finally:
+                if cancel is not None:
+                    cancel.unregister(response)
     except httpx.TimeoutException:
-        log_request(model.get("name", ""), prompt, "", "Таймаут")
-        return "", "Таймаут запроса"
-    except httpx.ConnectError as e:
-        log_request(model.get("name", ""), prompt, "", str(e))
-        return "", f"Ошибка подключения: {e}"
+        return _Attempt(error="Таймаут запроса", log_error="Таймаут", retryable=True, endpoint_down=True)
     except Exception as e:
-        log_request(model.get("name", ""), prompt, "", str(e))
-        return "", str(e)
+        if cancel is not None and cancel.is_cancelled():
+            return _Attempt(error=CANCELLED_ERROR)
+        if isinstance(e, (httpx.ConnectError, httpx.RemoteProtocolError)):
+            return _Attempt(error=f"Ошибка подключения: {e}", log_error=str(e), retryable=True, endpoint_down=True)
+        return _Attempt(error=str(e))
 
-    if response.status_code == 401:
-        log_request(model.get("name", ""), prompt, "", "401")
-        return "", "Неверный API-ключ (401)"
-    if response.status_code == 429:
-        log_request(model.get("name", ""), prompt, "", "429")
-        return "", "Превышен лимит запросов (429)"
-    if response.status_code >= 500:
-        log_request(model.get("name", ""), prompt, "", f"HTTP {response.status_code}")
-        return "", f"Ошибка сервера ({response.status_code})"
-    if response.status_code != 200:
-        log_request(model.get("name", ""), prompt, "", f"HTTP {response.status_code}")
-        return "", f"Ошибка HTTP {response.status_code}: {response.text[:200]}"
+    failed = _status_attempt(model, response, raw.decode("utf-8", errors="replace"))
+    if failed is not None:
+        return failed
 
     try:
-        data = response.json()
+        data = json.loads(raw)
     except Exception:
-        return "", "Некорректный ответ (не JSON)"
+        return _Attempt(error="Некорректный ответ (не JSON)")
 
-    # Извлечение текста из OpenAI-совместимого формата
-    choices = data.get("choices", [])
-    if not choices:
-        return "", "Пустой ответ от API"
+    if provider_format is None:
+        provider_format = providers.get_format(None)
+    content, trace.usage = provider_format.parse_response(data)
+    if content is None:
+        return _Attempt(error="Пустой ответ от API")
+    if not content:
+        return _Attempt(error="Пустое содержимое ответа", log_error="Пустой ответ")
+    return _Attempt(content=content.strip())
+
+
+def _stream_once(
+    model: dict,
+    payload: bytes,
+    headers: dict,
+    timeout: float,
+    on_delta: Callable[[str], None],
+    cancel: Optional[CancelToken] = None,
+    trace: Optional[_Trace] = None,
+    provider_format: Optional[providers.ProviderFormat] = None
+) -> _Attempt:
+    """
+    Одна попытка потокового запроса. Если часть ответа уже передана в on_delta,
+    попытка не повторяется (иначе текст в интерфейсе задвоится).
+    cancel — при установке чтение потока прекращается, соединение закрывается.
+    """
+    trace = trace if trace is not None else _Trace(len(payload))
+    parts = []
+    try:
+        with http_client.use_client(model["api_url"]) as client, client.stream(
+            "POST", model["api_url"], content=payload, headers=headers, timeout=timeout,
+            extensions={"trace": trace}
+        ) as response:
+            trace.status_code = response.status_code
+            if response.status_code != 200:
+                response.read()
+                trace.response_bytes = response.num_bytes_downloaded
+                return _status_attempt(model, response, response.text)
+            rate_limiter.on_response(model, response.status_code, response.headers)
+            if cancel is not None:
+                cancel.register(response)
+            try:
+                for delta in _iter_sse_deltas(response, trace, provider_format):
+                    if cancel is not None and cancel.is_cancelled():
+                        return _Attempt("".join(parts).strip(), CANCELLED_ERROR)
+                    trace.on_token()
+                    parts.append(delta)
+                    on_delta(delta)
+            finally:
+                trace.response_bytes = response.num_bytes_downloaded
+                if cancel is not None:
+                    cancel.unregister(response)
+    except httpx.TimeoutException:
+        return _Attempt(
+            "".join(parts).strip(), "Таймаут запроса", "Таймаут",
+            retryable=not parts, endpoint_down=True
+        )
+    except Exception as e:
+        if cancel is not None and cancel.is_cancelled():
+            return _Attempt("".join(parts).strip(), CANCELLED_ERROR)
+        if isinstance(e, (httpx.ConnectError, httpx.RemoteProtocolError)):
+            return _Attempt(
+                "".join(parts).strip(), f"Ошибка подключения: {e}", str(e),
+                retryable=not parts, endpoint_down=True
+            )
+        return _Attempt("".join(parts).strip(), str(e))
 
-    message = choices[0].get("message", {})
-    content = message.get("content", "")
+    content = "".join(parts).strip()
     if not content:
-        log_request(model.get("name", ""), prompt, "", "Пустой ответ")
-        return "", "Пустое содержимое ответа"
+        return _Attempt(error="Пустое содержимое ответа", log_error="Пустой ответ")
+    return _Attempt(content=content)
+
+
+def send_messages(
+    model: dict,
+    messages: list[dict],
+    timeout: float = 60.0,
+    use_cache: bool = True,
+    on_delta: Optional[Callable[[str], None]] = None,
+    log_prompt: Optional[str] = None,
+    cancel: Optional[CancelToken] = None
+) -> dict:
+    """
+    Отправляет список сообщений в модель с повторами по политике retry.get_policy(model).
+    Повторяются таймауты, ошибки соединения, 429 и 5xx; пауза — экспоненциальная
+    с джиттером, не меньше Retry-After; все попытки укладываются в policy.deadline.
+    Если эндпоинт отключён circuit_breaker (много отказов подряд), запрос сразу
+    завершается ошибкой без обращения к сети.
+    on_delta(text) — потоковый режим, фрагменты ответа по мере получения.
+    use_cache=False — не брать ответ из кэша (свежий ответ всё равно кэшируется).
+    log_prompt — текст промта для лога (по умолчанию — сами сообщения).
+    cancel — CancelToken: при отмене паузы прерываются, открытый ответ закрывается,
+    повторов больше нет; в ответе — уже полученная часть текста.
+    Возвращает {"response": str, "error": str|None, "attempts": int, "cached": bool,
+    "cancelled": bool}.
+    """
+    name = model.get("name", "")
+    if log_prompt is None:
+        log_prompt = str(messages)
+
+    template = providers.get_template(model)
+    if not template.api_key:
+        log_request(name, log_prompt, "", "API-ключ не найден")
+        return {
+            "response": "",
+            "error": "API-ключ не найден. Добавьте переменную в .env",
+            "attempts": 0,
+            "cached": False,
+        }
+
+    body = template.build(messages, stream=on_delta is not None)
 
-    log_request(model.get("name", ""), prompt, content.strip())
-    return content.strip(), None
+    cache_key = response_cache.make_key(model, body)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            log.info("Ответ %s взят из кэша", name or "?")
+            if on_delta is not None:
+                on_delta(cached)
+            return {"response": cached, "error": None, "attempts": 0, "cached": True}
+
+    headers = template.stream_headers if on_delta is not None else template.headers
+    # Тело сериализуется один раз на все попытки
+    payload = template.serialize(body)
+
+    policy = retry.get_policy(model)
+    deadline = time.monotonic() + policy.deadline
+    attempt_no = 0
+    while True:
+        attempt_no += 1
+        if cancel is not None and cancel.is_cancelled():
+            attempt = _Attempt(error=CANCELLED_ERROR)
+            attempt_no -= 1
+            break
+        wait = circuit_breaker.allow(model)
+        if wait is not None:
+            attempt = _Attempt(
+                error=f"Эндпоинт временно отключён после ошибок (проверка через {wait:.0f} с)",
+                log_error="circuit open",
+            )
+            log_request(name, log_prompt, "", attempt.log_error)
+            attempt_no -= 1
+            break
+        rate_limiter.acquire(model, cancel)
+        if cancel is not None and cancel.is_cancelled():
+            circuit_breaker.release(model)
+            attempt = _Attempt(error=CANCELLED_ERROR)
+            attempt_no -= 1
+            break
+        remaining = deadline - time.monotonic()
+        attempt_timeout = min(timeout, max(remaining, 1.0))
+        trace = _Trace(len(payload))
+        if on_delta is not None:
+            attempt = _run_cancellable(
+                cancel, _stream_once,
+                model, payload, headers, attempt_timeout, on_delta, cancel, trace, template.format
+            )
+        else:
+            attempt = _run_cancellable(
+                cancel, _post_once, model, payload, headers, attempt_timeout, cancel, trace, template.format
+            )
+        telemetry.record(trace.to_row(model, attempt_no, on_delta is not None, attempt.log_error))
+
+        if attempt.error is None:
+            circuit_breaker.record_success(model, time.monotonic() - trace.started)
+            break
+        if attempt.error == CANCELLED_ERROR:
+            circuit_breaker.release(model)
+            break
+        if attempt.endpoint_down:
+            circuit_breaker.record_failure(model, attempt.error)
+        else:
+            circuit_breaker.record_success(model)
+        log_request(name, log_prompt, "", attempt.log_error)
+        if not attempt.retryable or attempt_no >= policy.max_attempts:
+            break
+        delay = policy.backoff(attempt_no, attempt.retry_after)
+        if time.monotonic() + delay >= deadline:
+            log.warning("%s: дедлайн %.0f с исчерпан после %d попыток", name, policy.deadline, attempt_no)
+            break
+        log.info("%s: %s, повтор %d через %.1f с", name, attempt.error, attempt_no + 1, delay)
+        if cancel is not None:
+            if cancel.wait(delay):
+                attempt = _Attempt(error=CANCELLED_ERROR)
+                break
+        else:
+            time.sleep(delay)
+
+    if attempt.error is not None:
+        return {
+            "response": attempt.content,
+            "error": attempt.error,
+            "attempts": attempt_no,
+            "cached": False,
+            "cancelled": attempt.error == CANCELLED_ERROR,
+        }
+
+    log_request(name, log_prompt, attempt.content)
+    response_cache.put(cache_key, model, attempt.content)
+    return {"response": attempt.content, "error": None, "attempts": attempt_no, "cached": False}
+
+
+def send_prompt_to_model(
+    model: dict,
+    prompt: str,
+    timeout: float = 60.0,
+    use_cache: bool = True
+) -> tuple[str, Optional[str]]:
+    """
+    Отправляет промт в одну модель.
+    model: dict с полями name, api_url, api_id, model_type
+    use_cache=False — не брать ответ из кэша (свежий ответ всё равно кэшируется).
+    Возвращает (response_text, error_message).
+    error_message = None при успехе.
+    """
+    result = send_messages(
+        model,
+        [{"role": "user", "content": prompt}],
+        timeout,
+        use_cache,
+        log_prompt=prompt,
+    )
+    return result["response"], result["error"]
 
 
 def send_prompt_with_messages(
     model: dict,
     messages: list[dict],
-    timeout: float = 60.0
+    timeout: float = 60.0,
+    use_cache: bool = True
 ) -> tuple[str, Optional[str]]:
     """
     Отправляет запрос с кастомным списком сообщений (system, user, assistant).
     messages: [{"role": "system"|"user"|"assistant", "content": str}, ...]
+    use_cache=False — не брать ответ из кэша.
     Возвращает (response_text, error_message).
     """
-    api_key = get_api_key(model["api_id"])
-    if not api_key:
-        log_request(model.get("name", ""), str(messages), "", "API-ключ не найден")
-        return "", "API-ключ не найден. Добавьте переменную в .env"
+    result = send_messages(model, messages, timeout, use_cache)
+    return result["response"], result["error"]
 
-    from models import build_request_body, get_auth_header
-    body = build_request_body(
-        model.get("model_type", "openai"),
-        "",  # не используется
-        model.get("name", "")
+
+def stream_prompt_to_model(
+    model: dict,
+    prompt: str,
+    on_delta: Callable[[str], None],
+    timeout: float = 60.0,
+    use_cache: bool = True
+) -> tuple[str, Optional[str]]:
+    """
+    Отправляет промт в одну модель в потоковом режиме ("stream": true).
+    on_delta(text) вызывается для каждого полученного фрагмента ответа
+    (при попадании в кэш — один раз, с полным текстом).
+    Возвращает (полный текст ответа, error_message) как send_prompt_to_model.
+    """
+    result = send_messages(
+        model,
+        [{"role": "user", "content": prompt}],
+        timeout,
+        use_cache,
+        on_delta=on_delta,
+        log_prompt=prompt,
     )
-    body["messages"] = messages
+    return result["response"], result["error"]
 
-    header_name, header_value = get_auth_header(model["api_id"])
-    headers = {
-        "Content-Type": "application/json",
-        header_name: header_value,
-    }
 
-    try:
-        with httpx.Client(timeout=timeout) as client:
-            response = client.post(
-                model["api_url"],
-                json=body,
-                headers=headers,
-            )
-    except httpx.TimeoutException:
-        log_request(model.get("name", ""), str(messages), "", "Таймаут")
-        return "", "Таймаут запроса"
-    except httpx.ConnectError as e:
-        log_request(model.get("name", ""), str(messages), "", str(e))
-        return "", f"Ошибка подключения: {e}"
-    except Exception as e:
-        log_request(model.get("name", ""), str(messages), "", str(e))
-        return "", str(e)
+def hedge_delay(model: dict, percentile: float = DEFAULT_HEDGE_PERCENTILE) -> float:
+    """Через сколько секунд без ответа основного маршрута запускать запасной."""
+    value = circuit_breaker.latency_percentile(model, percentile)
+    if value is None:
+        return DEFAULT_HEDGE_DELAY
+    return max(MIN_HEDGE_DELAY, value)
 
-    if response.status_code == 401:
-        log_request(model.get("name", ""), str(messages), "", "401")
-        return "", "Неверный API-ключ (401)"
-    if response.status_code == 429:
-        log_request(model.get("name", ""), str(messages), "", "429")
-        return "", "Превышен лимит запросов (429)"
-    if response.status_code >= 500:
-        log_request(model.get("name", ""), str(messages), "", f"HTTP {response.status_code}")
-        return "", f"Ошибка сервера ({response.status_code})"
-    if response.status_code != 200:
-        log_request(model.get("name", ""), str(messages), "", f"HTTP {response.status_code}")
-        return "", f"Ошибка HTTP {response.status_code}: {response.text[:200]}"
 
+def send_messages_hedged(
+    model: dict,
+    alternates: list[dict],
+    messages: list[dict],
+    timeout: float = 60.0,
+    use_cache: bool = True,
+    on_delta: Optional[Callable[[str], None]] = None,
+    log_prompt: Optional[str] = None,
+    percentile: float = DEFAULT_HEDGE_PERCENTILE,
+    cancel: Optional[CancelToken] = None
+) -> dict:
+    """
+    Хеджированный запрос: если основной маршрут model не ответил за hedge_delay,
+    тот же запрос уходит на первый доступный маршрут из alternates
+    (модели той же equivalence_group). Берётся ответ, пришедший первым
+    (в потоковом режиме — первым начавший выдавать текст), второй запрос отменяется.
+    Возвращает результат send_messages с дополнительными полями
+    hedged (bool) и winner (название модели, чей ответ взят).
+    """
+    alternates = [m for m in alternates if circuit_breaker.allow_peek(m)]
+    if not alternates:
+        result = send_messages(model, messages, timeout, use_cache, on_delta, log_prompt, cancel)
+        result.update(hedged=False, winner=model.get("name", ""))
+        return result
+
+    routes = [model, alternates[0]]
+    parent = cancel if cancel is not None else CancelToken()
+    cancels = [parent.child(), parent.child()]
+    lock = threading.Lock()
+    state = {"winner": None}
+
+    def claim(index: int) -> bool:
+        with lock:
+            if state["winner"] is None:
+                state["winner"] = index
+            return state["winner"] == index
+
+    def run(index: int) -> dict:
+        def delta(text: str) -> None:
+            if claim(index):
+                on_delta(text)
+            else:
+                cancels[index].cancel()
+
+        return send_messages(
+            routes[index], messages, timeout, use_cache,
+            delta if on_delta is not None else None, log_prompt, cancels[index]
+        )
+
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
     try:
-        data = response.json()
-    except Exception:
-        return "", "Некорректный ответ (не JSON)"
+        futures = {pool.submit(run, 0): 0}
+        delay = hedge_delay(model, percentile)
+        done, _ = wait(list(futures), timeout=delay)
+        # Основной маршрут уже выдаёт текст (потоковый режим) — он победил, хедж не нужен
+        if not done and (parent.is_cancelled() or state["winner"] is not None):
+            done, _ = wait(list(futures))
+        if done:
+            result = next(iter(done)).result()
+            result.update(hedged=False, winner=model.get("name", ""))
+            return result
 
-    choices = data.get("choices", [])
-    if not choices:
-        return "", "Пустой ответ от API"
-    message = choices[0].get("message", {})
-    content = message.get("content", "")
-    if not content:
-        return "", "Пустое содержимое ответа"
-    return content.strip(), None
+        group = model.get("equivalence_group") or ""
+        log.info(
+            "%s: нет ответа за %.1f с, хедж на %s",
+            model.get("name", "?"), delay, routes[1].get("name", "?")
+        )
+        futures[pool.submit(run, 1)] = 1
+        results: dict[int, dict] = {}
+        pending = set(futures)
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                results[index] = future.result()
+                if results[index]["error"] is None and claim(index):
+                    winner = index
+                    break
+        for index, token in enumerate(cancels):
+            if index != winner:
+                token.cancel()
+
+        if winner is not None:
+            shown = winner
+        else:
+            # Оба маршрута с ошибкой — показываем ошибку того, кто начал отвечать,
+            # иначе — основного
+            shown = state["winner"] if state["winner"] is not None else 0
+        final = results[shown]
+        try:
+            db.record_hedge(group, None if winner is None else winner == 0)
+        except Exception:
+            log.exception("Не удалось записать статистику хеджирования")
+        final = dict(final)
+        final.update(
+            hedged=True,
+            winner=routes[shown].get("name", ""),
+        )
+        return final
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _send_one(
+    model: dict,
+    prompt: str,
+    timeout: float,
+    on_delta: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True,
+    hedging: bool = False,
+    hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+    cancel: Optional[CancelToken] = None
+) -> dict:
+    """Отправляет промт в одну модель и возвращает строку результата."""
+    messages = [{"role": "user", "content": prompt}]
+    try:
+        alternates = get_equivalent_models(model) if hedging else []
+        if alternates:
+            result = send_messages_hedged(
+                model, alternates, messages, timeout, use_cache, on_delta, prompt, hedge_percentile, cancel
+            )
+        else:
+            result = send_messages(
+                model, messages, timeout, use_cache, on_delta=on_delta, log_prompt=prompt, cancel=cancel
+            )
+    except Exception as e:
+        log.exception("Ошибка запроса к %s", model.get("name", "?"))
+        result = {"response": "", "error": str(e), "attempts": 0, "cached": False}
+    cancelled = result.get("cancelled", False)
+    return {
+        "model": model,
+        # у отменённого запроса сохраняется уже полученная часть ответа
+        "response": result["response"] if result["error"] is None or cancelled else "",
+        "error": result["error"],
+        "cancelled": cancelled,
+        "attempts": result["attempts"],
+        "cached": result["cached"],
+        "hedged": result.get("hedged", False),
+        "winner": result.get("winner", model.get("name", "")),
+    }
 
 
 def send_prompt_to_models(
     models: list[dict],
     prompt: str,
     timeout: float = 60.0,
-    delay_between_requests: float = 2.0
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    on_delta: Optional[Callable[[int, str], None]] = None,
+    on_start: Optional[Callable[[int], None]] = None,
+    on_result: Optional[Callable[[int, dict], None]] = None,
+    use_cache: bool = True,
+    hedging: bool = False,
+    hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+    cancel: Optional[CancelToken] = None,
+    model_cancels: Optional[list[CancelToken]] = None,
 ) -> list[dict]:
     """
-    Отправляет промт в несколько моделей последовательно с задержкой.
-    delay_between_requests — пауза в секундах между запросами (снижает риск 429).
-    Возвращает список: [{"model": dict, "response": str, "error": str|None}, ...]
-    """
-    results = []
-    for i, model in enumerate(models):
-        if i > 0:
-            log.info("Пауза %.1f с перед запросом к %s", delay_between_requests, model.get("name", "?"))
-            time.sleep(delay_between_requests)
-        response_text, error = send_prompt_to_model(model, prompt, timeout)
-        results.append({
-            "model": model,
-            "response": response_text,
-            "error": error,
-        })
-    return results
+    Отправляет промт в несколько моделей.
+    max_concurrency — сколько запросов выполняется одновременно.
+    При max_concurrency > 1 запросы уходят параллельно (пул потоков),
+    общее время ≈ времени самой медленной модели.
+    При max_concurrency <= 1 — последовательно.
+    Паузы между запросами задаёт rate_limiter — только для провайдеров,
+    у которых задан лимит или которые ответили 429.
+    Колбэки (index — номер модели в models, вызываются из рабочих потоков):
+    on_delta(index, text) — если задан, ответы запрашиваются в потоковом
+    режиме и фрагменты передаются по мере получения;
+    on_start(index) — запрос к модели начат;
+    on_result(index, item) — ответ модели получен (item как в списке ниже).
+    use_cache=False — не брать ответы из кэша (response_cache).
+    hedging=True — для моделей с группой эквивалентов (equivalence_group) при
+    долгом ответе дублировать запрос на другой маршрут (send_messages_hedged);
+    порог — hedge_percentile-й перцентиль времени ответа основного маршрута.
+    cancel — отмена всего пакета; model_cancels — токены отдельных моделей
+    (по одному на элемент models, обычно cancel.child()). Отменённые модели
+    возвращают error=CANCELLED_ERROR, cancelled=True и уже полученную часть ответа.
+    Возвращает список в порядке models:
+    [{"model": dict, "response": str, "error": str|None, "cancelled": bool, "attempts": int,
+      "cached": bool, "hedged": bool, "winner": str}, ...]
+    """
+    if not models:
+        return []
+
+    if model_cancels is None:
+        parent = cancel if cancel is not None else CancelToken()
+        model_cancels = [parent.child() for _ in models]
+
+    def run(index: int, model: dict) -> dict:
+        if on_start is not None:
+            on_start(index)
+        delta = None
+        if on_delta is not None:
+            delta = lambda text: on_delta(index, text)
+        item = _send_one(
+            model, prompt, timeout, delta, use_cache, hedging, hedge_percentile, model_cancels[index]
+        )
+        if on_result is not None:
+            on_result(index, item)
+        return item
+
+    if max_concurrency <= 1 or len(models) == 1:
+        return [run(i, model) for i, model in enumerate(models)]
+
+    workers = min(max_concurrency, len(models))
+    log.info("Параллельная отправка: %d моделей, до %d одновременно", len(models), workers)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send") as pool:
+        futures = [pool.submit(run, i, model) for i, model in enumerate(models)]
+        return [future.result() for future in futures]
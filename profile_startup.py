@@ -0,0 +1,131 @@
+"""
+Профиль холодного запуска ChatList: время импорта модулей и время до показа окна.
+
+Запуск:
+    python profile_startup.py                  # сводка в консоль
+    python profile_startup.py --runs 5         # медиана по 5 запускам
+    python profile_startup.py --json startup-profile.jsonl   # дописать результат для сравнения версий
+
+Каждый замер — отдельный процесс, поэтому кэш модулей Python не влияет на результат
+(кэш файловой системы ОС — влияет: первый запуск после загрузки системы медленнее).
+"""
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from version import __version__
+
+ROOT = Path(__file__).parent
+
+# Строка вывода python -X importtime: "import time: self [us] | cumulative | imported package"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+# Код замера времени до показа окна: печатает миллисекунды от старта процесса.
+# Выход через os._exit — без closeEvent, чтобы замер не сохранял геометрию окна в БД
+_WINDOW_MARK = "WINDOW_MS"
+_WINDOW_SNIPPET = f"""
+import os, time
+started = time.perf_counter()
+import main
+from PyQt5.QtWidgets import QApplication
+app = QApplication([])
+app.setStyle("Fusion")
+window = main.MainWindow()
+window.show()
+app.processEvents()
+print("{_WINDOW_MARK}", (time.perf_counter() - started) * 1000.0, flush=True)
+os._exit(0)
+"""
+
+
+def import_profile() -> tuple[float, list[tuple[str, float, float]]]:
+    """
+    Импортирует main в отдельном процессе с -X importtime.
+    Возвращает (общее время импорта main, мс; [(модуль, собственное мс, суммарное мс), ...]
+    для модулей, импортируемых непосредственно из main).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    modules = []
+    total_ms = 0.0
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = (len(indent) - 1) // 2
+        if depth == 0 and name == "main":
+            total_ms = int(cumulative_us) / 1000.0
+        elif depth == 1:
+            modules.append((name, int(self_us) / 1000.0, int(cumulative_us) / 1000.0))
+    return total_ms, modules
+
+
+def window_time() -> float:
+    """Время от старта интерпретатора до показа главного окна, мс (отдельный процесс)."""
+    proc = subprocess.run(
+        [sys.executable, "-c", _WINDOW_SNIPPET],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith(_WINDOW_MARK):
+            return float(line.split()[1])
+    raise RuntimeError(f"Окно не показано:\n{proc.stdout}{proc.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профиль холодного запуска ChatList")
+    parser.add_argument("--runs", type=int, default=3, help="количество замеров (берётся медиана)")
+    parser.add_argument("--top", type=int, default=15, help="сколько модулей показать")
+    parser.add_argument("--no-window", action="store_true", help="не замерять время до показа окна")
+    parser.add_argument("--json", metavar="FILE", help="дописать результат строкой JSON в файл")
+    args = parser.parse_args()
+
+    runs = max(1, args.runs)
+    totals = []
+    per_module: dict[str, list[float]] = {}
+    for _ in range(runs):
+        total_ms, modules = import_profile()
+        totals.append(total_ms)
+        for name, _self_ms, cumulative_ms in modules:
+            per_module.setdefault(name, []).append(cumulative_ms)
+    import_ms = statistics.median(totals)
+    top = sorted(
+        ((name, statistics.median(values)) for name, values in per_module.items()),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    window_ms = None if args.no_window else statistics.median(window_time() for _ in range(runs))
+
+    print(f"ChatList {__version__}, Python {sys.version.split()[0]}, замеров: {runs}")
+    print(f"Импорт main: {import_ms:.1f} мс")
+    if window_ms is not None:
+        print(f"До показа окна: {window_ms:.1f} мс")
+    print("\nМодули, импортируемые из main (суммарное время, мс):")
+    for name, ms in top:
+        print(f"  {ms:8.1f}  {name}")
+
+    if args.json:
+        record = {
+            "version": __version__,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "runs": runs,
+            "import_ms": round(import_ms, 1),
+            "window_ms": None if window_ms is None else round(window_ms, 1),
+            "modules": {name: round(ms, 1) for name, ms in top},
+        }
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"\nРезультат дописан в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
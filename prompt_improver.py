@@ -1,10 +1,22 @@
-"""AI-ассистент для улучшения промтов."""
+"""
+AI-ассистент для улучшения промтов.
 
+Улучшать можно одной моделью (improve_prompt) или несколькими параллельно
+(improve_prompt_ensemble): ответы приходят потоком, разделы разбираются по мере
+поступления, повторяющиеся варианты разных моделей объединяются с указанием источников.
+"""
+
+import difflib
+import logging
 import re
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 
 import network
 
+log = logging.getLogger(__name__)
+
 
 SYSTEM_PROMPT = """Ты — эксперт по формулировке промтов для нейросетей. Твоя задача — улучшать и переформулировать запросы пользователей.
 
@@ -47,45 +59,160 @@ def build_improvement_prompt(original_prompt: str, mode: str = "full") -> list[d
     ]
 
 
+# Заголовок раздела ответа: строка "## Название"
+_HEADER = re.compile(r"^##[ \t]+(.*)$", re.MULTILINE)
+
+# Ключи адаптаций и слова в заголовках, по которым они определяются
+ADAPTED_KEYS = {"code": "код", "analysis": "анализ", "creative": "креатив"}
+
+# Порог похожести, начиная с которого разделы разных моделей считаются одним вариантом
+DUPLICATE_SIMILARITY = 0.9
+
+
+def _empty_result() -> dict:
+    return {"improved": "", "variants": [], "adapted": {key: "" for key in ADAPTED_KEYS}}
+
+
+def _classify(title: str) -> Optional[tuple[str, str]]:
+    """(вид раздела: improved / variant / adapted, ключ адаптации) по заголовку или None."""
+    title = title.lower()
+    if "улучшен" in title:
+        return "improved", ""
+    if "вариант" in title:
+        return "variant", ""
+    for key, word in ADAPTED_KEYS.items():
+        if word in title:
+            return "adapted", key
+    return None
+
+
+class SectionParser:
+    """
+    Разбор ответа по мере поступления текста. feed() возвращает разделы, закончившиеся
+    в полученном фрагменте (раздел закончен, когда начался следующий), finish() — последний.
+    Раздел — (вид, ключ адаптации, текст), см. _classify.
+    """
+
+    __slots__ = ("_text", "_scan_pos", "_title", "_start", "_emitted")
+
+    def __init__(self):
+        self._text = ""
+        self._scan_pos = 0
+        self._title: Optional[str] = None
+        self._start = 0
+        self._emitted = 0
+
+    def feed(self, chunk: str) -> list[tuple[str, str, str]]:
+        self._text += chunk
+        sections = []
+        for match in _HEADER.finditer(self._text, self._scan_pos):
+            if match.end() == len(self._text):
+                break  # строка заголовка ещё не дописана
+            if self._title is not None:
+                sections += self._section(self._text[self._start:match.start()])
+            self._title = match.group(1).strip()
+            self._start = match.end()
+            self._scan_pos = match.end()
+        return sections
+
+    def finish(self) -> list[tuple[str, str, str]]:
+        sections = self._section(self._text[self._start:]) if self._title is not None else []
+        if not self._emitted and not sections and self._text.strip():
+            # Модель не соблюла формат — весь ответ считается улучшенным промтом
+            sections = [("improved", "", self._text.strip())]
+        return sections
+
+    def _section(self, content: str) -> list[tuple[str, str, str]]:
+        kind = _classify(self._title)
+        content = content.strip()
+        if kind is None or not content:
+            return []
+        self._emitted += 1
+        return [(kind[0], kind[1], content)]
+
+
 def _parse_improvement_response(text: str) -> dict:
     """Парсит ответ модели в структурированный формат."""
-    result = {
-        "improved": "",
-        "variants": [],
-        "adapted": {"code": "", "analysis": "", "creative": ""},
-    }
+    result = _empty_result()
     if not text or not text.strip():
         return result
-
-    # Разбиваем по заголовкам ## 
-    sections = re.split(r"\n##\s+", text, flags=re.IGNORECASE)
-    improved_done = False
-
-    for part in sections:
-        part = part.strip()
-        if not part:
-            continue
-        lines = part.split("\n")
-        title = lines[0].strip().lower()
-        content = "\n".join(lines[1:]).strip() if len(lines) > 1 else ""
-
-        if "улучшен" in title and not improved_done:
-            result["improved"] = content
-            improved_done = True
-        elif "вариант 1" in title or "вариант 2" in title or "вариант 3" in title:
+    parser = SectionParser()
+    for kind, key, content in parser.feed(text) + parser.finish():
+        if kind == "improved":
+            result["improved"] = result["improved"] or content
+        elif kind == "variant":
             result["variants"].append(content)
-        elif "код" in title:
-            result["adapted"]["code"] = content
-        elif "анализ" in title:
-            result["adapted"]["analysis"] = content
-        elif "креатив" in title:
-            result["adapted"]["creative"] = content
+        else:
+            result["adapted"][key] = content
+    return result
 
-    # Если парсинг не сработал — весь текст как improved
-    if not result["improved"] and not result["variants"]:
-        result["improved"] = text.strip()
 
-    return result
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class VariantMerger:
+    """
+    Объединяет разделы от нескольких моделей. Похожие тексты одного вида
+    (DUPLICATE_SIMILARITY) считаются одним вариантом; у варианта — список моделей-источников.
+    Потокобезопасен: add() вызывается из потоков запросов.
+    """
+
+    def __init__(self, similarity: float = DUPLICATE_SIMILARITY):
+        self.similarity = similarity
+        self._items: dict[tuple[str, str], list[dict]] = {}
+        self._lock = threading.Lock()
+
+    def _is_duplicate(self, normalized: str, other: str) -> bool:
+        if normalized == other:
+            return True
+        matcher = difflib.SequenceMatcher(None, normalized, other, autojunk=False)
+        return matcher.quick_ratio() >= self.similarity and matcher.ratio() >= self.similarity
+
+    def add(self, kind: str, key: str, text: str, source: str) -> Optional[dict]:
+        """
+        Добавляет раздел от модели source. Возвращает событие для интерфейса
+        {kind, key, index, text, sources, new} или None, если ничего не изменилось.
+        """
+        normalized = _normalize(text)
+        with self._lock:
+            items = self._items.setdefault((kind, key), [])
+            for index, item in enumerate(items):
+                if self._is_duplicate(normalized, item["normalized"]):
+                    if source in item["sources"]:
+                        return None
+                    item["sources"].append(source)
+                    return self._event(kind, key, index, item, new=False)
+            item = {"text": text, "normalized": normalized, "sources": [source]}
+            items.append(item)
+            return self._event(kind, key, len(items) - 1, item, new=True)
+
+    @staticmethod
+    def _event(kind: str, key: str, index: int, item: dict, new: bool) -> dict:
+        return {
+            "kind": kind, "key": key, "index": index,
+            "text": item["text"], "sources": list(item["sources"]), "new": new,
+        }
+
+    def result(self) -> dict:
+        """
+        Итог в формате improve_prompt (первый улучшенный, все варианты, первая адаптация
+        каждого вида) и "sections": {вид: [{text, sources}, ...]} со всеми вариантами.
+        """
+        with self._lock:
+            items = {
+                section: [{"text": item["text"], "sources": list(item["sources"])} for item in section_items]
+                for section, section_items in self._items.items()
+            }
+        result = _empty_result()
+        improved = items.get(("improved", ""), [])
+        result["improved"] = improved[0]["text"] if improved else ""
+        result["variants"] = [i["text"] for i in items.get(("variant", ""), [])]
+        for key in ADAPTED_KEYS:
+            adapted = items.get(("adapted", key), [])
+            result["adapted"][key] = adapted[0]["text"] if adapted else ""
+        result["sections"] = items
+        return result
 
 
 def improve_prompt(
@@ -101,8 +228,61 @@ def improve_prompt(
     messages = build_improvement_prompt(original)
     response_text, error = network.send_prompt_with_messages(model, messages, timeout)
     if error:
-        return (
-            {"improved": "", "variants": [], "adapted": {"code": "", "analysis": "", "creative": ""}},
-            error,
-        )
+        return _empty_result(), error
     return _parse_improvement_response(response_text), None
+
+
+def improve_prompt_ensemble(
+    original: str,
+    models: list[dict],
+    on_section: Optional[Callable[[dict], None]] = None,
+    on_model_done: Optional[Callable[[str, Optional[str]], None]] = None,
+    timeout: float = 60.0,
+    max_workers: int = network.DEFAULT_MAX_CONCURRENCY,
+    cancel: Optional[network.CancelToken] = None
+) -> tuple[dict, dict[str, str]]:
+    """
+    Улучшает промт несколькими моделями параллельно. Ответы запрашиваются потоком;
+    on_section(событие VariantMerger.add) вызывается, как только у какой-либо модели
+    закончился новый раздел или совпавший раздел получил ещё один источник;
+    on_model_done(имя модели, ошибка или None) — по завершении каждой модели.
+    Колбэки вызываются из потоков запросов.
+    Возвращает (VariantMerger.result(), {имя модели: ошибка}).
+    """
+    messages = build_improvement_prompt(original)
+    merger = VariantMerger()
+    errors: dict[str, str] = {}
+
+    def publish(sections: list[tuple[str, str, str]], source: str) -> None:
+        for kind, key, text in sections:
+            event = merger.add(kind, key, text, source)
+            if event is not None and on_section is not None:
+                on_section(event)
+
+    def run(model: dict) -> None:
+        name = model.get("name", "")
+        parser = SectionParser()
+        try:
+            error = network.send_messages(
+                model, messages, timeout,
+                on_delta=lambda delta: publish(parser.feed(delta), name),
+                log_prompt=original,
+                cancel=cancel,
+            )["error"]
+            if error is None:
+                # последний раздел при ошибке мог оборваться — его не показываем
+                publish(parser.finish(), name)
+        except Exception as e:
+            # ошибка одной модели не должна терять ответы остальных
+            log.exception("Ошибка улучшения промта моделью %s", name or "?")
+            error = str(e)
+        if error is not None:
+            errors[name] = error
+        if on_model_done is not None:
+            on_model_done(name, error)
+
+    if models:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(models)))) as pool:
+            for future in [pool.submit(run, model) for model in models]:
+                future.result()
+    return merger.result(), errors
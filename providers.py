@@ -0,0 +1,216 @@
+"""
+Адаптеры API провайдеров и готовые шаблоны запросов.
+
+Формат API (ProviderFormat) описывает заголовки авторизации, тело запроса и разбор
+ответа. Для каждой модели один раз собирается RequestTemplate: URL, заголовки с ключом,
+параметры по умолчанию, формат и сериализатор; запрос только подставляет сообщения.
+Шаблоны сбрасываются при изменении моделей (models.subscribe).
+
+Новые форматы подключаются через register_format(); model_type модели — имя формата.
+Если установлен orjson, тело запроса сериализуется им (можно отключить set_orjson(False)).
+"""
+
+import json
+import threading
+from typing import Callable, Mapping, Optional
+
+import models
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Формат, если model_type не задан или не зарегистрирован
+DEFAULT_FORMAT = "openai"
+
+# Ограничение длины ответа по умолчанию
+DEFAULT_MAX_TOKENS = 4096
+
+
+def _dumps_json(body: dict) -> bytes:
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def _dumps_orjson(body: dict) -> bytes:
+    return orjson.dumps(body)
+
+
+_serialize: Callable[[dict], bytes] = _dumps_orjson if orjson is not None else _dumps_json
+
+
+def set_orjson(enabled: bool) -> bool:
+    """Включает/выключает сериализацию через orjson. Возвращает, используется ли orjson."""
+    global _serialize
+    _serialize = _dumps_orjson if enabled and orjson is not None else _dumps_json
+    clear_templates()
+    return _serialize is _dumps_orjson
+
+
+class ProviderFormat:
+    """
+    OpenAI-совместимый формат (OpenAI, OpenRouter, DeepSeek, Groq и др.).
+    Другие форматы наследуются от него и переопределяют нужные методы.
+    """
+
+    def __init__(self, default_model: str = "gpt-4o-mini", stream_usage: bool = True):
+        self.default_model = default_model
+        # Просить usage в потоковом ответе (stream_options.include_usage): без этого
+        # OpenAI-совместимые API не присылают число токенов при stream=true
+        self.stream_usage = stream_usage
+
+    def auth_headers(self, api_key: str) -> dict:
+        return {"Authorization": f"Bearer {api_key}"}
+
+    def defaults(self, model_name: str) -> dict:
+        """Параметры тела запроса, не зависящие от сообщений."""
+        return {"model": model_name or self.default_model, "max_tokens": DEFAULT_MAX_TOKENS}
+
+    def build_body(self, defaults: dict, messages: list[dict], stream: bool) -> dict:
+        body = dict(defaults)
+        body["messages"] = messages
+        if stream:
+            body["stream"] = True
+            if self.stream_usage:
+                body["stream_options"] = {"include_usage": True}
+        return body
+
+    def parse_response(self, data: dict) -> tuple[Optional[str], dict]:
+        """(текст ответа или None, если ответ пуст; usage в виде prompt/completion/total_tokens)."""
+        choices = data.get("choices") or []
+        if not choices:
+            return None, data.get("usage") or {}
+        return (choices[0].get("message") or {}).get("content") or "", data.get("usage") or {}
+
+    def parse_stream_event(self, data: dict) -> tuple[Optional[str], dict]:
+        """(фрагмент текста или None; usage, если событие его содержит) для события SSE."""
+        choices = data.get("choices") or []
+        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+        return delta, data.get("usage") or {}
+
+
+class GroqFormat(ProviderFormat):
+    """Groq: в потоковом режиме usage приходит в последнем событии, в поле x_groq."""
+
+    def parse_stream_event(self, data: dict) -> tuple[Optional[str], dict]:
+        delta, usage = super().parse_stream_event(data)
+        return delta, usage or (data.get("x_groq") or {}).get("usage") or {}
+
+
+class AnthropicFormat(ProviderFormat):
+    """Anthropic Messages API: ключ в x-api-key, system — отдельным полем, текст — в блоках content."""
+
+    API_VERSION = "2023-06-01"
+
+    def auth_headers(self, api_key: str) -> dict:
+        return {"x-api-key": api_key, "anthropic-version": self.API_VERSION}
+
+    def build_body(self, defaults: dict, messages: list[dict], stream: bool) -> dict:
+        body = dict(defaults)
+        system = [m["content"] for m in messages if m.get("role") == "system"]
+        if system:
+            body["system"] = "\n\n".join(system)
+            messages = [m for m in messages if m.get("role") != "system"]
+        body["messages"] = messages
+        if stream:
+            body["stream"] = True
+        return body
+
+    @staticmethod
+    def _usage(usage: Optional[dict]) -> dict:
+        if not usage:
+            return {}
+        result = {}
+        if "input_tokens" in usage:
+            result["prompt_tokens"] = usage["input_tokens"]
+        if "output_tokens" in usage:
+            result["completion_tokens"] = usage["output_tokens"]
+        return result
+
+    def parse_response(self, data: dict) -> tuple[Optional[str], dict]:
+        blocks = [b.get("text", "") for b in data.get("content") or [] if b.get("type") == "text"]
+        return ("".join(blocks) if blocks else None), self._usage(data.get("usage"))
+
+    def parse_stream_event(self, data: dict) -> tuple[Optional[str], dict]:
+        kind = data.get("type")
+        if kind == "content_block_delta":
+            return (data.get("delta") or {}).get("text"), {}
+        if kind == "message_start":
+            return None, self._usage((data.get("message") or {}).get("usage"))
+        if kind == "message_delta":
+            return None, self._usage(data.get("usage"))
+        return None, {}
+
+
+_formats: dict[str, ProviderFormat] = {
+    "openai": ProviderFormat("gpt-4o-mini"),
+    "openrouter": ProviderFormat("openai/gpt-4o-mini"),
+    "deepseek": ProviderFormat("deepseek-chat"),
+    "groq": GroqFormat("llama-3.1-8b-instant", stream_usage=False),
+    "anthropic": AnthropicFormat("claude-3-5-haiku-latest"),
+}
+
+
+def register_format(name: str, provider_format: ProviderFormat) -> None:
+    """Регистрирует формат API под именем name (значение model_type модели)."""
+    _formats[name.lower()] = provider_format
+    clear_templates()
+
+
+def get_format(model_type: Optional[str]) -> ProviderFormat:
+    """Формат API для model_type (OpenAI-совместимый, если такой не зарегистрирован)."""
+    return _formats.get((model_type or DEFAULT_FORMAT).lower()) or _formats[DEFAULT_FORMAT]
+
+
+def format_names() -> list[str]:
+    """Имена зарегистрированных форматов (для выбора типа API модели)."""
+    return list(_formats)
+
+
+class RequestTemplate:
+    """Готовые части запроса к одной модели; build() подставляет только сообщения."""
+
+    __slots__ = ("url", "api_key", "headers", "stream_headers", "defaults", "format", "serialize")
+
+    def __init__(self, model: Mapping):
+        self.format = get_format(model.get("model_type"))
+        self.url = model["api_url"]
+        self.api_key = models.get_api_key(model["api_id"])
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers.update(self.format.auth_headers(self.api_key))
+        self.headers = headers
+        self.stream_headers = {**headers, "Accept": "text/event-stream"}
+        self.defaults = self.format.defaults(model.get("name", ""))
+        self.serialize = _serialize
+
+    def build(self, messages: list[dict], stream: bool = False) -> dict:
+        return self.format.build_body(self.defaults, messages, stream)
+
+
+# (id, api_url, api_id, model_type, name) -> RequestTemplate
+_templates: dict[tuple, RequestTemplate] = {}
+_lock = threading.Lock()
+
+
+def get_template(model: Mapping) -> RequestTemplate:
+    """Шаблон запроса для модели (собирается при первом обращении)."""
+    key = (
+        model.get("id"), model.get("api_url"), model.get("api_id"),
+        model.get("model_type"), model.get("name"),
+    )
+    template = _templates.get(key)
+    if template is None:
+        template = RequestTemplate(model)
+        with _lock:
+            _templates[key] = template
+    return template
+
+
+def clear_templates() -> None:
+    """Сбрасывает шаблоны (после изменения моделей, форматов или сериализатора)."""
+    with _lock:
+        _templates.clear()
+
+
+models.subscribe(clear_templates)
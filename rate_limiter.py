@@ -0,0 +1,200 @@
+"""Ограничение частоты запросов к API (token bucket по провайдерам)."""
+
+import logging
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не более burst подряд.
+    rate <= 0 — без ограничения (ждём только после 429 / исчерпания лимита).
+    """
+
+    def __init__(self, rate: float = 0.0, burst: int = 1):
+        self.rate = 0.0
+        self.burst = 1
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.configure(rate, burst)
+        self.tokens = float(self.burst)
+
+    def configure(self, rate: float, burst: int) -> None:
+        """Обновляет лимиты (берётся самый строгий из заданных моделями)."""
+        if rate <= 0:
+            return
+        burst = max(1, burst)
+        with self.lock:
+            if self.rate <= 0:
+                self.rate, self.burst = rate, burst
+            else:
+                self.rate = min(self.rate, rate)
+                self.burst = min(self.burst, burst)
+            self.tokens = min(self.tokens, float(self.burst))
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Пытается взять токен. Возвращает 0, если токен получен,
+        иначе — сколько секунд подождать до следующей попытки.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.rate <= 0:
+                return 0.0
+            self._refill(now)
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    def block_for(self, seconds: float) -> None:
+        """Запрещает запросы на seconds секунд (после 429 или исчерпания лимита)."""
+        with self.lock:
+            until = time.monotonic() + seconds
+            if until > self.blocked_until:
+                self.blocked_until = until
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+
+_buckets: dict[tuple[str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+# Пауза после 429, если сервер не сообщил, сколько ждать
+DEFAULT_RETRY_AFTER = 5.0
+
+# Не ждём дольше этого значения, даже если сервер просит больше
+MAX_BLOCK_SECONDS = 120.0
+
+
+def bucket_key(model: dict) -> tuple[str, str]:
+    """Ключ корзины: хост api_url + api_id (лимиты провайдера на один ключ)."""
+    host = urlsplit(model.get("api_url", "")).netloc.lower()
+    return host, model.get("api_id", "")
+
+
+def get_bucket(model: dict) -> TokenBucket:
+    """Возвращает (создаёт при необходимости) корзину для модели."""
+    key = bucket_key(model)
+    rate = float(model.get("rate_limit_rps") or 0.0)
+    burst = int(model.get("rate_limit_burst") or 1)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            _buckets[key] = bucket
+            return bucket
+    bucket.configure(rate, burst)
+    return bucket
+
+
+def acquire(model: dict, cancel=None) -> float:
+    """
+    Блокирует поток, пока лимит провайдера не позволит отправить запрос.
+    cancel — объект с методом wait(timeout) -> bool (network.CancelToken):
+    ожидание прерывается, если wait вернул True.
+    Возвращает суммарное время ожидания в секундах.
+    """
+    bucket = get_bucket(model)
+    waited = 0.0
+    while True:
+        delay = bucket.reserve()
+        if delay <= 0:
+            if waited > 0:
+                log.info("Лимит %s: ожидание %.1f с", bucket_key(model)[0], waited)
+            return waited
+        if cancel is not None:
+            if cancel.wait(delay):
+                return waited
+        else:
+            time.sleep(delay)
+        waited += delay
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """
+    Разбирает длительность из заголовков: "2", "1.5", "20ms", "6m0s", "1h2m3.5s".
+    """
+    value = (value or "").strip().lower()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(num) * scale[unit] for num, unit in parts)
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Возвращает паузу в секундах из Retry-After / x-ratelimit-reset-* или None."""
+    value = headers.get("retry-after")
+    if value:
+        seconds = _parse_duration(value)
+        if seconds is not None:
+            return seconds
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    resets = []
+    for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens", "x-ratelimit-reset"):
+        seconds = _parse_duration(headers.get(name, ""))
+        if seconds is None:
+            continue
+        # OpenRouter и др. присылают момент сброса (Unix-время, иногда в мс)
+        if seconds > 1e12:
+            seconds = seconds / 1000.0 - time.time()
+        elif seconds > 1e9:
+            seconds -= time.time()
+        resets.append(max(0.0, seconds))
+    return max(resets) if resets else None
+
+
+def on_response(model: dict, status_code: int, headers) -> None:
+    """
+    Подстраивает лимит по ответу сервера:
+    429 — пауза по Retry-After (или DEFAULT_RETRY_AFTER);
+    x-ratelimit-remaining-* = 0 — пауза до сброса лимита.
+    """
+    if status_code == 429:
+        delay = parse_retry_after(headers)
+        delay = DEFAULT_RETRY_AFTER if delay is None else delay
+    else:
+        remaining = [
+            headers.get(name)
+            for name in ("x-ratelimit-remaining-requests", "x-ratelimit-remaining")
+        ]
+        if not any(r is not None and r.strip() == "0" for r in remaining):
+            return
+        delay = parse_retry_after(headers)
+        if delay is None:
+            return
+    delay = min(delay, MAX_BLOCK_SECONDS)
+    if delay > 0:
+        log.warning("Лимит %s исчерпан, пауза %.1f с", bucket_key(model)[0], delay)
+        get_bucket(model).block_for(delay)
+
+
+def reset() -> None:
+    """Сбрасывает все корзины (например, после изменения моделей)."""
+    with _buckets_lock:
+        _buckets.clear()
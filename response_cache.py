@@ -0,0 +1,109 @@
+"""Кэш ответов моделей: LRU в памяти + SQLite (таблица response_cache) с TTL."""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import db
+
+log = logging.getLogger(__name__)
+
+# Сколько ответов держать в памяти
+MEMORY_MAX_ENTRIES = 200
+
+# Сколько ответов хранить в БД
+PERSISTENT_MAX_ENTRIES = 2000
+
+# Время жизни ответа в кэше по умолчанию, секунды
+DEFAULT_TTL = 24 * 3600.0
+
+# Кэш необязателен: включается в настройках
+enabled = False
+ttl = DEFAULT_TTL
+
+# key -> (created_at, response)
+_memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def configure(is_enabled: bool = False, ttl_seconds: float = DEFAULT_TTL) -> None:
+    """Включает/выключает кэш и задаёт время жизни записей."""
+    global enabled, ttl
+    enabled = is_enabled
+    ttl = max(0.0, ttl_seconds)
+
+
+def make_key(model: dict, body: dict) -> str:
+    """
+    Ключ кэша: хэш URL модели и нормализованного тела запроса.
+    Поле stream не влияет на ключ — ответ один и тот же.
+    """
+    normalized = {k: v for k, v in body.items() if k != "stream"}
+    raw = json.dumps(
+        [model.get("api_url", ""), normalized],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    """Возвращает ответ из кэша или None (промах, запись устарела, кэш выключен)."""
+    if not enabled:
+        return None
+    min_created_at = time.time() - ttl
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            if entry[0] >= min_created_at:
+                _memory.move_to_end(key)
+                return entry[1]
+            del _memory[key]
+    try:
+        entry = db.get_cached_response(key, min_created_at)
+    except Exception:
+        log.exception("Ошибка чтения кэша ответов")
+        return None
+    if entry is None:
+        return None
+    # В памяти запись живёт столько же, сколько в БД: возраст считается от created_at
+    created_at, response = entry
+    _remember(key, created_at, response)
+    return response
+
+
+def put(key: str, model: dict, response: str) -> None:
+    """Кладёт успешный ответ в оба уровня кэша."""
+    if not enabled or not response:
+        return
+    now = time.time()
+    _remember(key, now, response)
+    try:
+        db.put_cached_response(key, model.get("name", ""), response, now, PERSISTENT_MAX_ENTRIES)
+    except Exception:
+        log.exception("Ошибка записи кэша ответов")
+
+
+def _remember(key: str, created_at: float, response: str) -> None:
+    with _lock:
+        _memory[key] = (created_at, response)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_MAX_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def clear() -> None:
+    """Очищает кэш в памяти и в БД."""
+    with _lock:
+        _memory.clear()
+    db.clear_response_cache()
+
+
+def prune() -> int:
+    """Удаляет устаревшие записи из БД. Возвращает количество удалённых."""
+    return db.delete_expired_responses(time.time() - ttl)
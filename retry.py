@@ -0,0 +1,76 @@
+"""Политика повторных запросов: экспоненциальная пауза с джиттером и общий дедлайн."""
+
+import random
+from typing import Optional
+
+
+# HTTP-статусы, после которых имеет смысл повторить запрос
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """
+    Параметры повторов для одного типа моделей.
+    max_attempts — всего попыток (1 — без повторов);
+    base_delay, max_delay — пауза перед попыткой n: base_delay * 2**(n-1), не больше max_delay,
+    со случайным джиттером (full jitter);
+    deadline — сколько секунд всего может занять запрос к модели со всеми повторами.
+    """
+
+    __slots__ = ("max_attempts", "base_delay", "max_delay", "deadline")
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 20.0,
+        deadline: float = 120.0
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.deadline = deadline
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Пауза перед следующей попыткой после неудачной попытки номер attempt (с 1).
+        Если сервер прислал Retry-After, ждём не меньше указанного.
+        """
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def __repr__(self) -> str:
+        return (
+            f"RetryPolicy(max_attempts={self.max_attempts}, base_delay={self.base_delay}, "
+            f"max_delay={self.max_delay}, deadline={self.deadline})"
+        )
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+# Политики по model_type; для остальных типов — DEFAULT_POLICY
+_policies: dict[str, RetryPolicy] = {
+    # Бесплатные модели OpenRouter часто отвечают 429 — даём больше времени
+    "openrouter": RetryPolicy(max_attempts=4, base_delay=2.0, max_delay=30.0, deadline=180.0),
+    # Groq отвечает быстро, повторы имеют смысл почти сразу
+    "groq": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=10.0, deadline=60.0),
+}
+
+
+def get_policy(model: dict) -> RetryPolicy:
+    """Возвращает политику повторов для модели по её model_type."""
+    model_type = (model.get("model_type") or "openai").lower()
+    return _policies.get(model_type, DEFAULT_POLICY)
+
+
+def set_policy(model_type: str, policy: RetryPolicy) -> None:
+    """Задаёт политику повторов для типа моделей."""
+    _policies[model_type.lower()] = policy
+
+
+def is_retryable_status(status_code: int) -> bool:
+    """Стоит ли повторять запрос после такого HTTP-статуса."""
+    return status_code in RETRYABLE_STATUSES or status_code >= 500
@@ -0,0 +1,195 @@
+"""
+Настройки приложения в памяти поверх таблицы settings.
+
+Таблица читается целиком один раз; чтение — из словаря. Запись сразу меняет
+словарь и уведомляет подписчиков, а в БД попадает отложенно: изменения копятся
+и сбрасываются одной транзакцией — через FLUSH_DELAY секунд после первого
+несохранённого изменения, а также явным flush() (при закрытии окна и выходе).
+"""
+
+import atexit
+import logging
+import threading
+from typing import Callable, Optional
+
+import db
+
+log = logging.getLogger(__name__)
+
+# Через сколько секунд после изменения записывать настройки в БД
+FLUSH_DELAY = 2.0
+
+# key -> значение в виде строки, как в таблице settings
+_values: dict[str, str] = {}
+_dirty: dict[str, str] = {}
+_loaded = False
+_lock = threading.RLock()
+_flush_lock = threading.Lock()
+_flush_timer: Optional[threading.Timer] = None
+_subscribers: list[Callable[[set[str]], None]] = []
+
+
+def load(values: Optional[dict[str, str]] = None) -> None:
+    """
+    Загружает все настройки из БД одним запросом (или из готового словаря).
+    Несохранённые изменения не теряются.
+    """
+    global _loaded
+    if values is None:
+        values = db.get_all_settings()
+    with _lock:
+        _values.clear()
+        _values.update(values)
+        _values.update(_dirty)
+        _loaded = True
+
+
+def _ensure_loaded() -> None:
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                load()
+
+
+def _to_text(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+# --- чтение ---
+
+def get(key: str, default: Optional[str] = None) -> Optional[str]:
+    """Значение настройки строкой (как в БД) или default."""
+    _ensure_loaded()
+    value = _values.get(key)
+    return default if value is None else value
+
+
+def get_str(key: str, default: str = "") -> str:
+    """Строковая настройка; пустое значение считается отсутствующим."""
+    return get(key) or default
+
+
+def get_int(key: str, default: int = 0) -> int:
+    """Целочисленная настройка; default, если её нет или значение не число."""
+    value = get(key)
+    if not value:
+        return default
+    try:
+        return int(float(value))
+    except ValueError:
+        return default
+
+
+def get_float(key: str, default: float = 0.0) -> float:
+    """Дробная настройка; default, если её нет или значение не число."""
+    value = get(key)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def get_bool(key: str, default: bool = False) -> bool:
+    """Флаг, хранящийся как "1"/"0"."""
+    value = get(key)
+    if not value:
+        return default
+    return value == "1"
+
+
+# --- запись ---
+
+def set_value(key: str, value) -> None:
+    """Меняет настройку (str, int, float или bool) и уведомляет подписчиков."""
+    update({key: value})
+
+
+def update(values: dict) -> None:
+    """Меняет несколько настроек с одним уведомлением подписчиков (только если что-то изменилось)."""
+    _ensure_loaded()
+    changed = set()
+    with _lock:
+        for key, value in values.items():
+            text = _to_text(value)
+            if _values.get(key) != text:
+                _values[key] = text
+                _dirty[key] = text
+                changed.add(key)
+        if changed:
+            _schedule_flush()
+    if changed:
+        _notify(changed)
+
+
+def _schedule_flush() -> None:
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(FLUSH_DELAY, _flush_in_background)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def _flush_in_background() -> None:
+    try:
+        flush()
+    finally:
+        db.close_connection()
+
+
+def flush() -> int:
+    """Записывает несохранённые изменения в БД одной транзакцией. Возвращает число записанных ключей."""
+    global _flush_timer
+    with _flush_lock:
+        with _lock:
+            if _flush_timer is not None:
+                _flush_timer.cancel()
+                _flush_timer = None
+            pending = dict(_dirty)
+            _dirty.clear()
+        if not pending:
+            return 0
+        try:
+            db.set_settings(pending)
+        except Exception:
+            log.exception("Ошибка сохранения настроек")
+            with _lock:
+                # вернуть в очередь то, что не успели изменить заново
+                for key, value in pending.items():
+                    _dirty.setdefault(key, value)
+            return 0
+        return len(pending)
+
+
+def has_pending() -> bool:
+    """Есть ли изменения, ещё не записанные в БД."""
+    return bool(_dirty)
+
+
+atexit.register(flush)
+
+
+# --- подписка ---
+
+def subscribe(callback: Callable[[set[str]], None]) -> None:
+    """
+    Подписывает на изменения: callback(множество изменённых ключей).
+    Вызывается в потоке, изменившем настройки (для GUI — в GUI-потоке).
+    """
+    _subscribers.append(callback)
+
+
+def unsubscribe(callback: Callable[[set[str]], None]) -> None:
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+
+def _notify(keys: set[str]) -> None:
+    for callback in list(_subscribers):
+        try:
+            callback(keys)
+        except Exception:
+            log.exception("Ошибка обработчика изменения настроек")
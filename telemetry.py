@@ -0,0 +1,226 @@
+"""
+Телеметрия запросов к API: по строке на каждую HTTP-попытку в таблице requests.
+
+record() только ставит строку в очередь; в БД пишет фоновый поток пачками
+(одна транзакция на пачку), чтобы сетевые потоки не ждали диска.
+
+Вместе с каждой пачкой обновляются почасовые агрегаты (request_stats) и
+логарифмические гистограммы задержек (request_latency_hist): сводка для
+панели статистики читает только их и не зависит от размера таблицы requests.
+"""
+
+import atexit
+import logging
+import math
+import time
+from typing import Optional
+
+import db
+from batch_writer import BatchWriter
+
+log = logging.getLogger(__name__)
+
+# Как часто сбрасывать накопленные строки в БД, секунды
+FLUSH_INTERVAL = 1.0
+
+# Сколько строк записывать за одну транзакцию
+BATCH_SIZE = 500
+
+# Сколько дней хранить телеметрию
+RETENTION_DAYS = 90
+
+# Перцентили по умолчанию для сводки
+DEFAULT_PERCENTILES = (50.0, 95.0, 99.0)
+
+# Разрешение гистограмм задержек: корзин на удвоение (погрешность перцентиля ~9%)
+HIST_BUCKETS_PER_DOUBLING = 8
+
+# Метрики гистограмм: имя в request_latency_hist -> колонка requests
+HIST_METRICS = {"total": "total_ms", "ttft": "ttft_ms"}
+
+# Ошибка отменённой попытки (network.CANCELLED_ERROR). Отмена — решение пользователя
+# или проигравший маршрут хеджирования, а не отказ модели: в errors не считается
+CANCELLED_ERROR = "Запрос отменён"
+
+enabled = True
+
+
+
+def _write_batch(batch: list[dict]) -> None:
+    db.insert_request_metrics(batch, *aggregate(batch))
+
+
+_writer = BatchWriter(_write_batch, "telemetry-writer", BATCH_SIZE, FLUSH_INTERVAL, db.close_connection)
+
+
+def record(row: dict) -> None:
+    """Ставит строку телеметрии (ключи — db.REQUEST_METRIC_COLUMNS) в очередь на запись."""
+    if not enabled:
+        return
+    _writer.put(row)
+
+
+def flush(timeout: float = 5.0) -> bool:
+    """Ждёт, пока все поставленные в очередь строки окажутся в БД. False — не дождались."""
+    return _writer.flush(timeout)
+
+
+def shutdown(timeout: float = 5.0) -> None:
+    """Дописывает очередь и останавливает фоновый поток (вызывается при выходе)."""
+    _writer.shutdown(timeout)
+
+
+atexit.register(shutdown)
+
+
+def prune(retention_days: float = RETENTION_DAYS) -> int:
+    """Удаляет телеметрию старше retention_days дней. Возвращает количество удалённых строк."""
+    return db.delete_request_metrics(time.time() - retention_days * 86400.0)
+
+
+def latency_bucket(ms: float) -> int:
+    """Номер логарифмической корзины для задержки ms."""
+    return math.floor(math.log2(max(ms, 1.0)) * HIST_BUCKETS_PER_DOUBLING)
+
+
+def bucket_value(bucket: int) -> float:
+    """Верхняя граница корзины, мс (её и показываем как значение перцентиля)."""
+    return 2.0 ** ((bucket + 1) / HIST_BUCKETS_PER_DOUBLING)
+
+
+def aggregate(rows: list[dict]) -> tuple[list[tuple], list[tuple]]:
+    """
+    Приращения агрегатов для пачки строк телеметрии (см. db.add_request_aggregates).
+    Отменённые попытки считаются отдельно от ошибок. В гистограммы попадают только
+    успешные попытки; скорость генерации считается по попыткам с completion_tokens:
+    время от первого токена до конца ответа.
+    """
+    hourly: dict[tuple, list] = {}
+    histogram: dict[tuple, int] = {}
+    for row in rows:
+        model_name = row.get("model_name") or ""
+        hour = int((row.get("started_at") or 0) // 3600)
+        stats = hourly.setdefault((model_name, hour), [0, 0, 0, 0.0, 0, 0.0])
+        stats[0] += 1
+        error = row.get("error")
+        if error == CANCELLED_ERROR:
+            stats[2] += 1
+            continue
+        if error is not None:
+            stats[1] += 1
+            continue
+        total_ms = row.get("total_ms")
+        if total_ms is not None:
+            stats[3] += total_ms
+        completion_tokens = row.get("completion_tokens")
+        if completion_tokens and total_ms:
+            ttft_ms = row.get("ttft_ms")
+            generation_ms = total_ms - ttft_ms if ttft_ms is not None else total_ms
+            if generation_ms > 0:
+                stats[4] += completion_tokens
+                stats[5] += generation_ms
+        for metric, column in HIST_METRICS.items():
+            value = row.get(column)
+            if value is not None:
+                key = (model_name, hour, metric, latency_bucket(value))
+                histogram[key] = histogram.get(key, 0) + 1
+    return (
+        [key + tuple(stats) for key, stats in hourly.items()],
+        [key + (count,) for key, count in histogram.items()],
+    )
+
+
+def rebuild_aggregates() -> None:
+    """Пересчитывает почасовые агрегаты по всей таблице requests."""
+    db.clear_request_aggregates()
+    for rows in db.iter_request_metrics():
+        db.add_request_aggregates(*aggregate(rows))
+
+
+def ensure_aggregates() -> None:
+    """Строит агрегаты, если телеметрия есть, а агрегатов нет (БД из прошлой версии)."""
+    if db.request_aggregates_missing():
+        log.info("Пересчёт агрегатов телеметрии")
+        rebuild_aggregates()
+
+
+def percentile(sorted_values: list[float], p: float) -> Optional[float]:
+    """Перцентиль p (0..100) по отсортированному списку (ближайший ранг) или None."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def model_percentiles(
+    metric: str = "total_ms",
+    since: Optional[float] = None,
+    percentiles: tuple = DEFAULT_PERCENTILES
+) -> dict[str, dict]:
+    """
+    Перцентили метрики (db.REQUEST_TIMING_COLUMNS, мс) по моделям за период с since (Unix-время):
+    {model_name: {"count": n, "p50": ..., "p95": ..., "p99": ...}}. Учитываются успешные попытки.
+    """
+    grouped: dict[str, list[float]] = {}
+    for model_name, value in db.get_request_metric_values(metric, since):
+        grouped.setdefault(model_name, []).append(value)
+    summary = {}
+    for model_name, values in grouped.items():
+        stats = {"count": len(values)}
+        for p in percentiles:
+            stats[f"p{p:g}"] = percentile(values, p)
+        summary[model_name] = stats
+    return summary
+
+
+def histogram_percentile(buckets: list[tuple[int, int]], p: float) -> Optional[float]:
+    """Перцентиль p (0..100) по гистограмме [(bucket, count), ...] с возрастающими bucket или None."""
+    total = sum(count for _, count in buckets)
+    if total <= 0:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * total))
+    seen = 0
+    for bucket, count in buckets:
+        seen += count
+        if seen >= rank:
+            return bucket_value(bucket)
+    return bucket_value(buckets[-1][0])
+
+
+def dashboard_stats(since: Optional[float] = None) -> list[dict]:
+    """
+    Сводка по моделям за период с since (Unix-время, None — за всё время) по агрегатам:
+    [{model_name, calls, errors, cancelled, error_rate, p50, p95, p99, ttft_p50, ttft_p95,
+    tokens_per_sec}, ...]. calls — попытки (с повторами и отменёнными); error_rate — доля
+    ошибок среди завершившихся (не отменённых) попыток.
+    Точность — час по времени и ~9% по значениям перцентилей.
+    """
+    since_hour = int(since // 3600) if since is not None else 0
+    histograms: dict[str, dict[str, list]] = {}
+    for metric in HIST_METRICS:
+        for model_name, bucket, count in db.get_latency_histogram(metric, since_hour):
+            histograms.setdefault(metric, {}).setdefault(model_name, []).append((bucket, count))
+    summary = []
+    for stats in db.get_request_stats(since_hour):
+        model_name = stats["model_name"]
+        total = histograms.get("total", {}).get(model_name, [])
+        ttft = histograms.get("ttft", {}).get(model_name, [])
+        calls = stats["calls"] or 0
+        errors = stats["errors"] or 0
+        cancelled = stats["cancelled"] or 0
+        completed = calls - cancelled
+        generation_ms = stats["generation_ms_sum"] or 0
+        summary.append({
+            "model_name": model_name,
+            "calls": calls,
+            "errors": errors,
+            "cancelled": cancelled,
+            "error_rate": errors / completed if completed > 0 else None,
+            "p50": histogram_percentile(total, 50),
+            "p95": histogram_percentile(total, 95),
+            "p99": histogram_percentile(total, 99),
+            "ttft_p50": histogram_percentile(ttft, 50),
+            "ttft_p95": histogram_percentile(ttft, 95),
+            "tokens_per_sec": (stats["completion_tokens"] or 0) * 1000.0 / generation_ms if generation_ms else None,
+        })
+    return summary
@@ -1,38 +1,223 @@
 """Временная таблица результатов в памяти. Не сохраняется в SQLite."""
 
-from typing import Optional
+from typing import Callable, Iterator, Optional
 
 import db
 
 
-# Список строк: каждая — dict с model_name, response, selected, model_id
-_temp_results: list[dict] = []
+# Статусы строки: ожидает отправки, запрос выполняется, ответ получен, ошибка, отменён
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+STATUS_CANCELLED = "cancelled"
 
-# ID текущего промта (для сохранения в results)
-_current_prompt_id: Optional[int] = None
+# Статусы, при которых ответ окончательный (строку можно отметить и сохранить)
+FINISHED_STATUSES = frozenset({STATUS_DONE, STATUS_ERROR, STATUS_CANCELLED})
+
+# События для подписчиков: таблица пересоздана / строка изменилась / дописан текст ответа
+EVENT_RESET = "reset"
+EVENT_ROW = "row"
+EVENT_TEXT = "text"
+
+
+class ResultRecord:
+    """
+    Строка временной таблицы — ответ одной модели.
+    Текст ответа в потоковом режиме дописывается фрагментами (append_response),
+    склеиваются они только при чтении response.
+    """
+
+    __slots__ = (
+        "model_id", "model_name", "selected", "status", "attempts", "winner", "cached", "_response", "_chunks"
+    )
+
+    def __init__(
+        self,
+        model_id: Optional[int],
+        model_name: str,
+        response: str = "",
+        selected: bool = False,
+        status: str = STATUS_DONE,
+        attempts: int = 1,
+        winner: str = "",
+        cached: bool = False
+    ):
+        self.model_id = model_id
+        self.model_name = model_name
+        self.selected = selected
+        self.status = status
+        self.attempts = attempts
+        self.winner = winner or model_name
+        # Ответ взят из response_cache, а не получен от модели
+        self.cached = cached
+        self._response = response
+        self._chunks: list[str] = []
+
+    @property
+    def response(self) -> str:
+        if self._chunks:
+            self._response += "".join(self._chunks)
+            self._chunks.clear()
+        return self._response
+
+    @response.setter
+    def response(self, value: str) -> None:
+        self._response = value
+        self._chunks.clear()
+
+    def append_response(self, text: str) -> None:
+        self._chunks.append(text)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def __repr__(self) -> str:
+        return f"ResultRecord(model_name={self.model_name!r}, status={self.status!r}, selected={self.selected})"
+
+
+class ResultSet:
+    """
+    Набор строк временной таблицы с индексом по id модели.
+    Изменения строк — O(1); подписчики получают (событие, индекс строки),
+    для EVENT_RESET индекс равен -1.
+    """
+
+    def __init__(self):
+        self._rows: list[ResultRecord] = []
+        self._by_model: dict[int, int] = {}
+        self._subscribers: list[Callable[[str, int], None]] = []
+        self.prompt_id: Optional[int] = None
+
+    # --- подписка ---
+
+    def subscribe(self, callback: Callable[[str, int], None]) -> None:
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, int], None]) -> None:
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _notify(self, event: str, index: int = -1) -> None:
+        for callback in list(self._subscribers):
+            callback(event, index)
+
+    # --- чтение ---
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[ResultRecord]:
+        return iter(self._rows)
+
+    def get(self, index: int) -> Optional[ResultRecord]:
+        if 0 <= index < len(self._rows):
+            return self._rows[index]
+        return None
+
+    def index_of_model(self, model_id: int) -> Optional[int]:
+        """Индекс строки модели (первой, если модель встречается несколько раз)."""
+        return self._by_model.get(model_id)
+
+    def get_by_model(self, model_id: int) -> Optional[ResultRecord]:
+        index = self._by_model.get(model_id)
+        return self._rows[index] if index is not None else None
+
+    # --- изменение ---
+
+    def clear(self) -> None:
+        self._rows = []
+        self._by_model = {}
+        self.prompt_id = None
+        self._notify(EVENT_RESET)
+
+    def add(self, record: ResultRecord, notify: bool = True) -> int:
+        index = len(self._rows)
+        self._rows.append(record)
+        if record.model_id is not None:
+            self._by_model.setdefault(record.model_id, index)
+        if notify:
+            self._notify(EVENT_RESET)
+        return index
+
+    def extend(self, records: list[ResultRecord]) -> None:
+        """Добавляет несколько строк с одним уведомлением."""
+        for record in records:
+            self.add(record, notify=False)
+        self._notify(EVENT_RESET)
+
+    def replace(self, index: int, record: ResultRecord) -> None:
+        if 0 <= index < len(self._rows):
+            self._rows[index] = record
+            if record.model_id is not None:
+                self._by_model.setdefault(record.model_id, index)
+            self._notify(EVENT_ROW, index)
+
+    def update(self, index: int, **fields) -> None:
+        """Меняет поля строки (status, selected, response, ...)."""
+        record = self.get(index)
+        if record is None:
+            return
+        for name, value in fields.items():
+            setattr(record, name, value)
+        self._notify(EVENT_ROW, index)
+
+    def append_response(self, index: int, text: str) -> None:
+        """Дописывает фрагмент потокового ответа."""
+        record = self.get(index)
+        if record is not None:
+            record.append_response(text)
+            self._notify(EVENT_TEXT, index)
+
+
+# Текущая временная таблица (одна на приложение, используется из GUI-потока)
+_results = ResultSet()
+
+
+def get_result_set() -> ResultSet:
+    """Возвращает текущую временную таблицу (для подписки и чтения без копирования)."""
+    return _results
 
 
 def clear() -> None:
     """Очищает временную таблицу (при новом запросе)."""
-    global _temp_results, _current_prompt_id
-    _temp_results = []
-    _current_prompt_id = None
+    _results.clear()
 
 
 def set_prompt_id(prompt_id: int) -> None:
     """Устанавливает id промта для последующего сохранения."""
-    global _current_prompt_id
-    _current_prompt_id = prompt_id
+    _results.prompt_id = prompt_id
 
 
-def add_result(model_id: int, model_name: str, response: str, selected: bool = False) -> None:
+def add_result(
+    model_id: int,
+    model_name: str,
+    response: str,
+    selected: bool = False,
+    status: str = STATUS_DONE
+) -> None:
     """Добавляет строку в временную таблицу."""
-    _temp_results.append({
-        "model_id": model_id,
-        "model_name": model_name,
-        "response": response,
-        "selected": selected,
-    })
+    _results.add(ResultRecord(model_id, model_name, response, selected, status))
+
+
+def _record_from_network_result(item: dict) -> ResultRecord:
+    model = item["model"]
+    if item["error"] is None:
+        response, status = item["response"], STATUS_DONE
+    elif item.get("cancelled"):
+        response, status = item["response"], STATUS_CANCELLED
+    else:
+        response, status = f"Ошибка: {item['error']}", STATUS_ERROR
+    return ResultRecord(
+        model["id"],
+        model["name"],
+        response,
+        status=status,
+        attempts=item.get("attempts", 1),
+        winner=item.get("winner", model["name"]),
+        cached=item.get("cached", False),
+    )
 
 
 def fill_from_network_results(network_results: list[dict]) -> None:
@@ -40,59 +225,100 @@ def fill_from_network_results(network_results: list[dict]) -> None:
     Заполняет временную таблицу из результатов network.send_prompt_to_models.
     network_results: [{"model": dict, "response": str, "error": str|None}, ...]
     """
-    for item in network_results:
-        model = item["model"]
-        response = item["response"] if item["error"] is None else f"Ошибка: {item['error']}"
-        add_result(
-            model_id=model["id"],
-            model_name=model["name"],
-            response=response,
-            selected=False,
-        )
+    _results.extend([_record_from_network_result(item) for item in network_results])
+
+
+def init_pending(models: list[dict]) -> None:
+    """Создаёт по строке со статусом pending на каждую модель (до отправки)."""
+    _results.extend([ResultRecord(m["id"], m["name"], status=STATUS_PENDING) for m in models])
+
+
+def set_status(index: int, status: str) -> None:
+    """Меняет статус строки по индексу."""
+    _results.update(index, status=status)
+
+
+def append_response(index: int, text: str) -> None:
+    """Дописывает фрагмент потокового ответа в строку index."""
+    _results.append_response(index, text)
+
+
+def set_network_result(index: int, item: dict) -> None:
+    """
+    Заменяет строку index результатом одной модели
+    (item — элемент списка network.send_prompt_to_models).
+    Флаг selected сохраняется.
+    """
+    current = _results.get(index)
+    if current is not None:
+        record = _record_from_network_result(item)
+        record.selected = current.selected
+        _results.replace(index, record)
+
+
+def set_cancelled(index: int, partial_response: Optional[str] = None) -> None:
+    """
+    Помечает строку отменённой. Уже полученная часть ответа остаётся
+    (или заменяется на partial_response, если он передан).
+    """
+    if partial_response is None:
+        _results.update(index, status=STATUS_CANCELLED)
+    else:
+        _results.update(index, status=STATUS_CANCELLED, response=partial_response)
+
+
+def get_row(index: int) -> Optional[ResultRecord]:
+    """Возвращает строку по индексу (или None)."""
+    return _results.get(index)
+
 
+def get_all() -> list[ResultRecord]:
+    """Возвращает копию списка строк временной таблицы."""
+    return list(_results)
 
-def get_all() -> list[dict]:
-    """Возвращает все строки временной таблицы."""
-    return list(_temp_results)
+
+def row_count() -> int:
+    """Количество строк во временной таблице."""
+    return len(_results)
 
 
 def set_selected(index: int, selected: bool) -> None:
     """Устанавливает флаг selected для строки по индексу."""
-    if 0 <= index < len(_temp_results):
-        _temp_results[index]["selected"] = selected
+    _results.update(index, selected=selected)
 
 
-def get_selected() -> list[dict]:
+def get_selected() -> list[ResultRecord]:
     """Возвращает только строки с selected=True."""
-    return [r for r in _temp_results if r["selected"]]
+    return [r for r in _results if r.selected]
+
+
+def get_rows_to_save() -> tuple[Optional[int], list[tuple]]:
+    """
+    Снимок выбранных готовых строк для сохранения: (prompt_id, [(model_id, model_name, response), ...]).
+    Снимок не зависит от дальнейших изменений таблицы — его можно сохранять из другого потока.
+    """
+    rows = [
+        (row.model_id, row.model_name, row.response)
+        for row in _results
+        if row.selected and row.is_finished
+    ]
+    return _results.prompt_id, rows
 
 
 def save_selected_to_db() -> int:
     """
-    Сохраняет выбранные строки (selected=True) в таблицу results.
+    Сохраняет выбранные строки (selected=True) в таблицу results одной транзакцией.
     Возвращает количество сохранённых записей.
     Очищает временную таблицу после сохранения.
     """
-    global _temp_results, _current_prompt_id
-
-    if _current_prompt_id is None:
+    prompt_id, rows = get_rows_to_save()
+    if prompt_id is None:
         return 0
-
-    count = 0
-    for row in _temp_results:
-        if row["selected"]:
-            db.create_result(
-                prompt_id=_current_prompt_id,
-                model_id=row["model_id"],
-                model_name=row["model_name"],
-                response=row["response"],
-            )
-            count += 1
-
+    count = db.create_results(prompt_id, rows)
     clear()
     return count
 
 
 def has_data() -> bool:
     """Проверяет, есть ли данные во временной таблице."""
-    return len(_temp_results) > 0
+    return len(_results) > 0